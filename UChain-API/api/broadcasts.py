@@ -0,0 +1,80 @@
+"""
+Broadcast notifications, fanned out on read.
+
+A notification meant for a whole audience (e.g. every buyer for a new
+product) is one BroadcastNotification row instead of one Notification per
+user, so sending it costs one INSERT however many users there are. When a
+user reads their notifications, the broadcasts of their audiences issued
+since they registered are merged in. Read state is a per-user watermark:
+every broadcast with an id up to BroadcastWatermark.last_read_id is read.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .models import BroadcastNotification, BroadcastWatermark
+from .pubsub import broadcast_channel, publish_on_commit
+
+# Prefix telling broadcast ids apart from Notification ids in the API
+ID_PREFIX = 'b'
+
+
+def audiences_for(user):
+    audiences = [BroadcastNotification.EVERYONE]
+    if user.is_buyer:
+        audiences.append(BroadcastNotification.BUYERS)
+    if user.is_seller:
+        audiences.append(BroadcastNotification.SELLERS)
+    if user.is_driver:
+        audiences.append(BroadcastNotification.DRIVERS)
+    return audiences
+
+
+def broadcast(audience, notification_type, message, sender_name=None, related_product=None):
+    notification = BroadcastNotification.objects.create(
+        audience=audience,
+        notification_type=notification_type,
+        message=message,
+        sender_name=sender_name,
+        related_product=related_product,
+    )
+    # Wakes the waiting notification feeds of the audience, see api/notification_feed.py
+    publish_on_commit(broadcast_channel(audience), {'id': f"{ID_PREFIX}{notification.id}"})
+    return notification
+
+
+def visible_broadcasts(user):
+    return BroadcastNotification.objects.filter(
+        audience__in=audiences_for(user), created_at__gte=user.registration_date
+    )
+
+
+def read_watermark(user):
+    return BroadcastWatermark.objects.filter(user=user).values_list('last_read_id', flat=True).first() or 0
+
+
+def unread_broadcast_count(user, watermark=None):
+    if watermark is None:
+        watermark = read_watermark(user)
+    return visible_broadcasts(user).filter(id__gt=watermark).count()
+
+
+def mark_broadcasts_read(user, up_to=None):
+    """Move the user's watermark forward to up_to, or to the latest broadcast. It never moves back."""
+    if up_to is None:
+        up_to = BroadcastNotification.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    if BroadcastWatermark.objects.filter(user=user).update(last_read_id=Greatest(F('last_read_id'), up_to)):
+        return
+    try:
+        with transaction.atomic():
+            BroadcastWatermark.objects.create(user=user, last_read_id=up_to)
+    except IntegrityError:
+        # Created concurrently
+        BroadcastWatermark.objects.filter(user=user).update(last_read_id=Greatest(F('last_read_id'), up_to))
+
+
+def parse_broadcast_id(pk):
+    """The BroadcastNotification id of an API id like "b12", None for Notification ids"""
+    pk = str(pk)
+    if pk.startswith(ID_PREFIX) and pk[len(ID_PREFIX):].isdigit():
+        return int(pk[len(ID_PREFIX):])
+    return None
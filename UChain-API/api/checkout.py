@@ -0,0 +1,71 @@
+"""
+Cart checkout: one order per line item, created in a single transaction.
+
+The cost of a checkout does not depend on the size of the cart: products
+are loaded with one in_bulk, the orders are written with one INSERT and
+read back with one SELECT on any backend, and their product and SellerOrder
+rows, the stock reservations and the order events are each written with one
+bulk INSERT.
+
+Two things differ from a plain bulk_create of orders and notifications:
+
+- Reading the orders back needs Order.checkout_token, a column added for
+  checkout alone. Without it MySQL, which reports no ids for a multi-row
+  INSERT, could only tell this checkout's rows apart from a concurrent
+  order of the same buyer by inserting them one by one.
+- Sellers are not notified from the request. Like every status change,
+  the checkout writes one OrderEvent per order and the process_order_events
+  worker sends each order's notification from it (api/outbox.py), so the
+  notifications are per order and arrive once the worker has run.
+"""
+import uuid
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from .models import Order, OrderEvent, Product, SellerOrder
+from .inventory import reserve_lines
+
+
+def _create_orders(orders):
+    """
+    Insert the orders with one INSERT and return them with their ids, in
+    the same order. The rows are read back by their checkout token, see the
+    module docstring; ids follow the VALUES order.
+    """
+    token = uuid.uuid4()
+    for order in orders:
+        order.checkout_token = token
+    Order.objects.bulk_create(orders)
+    return list(Order.objects.filter(checkout_token=token).order_by('id'))
+
+
+def checkout(buyer, items, driver=None):
+    """
+    Place an order for each item ({'product': id, 'quantity': text,
+    'quantity_value': amount}) and return the orders. Unknown products raise
+    ValidationError and short stock InsufficientStock; either way nothing is
+    written.
+    """
+    product_ids = {item['product'] for item in items}
+    products = Product.objects.in_bulk(product_ids)
+    missing = sorted(product_ids - set(products))
+    if missing:
+        raise ValidationError({'items': f"Unknown products: {', '.join(str(pk) for pk in missing)}"})
+
+    with transaction.atomic():
+        orders = _create_orders([
+            Order(buyer=buyer, driver=driver, quantity=item['quantity'],
+                  quantity_value=item['quantity_value'], status=Order.PENDING)
+            for item in items
+        ])
+        lines = [(order, products[item['product']]) for order, item in zip(orders, items)]
+
+        Through = Order.product.through
+        Through.objects.bulk_create([Through(order_id=order.id, product_id=product.id) for order, product in lines])
+        # The through rows are written without m2m_changed, index the sellers here
+        SellerOrder.objects.bulk_create(
+            [SellerOrder(seller_id=product.seller_id, order_id=order.id) for order, product in lines],
+            ignore_conflicts=True
+        )
+        reserve_lines(lines)
+        OrderEvent.objects.bulk_create([OrderEvent(order=order, status=Order.PENDING) for order in orders])
+    return orders
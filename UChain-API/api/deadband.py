@@ -0,0 +1,75 @@
+"""
+Dead-band filtering for tracking ingest.
+
+A ping without a status is redundant when it lies within
+TRACKING_DEADBAND_METERS of the order's previous stored point, however soon
+after it the ping arrives: a ping that moved further is always stored.
+Redundant pings are coalesced: they only move the previous point's
+last_seen forward instead of inserting a new TrackingLocation row. Pings
+carrying a status are always stored.
+
+Stored and suppressed writes are counted in the cache, so the counters are
+shared between workers when a shared cache backend is configured.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from .geo import haversine_m
+from .models import TrackingLocation
+from .tracking_cache import touch_location
+
+STORED_KEY = "tracking:deadband:stored"
+SUPPRESSED_KEY = "tracking:deadband:suppressed"
+
+
+def anchor_timestamp(previous):
+    """Timestamp of a serialized (or freshly parsed) previous point"""
+    timestamp = previous.get('timestamp')
+    return parse_datetime(timestamp) if isinstance(timestamp, str) else timestamp
+
+
+def is_redundant(previous, latitude, longitude, timestamp):
+    """Return True if a status-less ping adds nothing to the previous serialized point"""
+    if previous is None:
+        return False
+
+    previous_timestamp = anchor_timestamp(previous)
+    # Late pings older than the previous point are kept as history
+    if previous_timestamp is None or timestamp < previous_timestamp:
+        return False
+
+    distance = haversine_m(
+        float(previous['latitude']), float(previous['longitude']), float(latitude), float(longitude)
+    )
+    return distance < getattr(settings, 'TRACKING_DEADBAND_METERS', 10)
+
+
+def coalesce(order_id, previous, timestamp):
+    """
+    Record a redundant ping by extending the previous point's last_seen.
+    Rows are matched on (order, timestamp) since bulk inserted rows may not
+    know their id. Returns the updated serialized previous point.
+    """
+    TrackingLocation.objects.filter(
+        order_id=order_id, timestamp=anchor_timestamp(previous)
+    ).update(last_seen=timestamp)
+    return touch_location(order_id, previous, timestamp)
+
+
+def count_ingest(stored=0, suppressed=0):
+    for key, amount in ((STORED_KEY, stored), (SUPPRESSED_KEY, suppressed)):
+        if amount:
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                # The key was evicted between add and incr
+                cache.set(key, amount, None)
+
+
+def ingest_counters():
+    counters = cache.get_many([STORED_KEY, SUPPRESSED_KEY])
+    return {
+        "stored": counters.get(STORED_KEY, 0),
+        "suppressed": counters.get(SUPPRESSED_KEY, 0),
+    }
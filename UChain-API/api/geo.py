@@ -0,0 +1,81 @@
+"""
+Vectorized geometry helpers for tracking and route data.
+
+Coordinates are projected onto a local equirectangular plane in meters,
+which is accurate enough for delivery-scale distances and lets whole
+polylines be processed with NumPy array operations.
+"""
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters, element-wise over scalars or arrays"""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def project_to_meters(latitudes, longitudes, origin_latitude=None):
+    """Project coordinates onto a local plane, returning x and y arrays in meters"""
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if origin_latitude is None:
+        origin_latitude = float(latitudes.mean()) if latitudes.size else 0.0
+
+    x = EARTH_RADIUS_M * np.radians(longitudes) * np.cos(np.radians(origin_latitude))
+    y = EARTH_RADIUS_M * np.radians(latitudes)
+    return x, y
+
+
+def point_segment_distances(px, py, ax, ay, bx, by):
+    """
+    Distance from point(s) P to segment(s) AB in the projected plane.
+    Arguments broadcast, so one point can be tested against every segment of
+    a polyline (or many points against one segment) in a single call.
+    Returns the distances and the clamped position t in [0, 1] along AB.
+    """
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+    # Degenerate segments collapse onto their start point
+    t = np.clip(np.nan_to_num(t, nan=0.0, posinf=0.0, neginf=0.0), 0.0, 1.0)
+    distances = np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+    return distances, t
+
+
+def simplify_polyline(latitudes, longitudes, tolerance_m):
+    """
+    Douglas-Peucker simplification. Returns a boolean mask of the points to
+    keep; the first and last points are always kept. Each split step measures
+    every point of the current span against its chord in one array operation.
+    """
+    count = len(latitudes)
+    keep = np.zeros(count, dtype=bool)
+    if count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if count < 3:
+        return keep
+
+    x, y = project_to_meters(latitudes, longitudes)
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        distances, _ = point_segment_distances(
+            x[start + 1:end], y[start + 1:end], x[start], y[start], x[end], y[end]
+        )
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return keep
@@ -0,0 +1,86 @@
+"""
+Arrival geofences around DeliveryRoute end points.
+
+A geofence is the route's end point, a radius of GEOFENCE_RADIUS_METERS and
+the latitude/longitude bounding box of that circle. The box is computed once
+per route and cached per order, so checking a ping is two range comparisons
+for the common "still far away" case and a single haversine only when the
+ping falls inside the box.
+"""
+import math
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from .geo import EARTH_RADIUS_M, haversine_m
+from .models import DeliveryRoute
+
+Geofence = namedtuple('Geofence', [
+    'latitude', 'longitude', 'radius_m', 'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude',
+])
+
+# Cached for orders without a route, so they are not looked up on every ping
+NO_GEOFENCE = ()
+
+
+def geofence_key(order_id):
+    return f"geofence:{order_id}"
+
+
+def _timeout():
+    return getattr(settings, 'TRACKING_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def build_geofence(route, radius_m=None):
+    """Return the Geofence around a route's end point"""
+    if radius_m is None:
+        radius_m = getattr(settings, 'GEOFENCE_RADIUS_METERS', 100)
+
+    latitude, longitude = float(route.end_latitude), float(route.end_longitude)
+    latitude_delta = math.degrees(radius_m / EARTH_RADIUS_M)
+    # Meridians converge towards the poles, widen the box accordingly
+    longitude_delta = latitude_delta / max(math.cos(math.radians(latitude)), 1e-6)
+    return Geofence(
+        latitude, longitude, radius_m,
+        latitude - latitude_delta, latitude + latitude_delta,
+        longitude - longitude_delta, longitude + longitude_delta,
+    )
+
+
+def remember_geofence(route):
+    """Precompute and cache the geofence of a newly saved route"""
+    cache.set(geofence_key(route.order_id), tuple(build_geofence(route)), _timeout())
+
+
+def get_geofences(order_ids):
+    """
+    Return {order_id: Geofence} for the given orders that have a route. Cache
+    misses are filled with a single query for all of them.
+    """
+    keys = {geofence_key(order_id): order_id for order_id in order_ids}
+    cached = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+
+    missing = [order_id for order_id in keys.values() if order_id not in cached]
+    if missing:
+        # The latest route of each order wins, as in GetRouteView
+        for route in DeliveryRoute.objects.filter(order_id__in=missing).order_by('created_at'):
+            cached[route.order_id] = tuple(build_geofence(route))
+        cache.set_many(
+            {geofence_key(order_id): cached.get(order_id, NO_GEOFENCE) for order_id in missing},
+            _timeout()
+        )
+
+    return {order_id: Geofence(*value) for order_id, value in cached.items() if value}
+
+
+def get_geofence(order_id):
+    return get_geofences([order_id]).get(order_id)
+
+
+def contains(geofence, latitude, longitude):
+    """True if the position lies within the geofence radius"""
+    latitude, longitude = float(latitude), float(longitude)
+    # Cheap rejection before the exact distance
+    if not (geofence.min_latitude <= latitude <= geofence.max_latitude
+            and geofence.min_longitude <= longitude <= geofence.max_longitude):
+        return False
+    return haversine_m(geofence.latitude, geofence.longitude, latitude, longitude) <= geofence.radius_m
@@ -0,0 +1,247 @@
+"""
+Numeric product stock, order quantities and stock reservations.
+
+Product.quantity and Order.quantity stay free text for display (older
+orders may still end in a "[TX:...]" payment reference). The numeric
+quantity_value / quantity_unit columns are parsed from them with the rules
+the order views always used, and stock changes are applied to the numeric
+columns in SQL.
+
+Stock is reserved when an order is created, released when it is cancelled
+or deleted and committed (taken off quantity_value) on delivery. Each step
+flips the order's StockReservation rows with one conditional UPDATE and
+adjusts the Product.quantity_reserved counter with another, so a product
+row is only locked for the duration of a single statement and availability
+is read without summing the ledger.
+"""
+import re
+from django.db import transaction
+from django.db.models import CharField, F, PositiveIntegerField, Value, Case, When
+from django.db.models.functions import Cast, Concat
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import Product, StockReservation
+
+# Product quantities: "50 kg", "120bags", "30"
+PRODUCT_QUANTITY_PATTERN = re.compile(r'(\d+)\s*([a-zA-Z]*)')
+# Order quantities: the first number, e.g. "5" or "1 [TX:tx-123]"
+ORDER_QUANTITY_PATTERN = re.compile(r'(\d+)')
+
+
+def parse_product_quantity(text):
+    """Return (value, unit) of a product quantity, value None if it has no number"""
+    match = PRODUCT_QUANTITY_PATTERN.search(text or '')
+    if not match:
+        return None, ''
+    return int(match.group(1)), match.group(2)[:20]
+
+
+def parse_order_quantity(text):
+    """Return the ordered amount, None if the quantity has no number"""
+    match = ORDER_QUANTITY_PATTERN.search(text or '')
+    return int(match.group(1)) if match else None
+
+
+def format_quantity(value, unit):
+    return f"{value} {unit}" if unit else str(value)
+
+
+class InsufficientStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Not enough stock available for this order."
+    default_code = 'insufficient_stock'
+
+
+def available_quantity(product):
+    """Stock not held by open orders, None for products without a numeric stock"""
+    if product.quantity_value is None:
+        return None
+    return max(product.quantity_value - product.quantity_reserved, 0)
+
+
+def _minus(field, amount):
+    """
+    field - amount, never below zero. The columns are unsigned on MySQL,
+    where a negative intermediate result fails before Greatest could clamp it.
+    """
+    return Case(
+        When(**{f'{field}__gte': amount}, then=F(field) - amount),
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def _quantity_text(value):
+    """The quantity text matching a numeric stock expression"""
+    text = Cast(value, output_field=CharField())
+    return Case(
+        When(quantity_unit='', then=text),
+        default=Concat(text, Value(' '), F('quantity_unit')),
+        output_field=CharField(),
+    )
+
+
+def _hold(amounts, reservations):
+    """
+    Add amounts ({product id: amount}) to the products' reserved stock in one
+    UPDATE guarded by their available stock, then write the ledger rows. If
+    any product falls short nothing is held and InsufficientStock is raised.
+    """
+    needed = Case(
+        *[When(id=product_id, then=Value(amount)) for product_id, amount in amounts.items()],
+        output_field=PositiveIntegerField(),
+    )
+    with transaction.atomic():
+        reserved = Product.objects.filter(
+            id__in=list(amounts), quantity_value__gte=F('quantity_reserved') + needed
+        ).update(quantity_reserved=F('quantity_reserved') + needed)
+        if reserved != len(amounts):
+            # Raising rolls back the products that did have enough
+            raise InsufficientStock()
+        StockReservation.objects.bulk_create(reservations)
+    return reserved
+
+
+def reserve_stock(order, product_ids=None):
+    """
+    Hold the order's amount of each of its products. All products are
+    reserved in one UPDATE guarded by the available stock; if any of them
+    falls short nothing is held and InsufficientStock is raised. Products
+    without a numeric stock are not tracked. Returns the number of products
+    reserved.
+    """
+    amount = order.quantity_value
+    if not amount:
+        return 0
+
+    if product_ids is None:
+        product_ids = list(order.product.values_list('id', flat=True))
+    tracked = list(
+        Product.objects.filter(id__in=product_ids, quantity_value__isnull=False)
+        .order_by('id').values_list('id', flat=True)
+    )
+    if not tracked:
+        return 0
+
+    return _hold(
+        {product_id: amount for product_id in tracked},
+        [StockReservation(order=order, product_id=product_id, quantity=amount) for product_id in tracked],
+    )
+
+
+def reserve_lines(lines):
+    """
+    Hold stock for many orders at once, e.g. a cart checkout. lines are
+    (order, product) pairs with saved orders and loaded products; amounts
+    on the same product add up. Same all-or-nothing guarantee as
+    reserve_stock, in two queries however many lines there are.
+    """
+    amounts = {}
+    reservations = []
+    for order, product in lines:
+        if not order.quantity_value or product.quantity_value is None:
+            continue
+        amounts[product.id] = amounts.get(product.id, 0) + order.quantity_value
+        reservations.append(StockReservation(order=order, product=product, quantity=order.quantity_value))
+    if not amounts:
+        return 0
+    return _hold(dict(sorted(amounts.items())), reservations)
+
+
+def resize_reservation(order, amount):
+    """
+    Move the stock held by an open order to its new amount, e.g. after its
+    quantity was edited. A larger amount is guarded by the available stock
+    like reserve_stock and raises InsufficientStock when a product falls
+    short. Orders holding nothing are left alone. Returns True if the
+    reservation changed.
+    """
+    amount = amount or 0
+    with transaction.atomic():
+        # Locked, so a concurrent release or commit settles the new amount
+        held = list(
+            StockReservation.objects.select_for_update()
+            .filter(order=order, state=StockReservation.HELD)
+            .values_list('product_id', 'quantity')
+        )
+        if not held or held[0][1] == amount:
+            return False
+        product_ids = [product_id for product_id, _ in held]
+        delta = amount - held[0][1]
+        if delta > 0:
+            moved = Product.objects.filter(
+                id__in=product_ids, quantity_value__gte=F('quantity_reserved') + delta
+            ).update(quantity_reserved=F('quantity_reserved') + delta)
+            if moved != len(product_ids):
+                raise InsufficientStock()
+        else:
+            Product.objects.filter(id__in=product_ids).update(quantity_reserved=_minus('quantity_reserved', -delta))
+        StockReservation.objects.filter(order=order, state=StockReservation.HELD).update(quantity=amount)
+    return True
+
+
+def _settle(order, state):
+    """Flip the order's held reservations to state, returning the held amount or 0"""
+    held = StockReservation.objects.filter(order=order, state=StockReservation.HELD)
+    amount = held.values_list('quantity', flat=True).first()
+    if not amount or not held.update(state=state):
+        return 0
+    return amount
+
+
+def release_stock(order):
+    """Give the stock held by a cancelled or deleted order back. Returns True if any was held."""
+    with transaction.atomic():
+        amount = _settle(order, StockReservation.RELEASED)
+        if amount:
+            Product.objects.filter(reservations__order=order).update(
+                quantity_reserved=_minus('quantity_reserved', amount)
+            )
+    return bool(amount)
+
+
+def commit_stock(order):
+    """
+    Take a delivered order's amount off the stock of its products: through
+    its reservations when it has them, directly for orders placed before
+    the ledger existed. Safe to repeat for the same order. Returns the
+    number of products updated.
+    """
+    with transaction.atomic():
+        amount = _settle(order, StockReservation.COMMITTED)
+        if amount:
+            remaining = _minus('quantity_value', amount)
+            return Product.objects.filter(reservations__order=order, quantity_value__isnull=False).update(
+                quantity_value=remaining,
+                quantity_reserved=_minus('quantity_reserved', amount),
+                quantity=_quantity_text(remaining),
+            )
+        if StockReservation.objects.filter(order=order).exists():
+            # Already committed or released
+            return 0
+        updated = decrement_stock(order)
+        if updated:
+            # Committed rows make a repeated commit of this order a no-op
+            StockReservation.objects.bulk_create([
+                StockReservation(order=order, product_id=product_id, quantity=order.quantity_value,
+                                 state=StockReservation.COMMITTED)
+                for product_id in order.product.filter(quantity_value__isnull=False).values_list('id', flat=True)
+            ], ignore_conflicts=True)
+        return updated
+
+
+def decrement_stock(order):
+    """
+    Take a delivered order's amount off the stock of its products in one
+    UPDATE, never below zero, keeping the display text in step. Returns the
+    number of products updated.
+    """
+    amount = order.quantity_value
+    if not amount:
+        return 0
+
+    remaining = _minus('quantity_value', amount)
+    return Product.objects.filter(order=order, quantity_value__isnull=False).update(
+        quantity_value=remaining,
+        quantity=_quantity_text(remaining),
+    )
@@ -0,0 +1,144 @@
+import contextlib
+import json
+import os
+import time
+import uuid
+from datetime import timedelta
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from api.models import CustomUser, BuyerProfile, Notification
+from .bench_tracking_load import percentile_summary
+
+# The page a notification bell shows
+PAGE_SIZE = 20
+SEED_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed one buyer with many notifications and report the latency of listing "
+        "and counting them, optionally without and then with the Notification indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notifications', type=int, default=100000,
+                            help="Notifications of the seeded buyer (default 100000)")
+        parser.add_argument('--unread', type=float, default=0.05,
+                            help="Fraction of them left unread (default 0.05)")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Measurements per query or endpoint (default 20)")
+        parser.add_argument('--compare-indexes', action='store_true',
+                            help="Measure without the Notification indexes first, then with them. "
+                                 "Drops and recreates the indexes: use a scratch database")
+        parser.add_argument('--with-list', action='store_true',
+                            help="Also time the list endpoint, which serializes every notification of the user")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed (default 0)")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded buyer and notifications")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        if options['notifications'] < 1 or options['repeat'] < 1:
+            raise CommandError("--notifications and --repeat must be positive")
+
+        user = self.seed(options)
+        try:
+            runs = {}
+            if options['compare_indexes']:
+                with self.without_indexes():
+                    runs['without_indexes'] = self.measure(user, options)
+                runs['with_indexes'] = self.measure(user, options)
+            else:
+                runs['current'] = self.measure(user, options)
+        finally:
+            if not options['keep']:
+                # Notifications, counter and token cascade from the user
+                user.delete()
+
+        report = {
+            'config': {
+                key: options[key] for key in ('notifications', 'unread', 'repeat', 'seed')
+            } | {'database': connection.vendor},
+            'runs': runs,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for run, rows in runs.items():
+            self.stdout.write(f"{run}:")
+            self.stdout.write(f"  {'measurement':<22}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+            for name, row in rows.items():
+                self.stdout.write(f"  {name:<22}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['max_ms']:>10}")
+
+    def seed(self, options):
+        run = uuid.uuid4().hex[:8]
+        user = CustomUser.objects.create_user(username=f"notifybench-{run}", password=None, is_buyer=True)
+        BuyerProfile.objects.create(user=user)
+        self.token = Token.objects.create(user=user).key
+
+        rng = np.random.default_rng(options['seed'])
+        count = options['notifications']
+        # A year of notifications, oldest first like real inserts
+        start = timezone.now() - timedelta(days=365)
+        offsets = np.sort(rng.uniform(0, 365 * 24 * 3600, size=count))
+        unread = rng.random(count) < options['unread']
+        types = [choice for choice, _ in Notification.NOTIFICATION_TYPES]
+
+        for begin in range(0, count, SEED_BATCH_SIZE):
+            Notification.objects.bulk_create([
+                Notification(
+                    recipient=user,
+                    notification_type=types[index % len(types)],
+                    message=f"Benchmark notification {index}",
+                    sender_name="System",
+                    is_read=not unread[index],
+                    created_at=start + timedelta(seconds=float(offsets[index])),
+                )
+                for index in range(begin, min(begin + SEED_BATCH_SIZE, count))
+            ])
+        return user
+
+    @contextlib.contextmanager
+    def without_indexes(self):
+        indexes = Notification._meta.indexes
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(Notification, index)
+        try:
+            yield
+        finally:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Notification, index)
+
+    def time(self, action, repeat):
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            action()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return percentile_summary(latencies)
+
+    def measure(self, user, options):
+        repeat = options['repeat']
+        notifications = Notification.objects.filter(recipient=user)
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {self.token}')
+
+        results = {
+            'newest_page': self.time(lambda: list(notifications.order_by('-created_at')[:PAGE_SIZE]), repeat),
+            'unread_page': self.time(
+                lambda: list(notifications.filter(is_read=False).order_by('-created_at')[:PAGE_SIZE]), repeat
+            ),
+            'unread_count_query': self.time(lambda: notifications.filter(is_read=False).count(), repeat),
+            'unread_count': self.time(lambda: client.get(reverse('notification-unread-count')), repeat),
+        }
+        if options['with_list']:
+            # Some views print debugging output, keep it out of the report
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                results['list'] = self.time(lambda: client.get(reverse('notification-list')), max(1, repeat // 10))
+        return results
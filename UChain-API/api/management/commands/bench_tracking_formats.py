@@ -0,0 +1,105 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.models import TrackingLocation
+from api.renderers import EncodedPolylineRenderer, PackedInt32Renderer
+from api.serializers import TrackingLocationSerializer
+
+# Addis Ababa to Jimma, the shape of a typical coffee run
+START = (9.0300, 38.7400)
+END = (7.6700, 36.8300)
+
+
+def synthetic_track(points, seed=0):
+    """A noisy drive between START and END as [lat, lng] rows"""
+    rng = np.random.default_rng(seed)
+    fractions = np.linspace(0.0, 1.0, points)[:, None]
+    line = np.array(START) + fractions * (np.array(END) - np.array(START))
+    return np.round(line + rng.normal(scale=0.0005, size=line.shape), 7)
+
+
+def history_payload(track):
+    """The JSON body the history endpoint returns today for this track"""
+    start = timezone.now()
+    locations = [
+        TrackingLocation(
+            id=index + 1, order_id=1, driver_id=1,
+            latitude=Decimal(str(lat)), longitude=Decimal(str(lng)),
+            timestamp=start + timedelta(seconds=5 * index), status=None
+        )
+        for index, (lat, lng) in enumerate(track)
+    ]
+    return TrackingLocationSerializer(locations, many=True).data
+
+
+def route_payload(track):
+    """The JSON body the route endpoint returns today for this geometry"""
+    return {
+        'id': 1, 'order': 1, 'driver': 1,
+        'start_latitude': START[0], 'start_longitude': START[1], 'start_address': 'Addis Ababa',
+        'end_latitude': END[0], 'end_longitude': END[1], 'end_address': 'Jimma',
+        'route_geometry': {'type': 'LineString', 'coordinates': [[lng, lat] for lat, lng in track.tolist()]},
+        'distance_km': 346.0, 'estimated_time_min': 390,
+        'created_at': timezone.now().isoformat(), 'updated_at': timezone.now().isoformat(),
+    }
+
+
+def measure(renderer, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = renderer.render(data, renderer.media_type, {})
+        best = min(best, time.perf_counter() - started)
+    return {
+        'bytes': len(body),
+        'gzip_bytes': len(gzip.compress(body)),
+        'encode_ms': round(best * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare payload size and encode time of the JSON, encoded polyline and "
+        "packed int32 representations of tracking history and route geometry."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, nargs='+', default=[100, 1000, 10000],
+                            help="Track lengths to benchmark (default 100 1000 10000)")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Encodes per measurement, the fastest one is reported (default 5)")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        renderers = {
+            'json': JSONRenderer(),
+            'polyline': EncodedPolylineRenderer(),
+            'int32': PackedInt32Renderer(),
+        }
+
+        results = []
+        for points in options['points']:
+            track = synthetic_track(points)
+            for endpoint, data in (('history', history_payload(track)), ('route', route_payload(track))):
+                for name, renderer in renderers.items():
+                    results.append({
+                        'endpoint': endpoint, 'points': points, 'format': name,
+                        **measure(renderer, data, options['repeat']),
+                    })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'endpoint':<9}{'points':>8}  {'format':<9}{'bytes':>11}{'gzip':>10}{'encode ms':>11}")
+        for row in results:
+            self.stdout.write(
+                f"{row['endpoint']:<9}{row['points']:>8}  {row['format']:<9}"
+                f"{row['bytes']:>11}{row['gzip_bytes']:>10}{row['encode_ms']:>11}"
+            )
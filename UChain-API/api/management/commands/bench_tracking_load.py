@@ -0,0 +1,253 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from api.models import CustomUser, BuyerProfile, SellerProfile, DriverProfile, Product, Order, DeliveryRoute
+from api.route_eta import remember_route
+from api.geofence import remember_geofence
+
+# Drivers leave around Addis Ababa towards destinations spread over the country
+ORIGIN = (9.0300, 38.7400)
+DESTINATION_SPREAD = 2.0
+# Distance a driver covers between two consecutive pings, in degrees
+STEP = 0.0005
+
+ENDPOINTS = ('update-location', 'location', 'history')
+
+
+class QueryCounter:
+    """execute_wrapper counting the SQL statements of one request"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Driver:
+    """A seeded driver moving along a straight synthetic route"""
+
+    def __init__(self, index, user, order, token, rng):
+        self.index = index
+        self.user = user
+        self.order = order
+        self.token = token
+        self.start = np.array(ORIGIN) + rng.normal(scale=0.05, size=2)
+        self.end = np.array(ORIGIN) + rng.uniform(-DESTINATION_SPREAD, DESTINATION_SPREAD, size=2)
+        self.heading = (self.end - self.start) / np.linalg.norm(self.end - self.start)
+        self.noise = rng
+        self.step = 0
+        self.lock = threading.Lock()
+
+    def next_position(self):
+        # Requests for one driver may run on several worker threads
+        with self.lock:
+            self.step += 1
+            position = self.start + self.heading * STEP * self.step + self.noise.normal(scale=STEP / 10, size=2)
+        return round(float(position[0]), 7), round(float(position[1]), 7)
+
+
+def percentile_summary(latencies):
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(max(latencies)), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed drivers with orders and routes, simulate them moving while viewers poll "
+        "their position and history, and report throughput, latency percentiles and "
+        "SQL queries per request for the tracking endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=20, help="Simulated drivers, one order each (default 20)")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds to generate load for (default 10)")
+        parser.add_argument('--ping-rate', type=float, default=1,
+                            help="update-location requests per second per driver (default 1)")
+        parser.add_argument('--location-rate', type=float, default=2,
+                            help="location/<id> requests per second per order (default 2)")
+        parser.add_argument('--history-rate', type=float, default=0.2,
+                            help="history/<id> requests per second per order (default 0.2)")
+        parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once (default 8)")
+        parser.add_argument('--url', help="Base URL of a running server; the in-process test client is used otherwise")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the routes (default 0)")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded users, orders and pings")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        if options['drivers'] < 1 or options['duration'] <= 0 or options['concurrency'] < 1:
+            raise CommandError("--drivers, --duration and --concurrency must be positive")
+
+        self.base_url = (options['url'] or '').rstrip('/')
+        run = uuid.uuid4().hex[:8]
+        rng = np.random.default_rng(options['seed'])
+        drivers, seeded_users = self.seed(run, options['drivers'], rng)
+
+        try:
+            schedule = self.build_schedule(drivers, options)
+            # Some views print debugging output, keep it out of the report
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                results, elapsed = self.run(schedule, options['concurrency'])
+        finally:
+            if not options['keep']:
+                # Profiles, orders, pings, routes and tokens cascade from the users
+                CustomUser.objects.filter(id__in=[user.id for user in seeded_users]).delete()
+
+        report = self.report(results, elapsed, options)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{report['requests']} requests in {report['elapsed_s']}s "
+            f"({report['throughput_rps']} req/s, {report['errors']} errors)"
+        )
+        self.stdout.write(f"{'endpoint':<16}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+        for name, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<16}{row['requests']:>9}{row['throughput_rps']:>9}{row['p50_ms'] or '-':>9}"
+                f"{row['p95_ms'] or '-':>9}{row['p99_ms'] or '-':>9}{row['queries_per_request'] or '-':>9}"
+            )
+
+    def seed(self, run, count, rng):
+        seller_user = CustomUser.objects.create_user(username=f"loadtest-{run}-seller", password=None, is_seller=True)
+        buyer_user = CustomUser.objects.create_user(username=f"loadtest-{run}-buyer", password=None, is_buyer=True)
+        seller = SellerProfile.objects.create(user=seller_user, tax_number=f"LOAD-{run}")
+        buyer = BuyerProfile.objects.create(user=buyer_user)
+        product = Product.objects.create(
+            seller=seller, name="Load test coffee", description="Synthetic",
+            price=1, quantity="1000 kg", product_type="coffee"
+        )
+
+        drivers = []
+        seeded_users = [seller_user, buyer_user]
+        for index in range(count):
+            user = CustomUser.objects.create_user(username=f"loadtest-{run}-driver-{index}", password=None, is_driver=True)
+            profile = DriverProfile.objects.create(user=user, license_number=f"LOAD-{run}-{index}", car_model="Isuzu")
+            order = Order.objects.create(buyer=buyer, driver=profile, quantity="10", status=Order.SHIPPED)
+            order.product.add(product)
+            token = Token.objects.create(user=user).key
+            driver = Driver(index, user, order, token, rng)
+            route = DeliveryRoute.objects.create(
+                order=order, driver=user,
+                start_latitude=driver.start[0], start_longitude=driver.start[1],
+                end_latitude=driver.end[0], end_longitude=driver.end[1],
+            )
+            remember_route(route)
+            remember_geofence(route)
+            drivers.append(driver)
+            seeded_users.append(user)
+
+        # Viewers poll as the buyer
+        self.viewer_token = Token.objects.create(user=buyer_user).key
+        return drivers, seeded_users
+
+    def build_schedule(self, drivers, options):
+        """Open-loop schedule of (due, endpoint, driver), evenly spaced per driver with a random phase"""
+        rng = np.random.default_rng(options['seed'] + 1)
+        schedule = []
+        rates = zip(ENDPOINTS, (options['ping_rate'], options['location_rate'], options['history_rate']))
+        for endpoint, rate in rates:
+            if rate <= 0:
+                continue
+            interval = 1 / rate
+            for driver in drivers:
+                due = rng.uniform(0, interval)
+                while due < options['duration']:
+                    schedule.append((due, endpoint, driver))
+                    due += interval
+        schedule.sort(key=lambda event: event[0])
+        return schedule
+
+    def request(self, endpoint, driver):
+        if endpoint == 'update-location':
+            latitude, longitude = driver.next_position()
+            path = reverse('update-tracking-location')
+            return 'post', path, driver.token, {"orderId": driver.order.id, "latitude": latitude, "longitude": longitude}
+        name = 'get-order-location' if endpoint == 'location' else 'get-tracking-history'
+        return 'get', reverse(name, args=[driver.order.id]), self.viewer_token, None
+
+    def send(self, endpoint, driver):
+        method, path, token, payload = self.request(endpoint, driver)
+        headers = {'Authorization': f'Token {token}'}
+
+        if self.base_url:
+            started = time.perf_counter()
+            response = httpx.request(method, self.base_url + path, json=payload, headers=headers)
+            return endpoint, response.status_code, (time.perf_counter() - started) * 1000, None
+
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=headers['Authorization'])
+        counter = QueryCounter()
+        try:
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                if method == 'post':
+                    response = client.post(path, payload, content_type='application/json')
+                else:
+                    response = client.get(path)
+                latency = (time.perf_counter() - started) * 1000
+        finally:
+            # Worker threads each hold their own connection
+            connection.close()
+        return endpoint, response.status_code, latency, counter.count
+
+    def run(self, schedule, concurrency):
+        futures = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for due, endpoint, driver in schedule:
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(self.send, endpoint, driver))
+            results = [future.result() for future in futures]
+        return results, time.perf_counter() - started
+
+    def report(self, results, elapsed, options):
+        endpoints = {}
+        for name in ENDPOINTS:
+            rows = [row for row in results if row[0] == name]
+            if not rows:
+                continue
+            queries = [row[3] for row in rows if row[3] is not None]
+            endpoints[name] = {
+                'requests': len(rows),
+                # Polling an order before its first ping is a 404, see status_codes
+                'errors': sum(1 for row in rows if row[1] >= 500),
+                'status_codes': {str(code): sum(1 for row in rows if row[1] == code) for code in sorted({row[1] for row in rows})},
+                'throughput_rps': round(len(rows) / elapsed, 2),
+                **percentile_summary([row[2] for row in rows]),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+                'max_queries': max(queries) if queries else None,
+            }
+
+        return {
+            'config': {
+                key: options[key] for key in
+                ('drivers', 'duration', 'ping_rate', 'location_rate', 'history_rate', 'concurrency', 'seed')
+            } | {'target': self.base_url or 'test-client', 'database': connection.vendor},
+            'elapsed_s': round(elapsed, 3),
+            'requests': len(results),
+            'errors': sum(row['errors'] for row in endpoints.values()),
+            'throughput_rps': round(len(results) / elapsed, 2),
+            'endpoints': endpoints,
+        }
@@ -0,0 +1,45 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from api.models import Order
+from api.tracking_archive import compact_order
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the tracking pings of delivered orders whose last ping is older "
+        "than --days into one compressed ArchivedTrack per order and delete the raw rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help="Only compact orders whose last ping is at least this many days old (default 30)")
+        parser.add_argument('--limit', type=int, default=500,
+                            help="Maximum number of orders to compact in this run (default 500)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="List the orders that would be compacted without changing anything")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        order_ids = list(
+            Order.objects.filter(status=Order.DELIVERED)
+            .annotate(last_ping=Max('tracking_locations__timestamp'))
+            .filter(last_ping__lt=cutoff)
+            .order_by('id')
+            .values_list('id', flat=True)[:options['limit']]
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f"{len(order_ids)} orders would be compacted: {order_ids}")
+            return
+
+        compacted_pings = 0
+        for order_id in order_ids:
+            # One transaction per order keeps row locks short
+            compacted_pings += compact_order(order_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {compacted_pings} pings from {len(order_ids)} orders"
+        ))
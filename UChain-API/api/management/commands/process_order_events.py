@@ -0,0 +1,60 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from api.outbox import process_batch, purge_processed
+from api.pubsub import InProcessBroker
+
+
+class Command(BaseCommand):
+    help = (
+        "Handle order events (notifications, stock) written by status changes. "
+        "Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help="Orders handled in parallel; 1 handles them in the main thread (default 4)")
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE,
+                            help=f"Events claimed per batch (default {settings.OUTBOX_BATCH_SIZE})")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when no event is waiting (default 1)")
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help="Delete events processed more than this many days ago (default 7)")
+        parser.add_argument('--once', action='store_true',
+                            help="Handle the waiting events and exit")
+
+    def handle(self, *args, **options):
+        if issubclass(import_string(settings.PUBSUB_BROKER), InProcessBroker):
+            # Notifications written here would wake no notification feed
+            self.stderr.write(self.style.WARNING(
+                "PUBSUB_BROKER is in-process: notification feeds of the web workers are not woken by "
+                "this worker, set it to a cross-process broker for live order notifications"
+            ))
+
+        # One token per worker process, its leases are released on retry or expiry
+        token = uuid.uuid4().hex
+        executor = ThreadPoolExecutor(max_workers=options['threads']) if options['threads'] > 1 else None
+        total = 0
+        try:
+            while True:
+                claimed, handled = process_batch(options['batch_size'], executor, token)
+                total += handled
+                if claimed:
+                    continue
+
+                purge_processed(timezone.now() - timedelta(days=options['keep_days']))
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Handled {total} order events"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.notification_retention import purge_notifications, retention_policies
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete notifications older than the retention of their type "
+        "(NOTIFICATION_RETENTION_DAYS), in small batches so the table is never locked for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Notifications examined per batch, each batch is one transaction (default 1000)")
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help="Seconds to sleep between batches that deleted something (default 0.1)")
+        parser.add_argument('--max-batches', type=int,
+                            help="Stop after this many batches, to spread a large backlog over several runs")
+        parser.add_argument('--days', type=int,
+                            help="Keep every type this many days instead of the configured policies")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Count the notifications that would be deleted without deleting them")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        policies = {'default': options['days']} if options['days'] is not None else retention_policies()
+
+        purged = purge_notifications(
+            policies,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f"{purged} notifications would be deleted")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Deleted {purged} notifications"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.sales import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-day seller sales rollups from all delivered orders, "
+        "e.g. after deploying them or to repair drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Rollup rows written per INSERT (default 2000)")
+
+    def handle(self, *args, **options):
+        written = rebuild_sales(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily sales rows"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.unread_counter import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the unread notifications of every user with a counter and fix "
+        "the counters that drifted, e.g. after notifications were written directly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Counters checked per query (default 1000)")
+
+    def handle(self, *args, **options):
+        fixed = reconcile(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} unread notification counters"))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_notification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trackinglocation',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
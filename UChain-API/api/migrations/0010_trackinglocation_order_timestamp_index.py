@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_trackinglocation_client_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trackinglocation',
+            index=models.Index(fields=['order', 'timestamp'], name='tracking_order_time_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_trackinglocation_order_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('point_count', models.PositiveIntegerField()),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('statuses', models.JSONField(blank=True, default=list)),
+                ('drivers', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archived_track', to='api.order')),
+            ],
+        ),
+    ]
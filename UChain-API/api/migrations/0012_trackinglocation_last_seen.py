@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_archivedtrack'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackinglocation',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_seller_orders(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    SellerOrder = apps.get_model('api', 'SellerOrder')
+
+    pairs = (
+        Order.product.through.objects
+        .values_list('product__seller_id', 'order_id')
+        .distinct()
+        .order_by('order_id')
+    )
+    batch = []
+    for seller_id, order_id in pairs.iterator(chunk_size=2000):
+        batch.append(SellerOrder(seller_id=seller_id, order_id=order_id))
+        if len(batch) >= 2000:
+            SellerOrder.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    SellerOrder.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_trackinglocation_last_seen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_links', to='api.order')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_links', to='api.sellerprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('seller', 'order'), name='unique_seller_order')],
+            },
+        ),
+        migrations.RunPython(backfill_seller_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:24
+
+from django.db import migrations, models
+
+
+# Spellings written by older code and clients, see api/order_status.py
+STATUS_ALIASES = {
+    'pending': 'Pending',
+    'accepted': 'Accepted',
+    'shipped': 'Shipped',
+    'on_route': 'Shipped',
+    'picked_up': 'Shipped',
+    'driver_delivered': 'Driver_Delivered',
+    'delivered': 'Delivered',
+}
+
+
+def normalize_order_status(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    for alias, status in STATUS_ALIASES.items():
+        Order.objects.filter(status__iexact=alias).update(status=status)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_sellerorder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Accepted', 'Accepted'), ('Shipped', 'Shipped'), ('Driver_Delivered', 'Delivered by Driver'), ('Delivered', 'Delivered')], default='Pending', max_length=20),
+        ),
+        migrations.RunPython(normalize_order_status, migrations.RunPython.noop),
+    ]
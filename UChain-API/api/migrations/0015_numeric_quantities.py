@@ -0,0 +1,63 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:26
+
+import re
+from django.db import migrations, models
+
+# The rules OrderUpdateView used to parse quantities on delivery
+PRODUCT_QUANTITY_PATTERN = re.compile(r'(\d+)\s*([a-zA-Z]*)')
+ORDER_QUANTITY_PATTERN = re.compile(r'(\d+)')
+BATCH_SIZE = 1000
+
+
+def backfill_quantities(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    Order = apps.get_model('api', 'Order')
+
+    products = []
+    for product in Product.objects.only('id', 'quantity').iterator(chunk_size=BATCH_SIZE):
+        match = PRODUCT_QUANTITY_PATTERN.search(product.quantity or '')
+        if match:
+            product.quantity_value = int(match.group(1))
+            product.quantity_unit = match.group(2)[:20]
+            products.append(product)
+        if len(products) >= BATCH_SIZE:
+            Product.objects.bulk_update(products, ['quantity_value', 'quantity_unit'])
+            products = []
+    Product.objects.bulk_update(products, ['quantity_value', 'quantity_unit'])
+
+    orders = []
+    for order in Order.objects.only('id', 'quantity').iterator(chunk_size=BATCH_SIZE):
+        match = ORDER_QUANTITY_PATTERN.search(order.quantity or '')
+        if match:
+            order.quantity_value = int(match.group(1))
+            orders.append(order)
+        if len(orders) >= BATCH_SIZE:
+            Order.objects.bulk_update(orders, ['quantity_value'])
+            orders = []
+    Order.objects.bulk_update(orders, ['quantity_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_normalize_order_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='quantity_value',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='quantity_unit',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='quantity_value',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_quantities, migrations.RunPython.noop),
+    ]
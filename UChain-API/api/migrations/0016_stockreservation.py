@@ -0,0 +1,68 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+OPEN_STATUSES = ['Pending', 'Accepted', 'Shipped', 'Driver_Delivered']
+
+
+def hold_open_orders(apps, schema_editor):
+    # Orders placed before the ledger hold their stock until they are delivered
+    Order = apps.get_model('api', 'Order')
+    Product = apps.get_model('api', 'Product')
+    StockReservation = apps.get_model('api', 'StockReservation')
+
+    pairs = (
+        Order.product.through.objects
+        .filter(order__status__in=OPEN_STATUSES, order__quantity_value__gt=0, product__quantity_value__isnull=False)
+        .values_list('order_id', 'product_id', 'order__quantity_value')
+        .order_by('order_id')
+    )
+    batch = []
+    for order_id, product_id, quantity in pairs.iterator(chunk_size=2000):
+        batch.append(StockReservation(order_id=order_id, product_id=product_id, quantity=quantity))
+        if len(batch) >= 2000:
+            StockReservation.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    StockReservation.objects.bulk_create(batch, ignore_conflicts=True)
+
+    totals = StockReservation.objects.values('product_id').annotate(total=Sum('quantity')).order_by()
+    for row in totals.iterator(chunk_size=2000):
+        Product.objects.filter(pk=row['product_id']).update(quantity_reserved=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_numeric_quantities'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='quantity_reserved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Accepted', 'Accepted'), ('Shipped', 'Shipped'), ('Driver_Delivered', 'Delivered by Driver'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], default='Pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('state', models.CharField(choices=[('held', 'Held'), ('committed', 'Committed'), ('released', 'Released')], default='held', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='unique_order_reservation')],
+            },
+        ),
+        migrations.RunPython(hold_open_orders, migrations.RunPython.noop),
+    ]
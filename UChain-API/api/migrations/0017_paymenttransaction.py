@@ -0,0 +1,62 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:31
+
+import django.db.models.deletion
+import re
+from django.db import migrations, models
+
+TX_MARKER_PATTERN = re.compile(r'\s*\[TX:([^\]]+)\]')
+
+
+def move_tx_refs(apps, schema_editor):
+    # "1 [TX:<tx_ref>]" quantities become "1" plus a payment row
+    Order = apps.get_model('api', 'Order')
+    PaymentTransaction = apps.get_model('api', 'PaymentTransaction')
+
+    orders = Order.objects.filter(quantity__contains='[TX:').order_by('id')
+    first_products = {}
+    for order_id, product_id in (
+        Order.product.through.objects.filter(order__quantity__contains='[TX:')
+        .order_by('order_id', 'product_id').values_list('order_id', 'product_id')
+    ):
+        first_products.setdefault(order_id, product_id)
+
+    payments = {}
+    for order in orders.iterator(chunk_size=2000):
+        match = TX_MARKER_PATTERN.search(order.quantity)
+        if not match:
+            continue
+        tx_ref = match.group(1).strip()[:100]
+        # A reference reused across orders belongs to the latest one
+        payments[tx_ref] = PaymentTransaction(
+            tx_ref=tx_ref, order_id=order.id, buyer_id=order.buyer_id,
+            product_id=first_products.get(order.id),
+        )
+        order.quantity = TX_MARKER_PATTERN.sub('', order.quantity, count=1).strip()
+        Order.objects.filter(pk=order.pk).update(quantity=order.quantity)
+
+    PaymentTransaction.objects.bulk_create(list(payments.values()), batch_size=2000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_ref', models.CharField(max_length=100, unique=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('status', models.CharField(choices=[('initialized', 'Initialized'), ('success', 'Success'), ('failed', 'Failed')], default='initialized', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('buyer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='api.buyerprofile')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='api.order')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='api.product')),
+            ],
+        ),
+        migrations.RunPython(move_tx_refs, migrations.RunPython.noop),
+    ]
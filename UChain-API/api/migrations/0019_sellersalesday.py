@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='sales_recorded',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SellerSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.PositiveBigIntegerField(default=0)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='api.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='api.sellerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['seller', 'day'], name='sales_seller_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('seller', 'product', 'day'), name='unique_seller_product_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_sellersalesday'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', 'status', 'order_date'], name='order_buyer_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['driver', 'status', 'order_date'], name='order_driver_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_order_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastWatermark',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='broadcast_watermark', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_read_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BroadcastNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audience', models.CharField(choices=[('buyers', 'Buyers'), ('sellers', 'Sellers'), ('drivers', 'Drivers'), ('everyone', 'Everyone')], max_length=10)),
+                ('notification_type', models.CharField(max_length=20)),
+                ('message', models.CharField(max_length=255)),
+                ('sender_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('related_product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to='api.product')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['audience', 'created_at'], name='broadcast_audience_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checkout_token',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -42,6 +42,11 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=7, decimal_places=2, default=0.00)
     quantity = models.CharField(max_length=100)
+    # Numeric stock parsed from quantity, see api/inventory.py
+    quantity_value = models.PositiveIntegerField(null=True, blank=True)
+    quantity_unit = models.CharField(max_length=20, blank=True, default='')
+    # Stock held by open orders, maintained with StockReservation
+    quantity_reserved = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='Products_Pictures/', null=True, blank=True)
     product_type = models.CharField(max_length=200)
 
@@ -51,20 +56,162 @@ class Order(models.Model):
     driver = models.ForeignKey(DriverProfile, on_delete=models.SET_NULL, null=True, blank=True)
     
     PENDING = "Pending"
+    ACCEPTED = "Accepted"
     SHIPPED = "Shipped"
     DELIVERED = "Delivered"
     DRIVER_DELIVERED = "Driver_Delivered"
+    CANCELLED = "Cancelled"
+    # Status changes go through api/order_status.py
     STATUS_CHOICES = [
         (PENDING, 'Pending'),
+        (ACCEPTED, 'Accepted'),
         (SHIPPED, 'Shipped'),
         (DRIVER_DELIVERED, 'Delivered by Driver'),
-        (DELIVERED, 'Delivered')
+        (DELIVERED, 'Delivered'),
+        (CANCELLED, 'Cancelled')
     ]
     quantity = models.CharField(max_length=100)
+    # Ordered amount parsed from quantity, see api/inventory.py
+    quantity_value = models.PositiveIntegerField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
     order_date = models.DateTimeField(auto_now_add=True)
+    # Set by the transition to Delivered
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    # Whether the order is counted in SellerSalesDay, see api/sales.py
+    sales_recorded = models.BooleanField(default=False)
+    # Shared by the orders of one cart checkout, to read them back after their bulk INSERT
+    checkout_token = models.UUIDField(null=True, blank=True, db_index=True, editable=False)
     product = models.ManyToManyField(Product)
 
+    class Meta:
+        # Role lists filtered by status and date, see api/order_filters.py
+        indexes = [
+            models.Index(fields=['buyer', 'status', 'order_date'], name='order_buyer_status_date_idx'),
+            models.Index(fields=['driver', 'status', 'order_date'], name='order_driver_status_date_idx'),
+        ]
+
+# Denormalized index of the sellers whose products are part of an order
+class SellerOrder(models.Model):
+    """
+    One row per (seller, order) pair, kept in sync with Order.product by
+    api/seller_orders.py so a seller's orders are a single indexed lookup.
+    """
+    seller = models.ForeignKey(SellerProfile, on_delete=models.CASCADE, related_name='order_links')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='seller_links')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'order'], name='unique_seller_order'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} for seller {self.seller_id}"
+
+# Daily sales of a seller's product, maintained by api/sales.py
+class SellerSalesDay(models.Model):
+    """
+    Revenue, units and delivered orders per (seller, product, day of
+    delivery), so sales over a date range are read from at most one row per
+    product and day instead of from the orders.
+    """
+    seller = models.ForeignKey(SellerProfile, on_delete=models.CASCADE, related_name='sales_days')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_days')
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveBigIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'product', 'day'], name='unique_seller_product_day'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='sales_seller_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sales of product {self.product_id} on {self.day}"
+
+# Outbox of order status changes, consumed by the process_order_events command
+class OrderEvent(models.Model):
+    """
+    Written in the transaction that changes the order's status and handled
+    later, in id order per order, by api/outbox.py.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Not handed to a worker before this time: retry backoff or a worker's lease
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='order_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} -> {self.status}"
+
+# Ledger of the stock held for an order between creation and delivery
+class StockReservation(models.Model):
+    """
+    One row per (order, product). Product.quantity_reserved is the running
+    total of the held rows, see api/inventory.py.
+    """
+    HELD = "held"
+    COMMITTED = "committed"
+    RELEASED = "released"
+    STATE_CHOICES = [
+        (HELD, 'Held'),
+        (COMMITTED, 'Committed'),
+        (RELEASED, 'Released'),
+    ]
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=HELD)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_reservation'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of product {self.product_id} for order {self.order_id} ({self.state})"
+
+# Model for a Chapa payment and the order it pays for
+class PaymentTransaction(models.Model):
+    """
+    One row per tx_ref, looked up by its unique index from driver
+    assignment, payment verification and the payment callback.
+    See api/payments.py.
+    """
+    INITIALIZED = "initialized"
+    SUCCESS = "success"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (INITIALIZED, 'Initialized'),
+        (SUCCESS, 'Success'),
+        (FAILED, 'Failed'),
+    ]
+    tx_ref = models.CharField(max_length=100, unique=True)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='payments')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='payments')
+    buyer = models.ForeignKey(BuyerProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='payments')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=INITIALIZED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Payment {self.tx_ref} ({self.status})"
+
 # Model for Message
 class Message(models.Model):
     sender = models.ForeignKey(CustomUser, related_name='sent_messages', on_delete=models.CASCADE)
@@ -97,7 +244,10 @@ class TrackingLocation(models.Model):
     driver = models.ForeignKey(CustomUser, related_name='tracking_locations', on_delete=models.CASCADE)
     latitude = models.DecimalField(max_digits=9, decimal_places=7)
     longitude = models.DecimalField(max_digits=10, decimal_places=7)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Defaults to the server time but batched pings carry their own client timestamp
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Latest time the driver was still reported at this point (see api/deadband.py)
+    last_seen = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=50, blank=True, null=True)
     
     def __str__(self):
@@ -105,6 +255,30 @@ class TrackingLocation(models.Model):
     
     class Meta:
         ordering = ['-timestamp']  # Most recent first
+        indexes = [
+            models.Index(fields=['order', 'timestamp'], name='tracking_order_time_idx'),
+        ]
+
+# Model for the compacted tracking history of an old, delivered order
+class ArchivedTrack(models.Model):
+    """
+    All pings of an order packed into one compressed record once the order is
+    delivered and old enough, replacing its TrackingLocation rows.
+    See api/tracking_archive.py for the binary layout.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='archived_track')
+    point_count = models.PositiveIntegerField()
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    # Delta-encoded latitude/longitude/time arrays, zlib compressed
+    data = models.BinaryField()
+    # Sparse per-point values as [point index, value] pairs
+    statuses = models.JSONField(default=list, blank=True)
+    drivers = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived track for Order {self.order_id} ({self.point_count} points)"
 
 # Model to store route information for deliveries
 class DeliveryRoute(models.Model):
@@ -156,6 +330,61 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's notifications newest first, and the unread ones
+            models.Index(fields=['recipient', 'created_at'], name='notification_time_idx'),
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_read_time_idx'),
+        ]
         
     def __str__(self):
-        return f"Notification to {self.recipient.username}: {self.message}"
\ No newline at end of file
+        return f"Notification to {self.recipient.username}: {self.message}"
+
+
+# Model for a notification shown to every user of an audience
+class BroadcastNotification(models.Model):
+    """
+    Stored once and merged into each user's notifications when they are
+    read, see api/broadcasts.py. A user has read every broadcast up to their
+    BroadcastWatermark.
+    """
+    BUYERS = "buyers"
+    SELLERS = "sellers"
+    DRIVERS = "drivers"
+    EVERYONE = "everyone"
+    AUDIENCE_CHOICES = [
+        (BUYERS, 'Buyers'),
+        (SELLERS, 'Sellers'),
+        (DRIVERS, 'Drivers'),
+        (EVERYONE, 'Everyone'),
+    ]
+    audience = models.CharField(max_length=10, choices=AUDIENCE_CHOICES)
+    notification_type = models.CharField(max_length=20)
+    message = models.CharField(max_length=255)
+    related_product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='broadcasts')
+    sender_name = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['audience', 'created_at'], name='broadcast_audience_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Broadcast to {self.audience}: {self.message}"
+
+# The latest broadcast a user has read
+class BroadcastWatermark(models.Model):
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='broadcast_watermark')
+    last_read_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} read broadcasts up to {self.last_read_id}"
+
+# Number of unread personal notifications of a user, see api/unread_counter.py
+class NotificationCounter(models.Model):
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} has {self.unread} unread notifications"
@@ -0,0 +1,83 @@
+"""
+Notifications newer than a client's cursor, for the long-poll and SSE feeds
+in api/views_stream.py.
+
+A cursor is the pair (since_id, since_broadcast_id): the last personal
+Notification id and the last BroadcastNotification id the client has seen.
+Writers publish on notification_channel(user) and broadcast_channel(audience)
+after commit. A long-poll only queries the database when woken or at its
+timeout, an SSE stream also on every keep-alive.
+
+Order notifications are written by the process_order_events worker, a
+separate process: its wake-ups only reach the feeds through a cross-process
+PUBSUB_BROKER. With the default in-process broker, streams pick them up at
+their next keep-alive and long-polls at their next poll.
+"""
+from django.db.models import Max
+from .broadcasts import audiences_for, read_watermark, visible_broadcasts
+from .models import BroadcastNotification, Notification
+from .pubsub import broadcast_channel, notification_channel, publish_on_commit
+from .serializers import BroadcastNotificationSerializer, NotificationSerializer
+
+# Most notifications of each kind returned by one call
+FEED_LIMIT = 100
+
+
+def feed_channels(user):
+    return [notification_channel(user.id)] + [broadcast_channel(audience) for audience in audiences_for(user)]
+
+
+def announce(notifications):
+    """
+    Wake the feeds of the recipients once the notifications are committed.
+    Only feeds served by this process are reached unless PUBSUB_BROKER is
+    cross-process, see the module docstring.
+    """
+    # Only a wake-up: bulk inserted rows have no id on every backend, the feed reads them back
+    for recipient_id in sorted({notification.recipient_id for notification in notifications}):
+        publish_on_commit(notification_channel(recipient_id), {'recipient': recipient_id})
+
+
+def latest_cursor(user):
+    """The cursor of a client that has seen everything so far"""
+    since_id = Notification.objects.filter(recipient=user).aggregate(latest=Max('id'))['latest'] or 0
+    since_broadcast_id = BroadcastNotification.objects.aggregate(latest=Max('id'))['latest'] or 0
+    return since_id, since_broadcast_id
+
+
+def notifications_after(user, since_id, since_broadcast_id, limit=FEED_LIMIT):
+    """
+    Return (serialized notifications oldest first, the cursor after them).
+    Personal notifications come before broadcasts.
+    """
+    personal = list(Notification.objects.filter(recipient=user, id__gt=since_id).order_by('id')[:limit])
+    broadcasts = list(visible_broadcasts(user).filter(id__gt=since_broadcast_id).order_by('id')[:limit])
+
+    items = NotificationSerializer(personal, many=True).data if personal else []
+    if broadcasts:
+        context = {'watermark': read_watermark(user)}
+        items += BroadcastNotificationSerializer(broadcasts, many=True, context=context).data
+
+    cursor = (
+        personal[-1].id if personal else since_id,
+        broadcasts[-1].id if broadcasts else since_broadcast_id,
+    )
+    return items, cursor
+
+
+def parse_cursor(user, since_id, since_broadcast_id):
+    """
+    The cursor of the request parameters, raising ValueError on invalid
+    ones. Without since_id the client starts from now, and without
+    since_broadcast_id it only gets broadcasts issued from now.
+    """
+    latest_id, latest_broadcast_id = latest_cursor(user) if since_id is None or since_broadcast_id is None else (0, 0)
+    cursor = []
+    for value, latest in ((since_id, latest_id), (since_broadcast_id, latest_broadcast_id)):
+        if value is None:
+            cursor.append(latest)
+        elif str(value).isdigit():
+            cursor.append(int(value))
+        else:
+            raise ValueError(value)
+    return tuple(cursor)
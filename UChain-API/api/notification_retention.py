@@ -0,0 +1,72 @@
+"""
+Retention of personal notifications.
+
+NOTIFICATION_RETENTION_DAYS sets how long each notification type is kept.
+The purge reads the table in primary key order, batch_size rows at a time,
+which is an index range scan whatever the policies, and deletes the expired
+rows of each batch in its own short transaction. Ids grow with created_at,
+so it stops at the first batch whose oldest row is within every policy.
+Unread counters (api/unread_counter.py) are decremented with the deletes.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Notification
+from .unread_counter import add_unread
+
+DEFAULT_POLICY = 'default'
+
+
+def retention_policies():
+    """{notification type or 'default': days kept}"""
+    return dict(getattr(settings, 'NOTIFICATION_RETENTION_DAYS', {DEFAULT_POLICY: 180}))
+
+
+def purge_notifications(policies=None, batch_size=1000, pause=0, max_batches=None, dry_run=False):
+    """
+    Delete the expired notifications, sleeping pause seconds between
+    batches. Returns the number of notifications deleted, or that would be.
+    """
+    policies = retention_policies() if policies is None else dict(policies)
+    if not policies:
+        return 0
+    now = timezone.now()
+    cutoffs = {notification_type: now - timedelta(days=days) for notification_type, days in policies.items()}
+    default_cutoff = cutoffs.pop(DEFAULT_POLICY, None)
+    # Rows newer than this are within every policy
+    horizon = max(cutoff for cutoff in [*cutoffs.values(), default_cutoff] if cutoff is not None)
+
+    purged = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        rows = list(
+            Notification.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'recipient_id', 'is_read', 'notification_type', 'created_at')[:batch_size]
+        )
+        if not rows or rows[0][4] >= horizon:
+            break
+        last_id = rows[-1][0]
+        batches += 1
+
+        expired = []
+        for row in rows:
+            cutoff = cutoffs.get(row[3], default_cutoff)
+            if cutoff is not None and row[4] < cutoff:
+                expired.append(row)
+        if not expired:
+            continue
+        if not dry_run:
+            with transaction.atomic():
+                Notification.objects.filter(id__in=[row[0] for row in expired]).delete()
+                add_unread({
+                    recipient_id: -count
+                    for recipient_id, count in Counter(row[1] for row in expired if not row[2]).items()
+                })
+        purged += len(expired)
+        if pause:
+            time.sleep(pause)
+    return purged
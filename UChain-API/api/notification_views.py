@@ -1,29 +1,124 @@
+import heapq
+import logging
+from operator import attrgetter
+from django.db import transaction
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Notification, CustomUser, Order
-from .serializers import NotificationSerializer
+from .models import Notification, CustomUser, Order, BroadcastNotification
+from .serializers import NotificationSerializer, BroadcastNotificationSerializer
+from .broadcasts import (
+    broadcast, mark_broadcasts_read, parse_broadcast_id, read_watermark, unread_broadcast_count, visible_broadcasts
+)
+from . import unread_counter
+from .notification_feed import announce
+
+logger = logging.getLogger(__name__)
 
 class NotificationViewSet(viewsets.ModelViewSet):
-    """ViewSet for managing user notifications"""
+    """
+    ViewSet for managing user notifications. The user's broadcasts (ids
+    like "b12", see api/broadcasts.py) are merged into the list and can be
+    retrieved and marked read, but not changed or deleted. Broadcast read
+    state is a watermark, so reading or dismissing one broadcast also marks
+    every older broadcast of the user as read.
+    """
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         """Return notifications for the current user only"""
         return Notification.objects.filter(recipient=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """Personal notifications and broadcasts, newest first"""
+        watermark = read_watermark(request.user)
+        personal = self.filter_queryset(self.get_queryset())
+        broadcasts = visible_broadcasts(request.user)
+        # Both are ordered by -created_at
+        merged = heapq.merge(personal, broadcasts, key=attrgetter('created_at'), reverse=True)
+        return Response([
+            BroadcastNotificationSerializer(item, context={'watermark': watermark}).data
+            if isinstance(item, BroadcastNotification) else self.get_serializer(item).data
+            for item in merged
+        ])
+
+    def get_broadcast(self, pk):
+        notification = visible_broadcasts(self.request.user).filter(pk=pk).first()
+        if notification is None:
+            raise NotFound()
+        return notification
+
+    def retrieve(self, request, *args, **kwargs):
+        broadcast_id = parse_broadcast_id(kwargs.get('pk'))
+        if broadcast_id is None:
+            return super().retrieve(request, *args, **kwargs)
+        notification = self.get_broadcast(broadcast_id)
+        context = {'watermark': read_watermark(request.user)}
+        return Response(BroadcastNotificationSerializer(notification, context=context).data)
+
+    def update(self, request, *args, **kwargs):
+        broadcast_id = parse_broadcast_id(kwargs.get('pk'))
+        if broadcast_id is None:
+            return super().update(request, *args, **kwargs)
+        # Only the read state of a broadcast can change, for this user. Marking
+        # it read moves the watermark: every older broadcast is read too, and
+        # a broadcast cannot be marked unread again
+        notification = self.get_broadcast(broadcast_id)
+        if request.data.get('is_read') in (True, 'true', 'True', '1', 1):
+            mark_broadcasts_read(request.user, notification.id)
+        context = {'watermark': read_watermark(request.user)}
+        return Response(BroadcastNotificationSerializer(notification, context=context).data)
+
+    def destroy(self, request, *args, **kwargs):
+        broadcast_id = parse_broadcast_id(kwargs.get('pk'))
+        if broadcast_id is None:
+            return super().destroy(request, *args, **kwargs)
+        # A shared broadcast is dismissed by reading it, which like update
+        # also marks the older broadcasts read
+        mark_broadcasts_read(request.user, self.get_broadcast(broadcast_id).id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # Keep the unread counter (api/unread_counter.py) in step with every write
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            notification = serializer.save()
+            unread_counter.count_new([notification])
+            announce([notification])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            is_read = serializer.validated_data.pop('is_read', None)
+            notification = serializer.save()
+            if is_read is not None:
+                # Flipped with a conditional UPDATE, so concurrent requests count a change once
+                if Notification.objects.filter(pk=notification.pk, is_read=not is_read).update(is_read=is_read):
+                    unread_counter.add_unread({notification.recipient_id: -1 if is_read else 1})
+                notification.is_read = is_read
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            if Notification.objects.filter(pk=instance.pk, is_read=False).delete()[0]:
+                unread_counter.add_unread({instance.recipient_id: -1})
+            else:
+                instance.delete()
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """Return count of unread notifications"""
-        count = Notification.objects.filter(recipient=request.user, is_read=False).count()
+        """Return count of unread notifications, from the user's counter and broadcast watermark"""
+        count = unread_counter.unread_count(request.user.id)
+        count += unread_broadcast_count(request.user)
         return Response({"count": count})
     
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        Notification.objects.filter(recipient=request.user).update(is_read=True)
+        with transaction.atomic():
+            Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+            unread_counter.reset_unread(request.user.id)
+        mark_broadcasts_read(request.user)
         return Response({"status": "success"})
         
 class NotificationService:
@@ -34,152 +129,124 @@ class NotificationService:
         """Create a new notification"""
         try:
             recipient = CustomUser.objects.get(id=recipient_id)
-            notification = Notification.objects.create(
+            with transaction.atomic():
+                notification = Notification.objects.create(
+                    recipient=recipient,
+                    notification_type=notification_type,
+                    message=message,
+                    related_order_id=related_order_id,
+                    sender_name=sender_name
+                )
+                unread_counter.count_new([notification])
+                announce([notification])
+            return notification
+        except CustomUser.DoesNotExist:
+            return None
+    
+    @staticmethod
+    def build_order_notifications(order, product, status):
+        """
+        The unsaved notifications of an order status change, built from an
+        order whose buyer, driver and their users are loaded and a product
+        whose seller and user are loaded, without further queries
+        """
+        buyer = order.buyer.user
+        seller = product.seller.user
+        driver = order.driver.user if order.driver else None
+        driver_name = driver.username if driver else "System"
+
+        def notification(recipient, notification_type, message, sender_name):
+            return Notification(
                 recipient=recipient,
                 notification_type=notification_type,
                 message=message,
-                related_order_id=related_order_id,
+                related_order_id=order.id,
                 sender_name=sender_name
             )
-            return notification
-        except CustomUser.DoesNotExist:
-            return None
-    
+
+        status = status.lower()
+        if status == 'pending':
+            # Notify seller when buyer places order
+            return [notification(seller, 'order_placed', f"{buyer.username} ordered {product.name}", buyer.username)]
+
+        if status == 'accepted':
+            # Notify buyer when seller accepts order, and the driver if one is assigned
+            notifications = [
+                notification(buyer, 'order_accepted', f"Your order for {product.name} has been accepted", seller.username)
+            ]
+            if driver:
+                notifications.append(notification(
+                    driver, 'driver_assigned', f"You've been assigned to deliver {product.name}", seller.username
+                ))
+            return notifications
+
+        if status in ('shipped', 'on_route'):
+            # Notify buyer and seller that order is shipped
+            return [
+                notification(buyer, 'order_shipped', f"Your order for {product.name} is on the way", driver_name),
+                notification(seller, 'order_shipped', f"Your {product.name} order has been shipped", driver_name),
+            ]
+
+        if status == 'delivered':
+            # Notify buyer and seller, and the driver if there is one, plus the payments
+            notifications = [
+                notification(buyer, 'order_delivered', f"Your order for {product.name} has been delivered", driver_name),
+                notification(seller, 'order_delivered', f"The {product.name} order has been delivered", driver_name),
+                notification(seller, 'payment_received', f"Your payment for {product.name} is also done", "System"),
+            ]
+            if driver:
+                notifications += [
+                    notification(driver, 'order_delivered', f"You've successfully delivered {product.name}", "System"),
+                    notification(driver, 'payment_received',
+                                 f"Your payment for delivering {product.name} is also done", "System"),
+                ]
+            return notifications
+
+        return []
+
     @staticmethod
     def create_order_notification(order_id, status):
-        """Create notifications based on order status changes"""
-        try:
-            order = Order.objects.get(id=order_id)
-            
-            # Get the associated product (first one)
-            product = order.product.first()
-            if not product:
-                return False
-                
-            if status.lower() == 'pending':
-                # Notify seller when buyer places order
-                seller_user = product.seller.user
-                NotificationService.create_notification(
-                    recipient_id=seller_user.id,
-                    notification_type='order_placed',
-                    message=f"{order.buyer.user.username} ordered {product.name}",
-                    related_order_id=order.id,
-                    sender_name=order.buyer.user.username
-                )
-                
-            elif status.lower() == 'accepted':
-                # Notify buyer when seller accepts order
-                NotificationService.create_notification(
-                    recipient_id=order.buyer.user.id,
-                    notification_type='order_accepted',
-                    message=f"Your order for {product.name} has been accepted",
-                    related_order_id=order.id,
-                    sender_name=product.seller.user.username
-                )
-                
-                # If driver assigned, notify driver
-                if order.driver:
-                    NotificationService.create_notification(
-                        recipient_id=order.driver.user.id,
-                        notification_type='driver_assigned',
-                        message=f"You've been assigned to deliver {product.name}",
-                        related_order_id=order.id,
-                        sender_name=product.seller.user.username
-                    )
-                    
-            elif status.lower() in ['shipped', 'on_route']:
-                # Notify buyer that order is shipped
-                NotificationService.create_notification(
-                    recipient_id=order.buyer.user.id,
-                    notification_type='order_shipped',
-                    message=f"Your order for {product.name} is on the way",
-                    related_order_id=order.id,
-                    sender_name=order.driver.user.username if order.driver else "System"
-                )
-                
-                # Notify seller that order is shipped
-                NotificationService.create_notification(
-                    recipient_id=product.seller.user.id,
-                    notification_type='order_shipped',
-                    message=f"Your {product.name} order has been shipped",
-                    related_order_id=order.id,
-                    sender_name=order.driver.user.username if order.driver else "System"
-                )
-                
-            elif status.lower() == 'delivered':
-                # Notify buyer that order is delivered
-                NotificationService.create_notification(
-                    recipient_id=order.buyer.user.id,
-                    notification_type='order_delivered',
-                    message=f"Your order for {product.name} has been delivered",
-                    related_order_id=order.id,
-                    sender_name=order.driver.user.username if order.driver else "System"
-                )
-                
-                # Notify seller that order is delivered
-                NotificationService.create_notification(
-                    recipient_id=product.seller.user.id,
-                    notification_type='order_delivered',
-                    message=f"The {product.name} order has been delivered",
-                    related_order_id=order.id,
-                    sender_name=order.driver.user.username if order.driver else "System"
-                )
-                
-                # Send payment notification to seller
-                NotificationService.create_notification(
-                    recipient_id=product.seller.user.id,
-                    notification_type='payment_received',
-                    message=f"Your payment for {product.name} is also done",
-                    related_order_id=order.id,
-                    sender_name="System"
-                )
-                
-                # Notify driver that order is delivered (if there is a driver)
-                if order.driver:
-                    NotificationService.create_notification(
-                        recipient_id=order.driver.user.id,
-                        notification_type='order_delivered',
-                        message=f"You've successfully delivered {product.name}",
-                        related_order_id=order.id,
-                        sender_name="System"
-                    )
-                    
-                    # Send payment notification to driver
-                    NotificationService.create_notification(
-                        recipient_id=order.driver.user.id,
-                        notification_type='payment_received',
-                        message=f"Your payment for delivering {product.name} is also done",
-                        related_order_id=order.id,
-                        sender_name="System"
-                    )
-                
-            return True
-            
-        except Order.DoesNotExist:
+        """
+        Create notifications based on order status changes: one query loads
+        the order, its first product and every recipient, one INSERT writes
+        the notifications
+        """
+        link = (
+            Order.product.through.objects
+            .select_related('order__buyer__user', 'order__driver__user', 'product__seller__user')
+            .filter(order_id=order_id)
+            .order_by('product_id')
+            .first()
+        )
+        if link is None:
+            # Unknown order, or one without products
             return False
 
+        notifications = NotificationService.build_order_notifications(link.order, link.product, status)
+        if notifications:
+            with transaction.atomic():
+                Notification.objects.bulk_create(notifications)
+                unread_counter.count_new(notifications)
+                announce(notifications)
+        return True
+
     @staticmethod
     def create_new_product_notification(product):
-        """Create notifications for all buyers when a new product is added"""
+        """Tell all buyers about a new product with one broadcast"""
         try:
-            # Get all users who are buyers
-            buyers = CustomUser.objects.filter(is_buyer=True)
-            
             product_type = product.product_type if hasattr(product, 'product_type') and product.product_type else "product"
             product_name = product.name if hasattr(product, 'name') and product.name else "Product"
+
+            broadcast(
+                BroadcastNotification.BUYERS,
+                'new_product',
+                f"New {product_type} available: {product_name}",
+                sender_name=product.seller.user.username if hasattr(product, 'seller') and product.seller else "A seller",
+                related_product=product,
+            )
             
-            # Create a notification for each buyer
-            for buyer in buyers:
-                message = f"New {product_type} available: {product_name}"
-                Notification.objects.create(
-                    recipient=buyer,
-                    notification_type='new_product',
-                    message=message,
-                    sender_name=product.seller.user.username if hasattr(product, 'seller') and product.seller else "A seller"
-                )
-            
-            print(f"Created notifications for {len(buyers)} buyers about new product: {product_name}")
+            logger.info("Broadcast new product to buyers: %s", product_name)
             return True
-        except Exception as e:
-            print(f"Error creating new product notifications: {str(e)}")
+        except Exception:
+            logger.exception("Error creating new product notifications")
             return False
@@ -0,0 +1,84 @@
+"""
+Server-side order filters shared by the order list and the status counts.
+
+?status=     one or more statuses, comma separated (any spelling accepted
+             by api/order_status.py)
+?date_from=  orders placed at or after this date or datetime (ISO 8601)
+?date_to=    orders placed at or before it; a plain date includes the day
+?driver=     the driver's user id, or "none" for unassigned orders
+
+Buyer and driver lists are served by the (buyer|driver, status,
+order_date) indexes of Order.
+"""
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from .models import Order
+from .order_status import normalize_status
+
+
+def visible_orders(user):
+    """The orders the user may see by role, an empty queryset for anyone else"""
+    if user.is_buyer:
+        buyer_profile = getattr(user, 'buyerprofile', None)
+        if buyer_profile:
+            return Order.objects.filter(buyer=buyer_profile)
+    elif user.is_seller:
+        # Seller can see orders for their products, through the SellerOrder index
+        seller_profile = getattr(user, 'sellerprofile', None)
+        if seller_profile:
+            return Order.objects.filter(seller_links__seller=seller_profile)
+    elif user.is_driver:
+        driver_profile = getattr(user, 'driverprofile', None)
+        if driver_profile:
+            return Order.objects.filter(driver=driver_profile)
+    return Order.objects.none()
+
+
+def _parse_bound(name, value):
+    """Return (aware datetime, whether value was a plain date)"""
+    try:
+        # parse_datetime would also accept a plain date, as midnight
+        day = parse_date(value)
+        is_day = day is not None
+        moment = datetime.combine(day, time.min) if is_day else parse_datetime(value)
+        if moment is None:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, is_day
+
+
+def filter_orders(queryset, params, by_status=True):
+    """Apply the query parameters above, raising ValidationError on bad values"""
+    if by_status and params.get('status'):
+        statuses = set()
+        for value in params['status'].split(','):
+            status = normalize_status(value)
+            if status is None:
+                raise ValidationError({'status': f"Unknown status: {value.strip()}"})
+            statuses.add(status)
+        queryset = queryset.filter(status__in=sorted(statuses))
+
+    if params.get('date_from'):
+        date_from, _ = _parse_bound('date_from', params['date_from'])
+        queryset = queryset.filter(order_date__gte=date_from)
+    if params.get('date_to'):
+        date_to, is_day = _parse_bound('date_to', params['date_to'])
+        if is_day:
+            queryset = queryset.filter(order_date__lt=date_to + timedelta(days=1))
+        else:
+            queryset = queryset.filter(order_date__lte=date_to)
+
+    driver = params.get('driver')
+    if driver:
+        if driver.lower() == 'none':
+            queryset = queryset.filter(driver__isnull=True)
+        elif driver.isdigit():
+            queryset = queryset.filter(driver_id=int(driver))
+        else:
+            raise ValidationError({'driver': "Expected a driver id or 'none'."})
+    return queryset
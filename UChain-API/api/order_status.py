@@ -0,0 +1,84 @@
+"""
+Order status state machine.
+
+Every status change goes through transition(), which applies it as one
+conditional UPDATE ... WHERE status IN (<states allowed to move there>).
+Two writers racing on the same order therefore never overwrite each other:
+the loser's UPDATE matches no row and is a no-op, and since no transition
+leads back from a delivered state, a late tracking ping can never revert a
+delivery the buyer already confirmed.
+
+Each change also writes an OrderEvent in the same transaction, and the side
+effects (notifications, stock) run from there, see api/outbox.py.
+"""
+from django.db import transaction
+from django.utils import timezone
+from .models import Order, OrderEvent
+
+# Legal moves, forward only and one step at a time: the seller accepts, the
+# driver picks up and arrives, the buyer confirms. Two steps may be skipped:
+# a driver can arrive at an accepted order without having reported the
+# pickup, and a buyer can confirm a shipped order before the driver reports
+# the arrival. Delivered and Cancelled are terminal; orders can only be
+# cancelled before they ship.
+TRANSITIONS = {
+    Order.PENDING: {Order.ACCEPTED, Order.CANCELLED},
+    Order.ACCEPTED: {Order.SHIPPED, Order.DRIVER_DELIVERED, Order.CANCELLED},
+    Order.SHIPPED: {Order.DRIVER_DELIVERED, Order.DELIVERED},
+    Order.DRIVER_DELIVERED: {Order.DELIVERED},
+    Order.DELIVERED: set(),
+    Order.CANCELLED: set(),
+}
+
+# Spellings sent by clients (and stored by older code), matched case-insensitively
+_ALIASES = {
+    'pending': Order.PENDING,
+    'accepted': Order.ACCEPTED,
+    'shipped': Order.SHIPPED,
+    'on_route': Order.SHIPPED,
+    'picked_up': Order.SHIPPED,
+    'driver_delivered': Order.DRIVER_DELIVERED,
+    'delivered': Order.DELIVERED,
+    'cancelled': Order.CANCELLED,
+    'canceled': Order.CANCELLED,
+}
+
+
+def normalize_status(value):
+    """Return the canonical status for a client or legacy spelling, or None"""
+    if not value:
+        return None
+    return _ALIASES.get(str(value).strip().lower())
+
+
+def can_transition(current, target):
+    return normalize_status(target) in TRANSITIONS.get(normalize_status(current), set())
+
+
+def transition(order, target, from_statuses=None):
+    """
+    Move an order to the target status if that is legal from its current
+    status in the database. from_statuses narrows the states the move is
+    accepted from. Returns True if this call changed the status; on False
+    the order was left untouched and the instance's status may be stale.
+    """
+    target = normalize_status(target)
+    if target is None:
+        raise ValueError("Unknown order status")
+
+    sources = [source for source, targets in TRANSITIONS.items() if target in targets]
+    if from_statuses is not None:
+        allowed = {normalize_status(status) for status in from_statuses}
+        sources = [source for source in sources if source in allowed]
+
+    changes = {'status': target}
+    if target == Order.DELIVERED:
+        changes['delivered_at'] = timezone.now()
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, status__in=sources).update(**changes)
+        if updated:
+            OrderEvent.objects.create(order_id=order.pk, status=target)
+    if updated:
+        for field, value in changes.items():
+            setattr(order, field, value)
+    return bool(updated)
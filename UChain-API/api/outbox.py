@@ -0,0 +1,164 @@
+"""
+Order event outbox.
+
+transition() writes an OrderEvent in the same transaction as the status
+change, so an event exists exactly when the change was committed. The
+process_order_events command hands the events to the handlers registered
+here, off the request path:
+
+- At least once: an event is marked processed in the transaction that runs
+  its handlers. A failure rolls the handlers' writes back and the event is
+  retried after a backoff; handlers must tolerate running again.
+- Per-order ordering: the events of one order are handled in id order by a
+  single thread, and a failed event holds back the later events of its
+  order until it succeeds. Different orders run in parallel.
+
+Workers claim events with a lease (available_at pushed into the future),
+so several worker processes can share the table.
+"""
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from .models import Order, OrderEvent
+from .inventory import commit_stock, release_stock
+from .notification_views import NotificationService
+from .sales import record_order_sales
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Longest wait before a failed event is retried
+MAX_BACKOFF_SECONDS = 300
+
+HANDLERS = []
+
+
+def handler(func):
+    """Register func(event) to run for every order event"""
+    HANDLERS.append(func)
+    return func
+
+
+@handler
+def notify(event):
+    NotificationService.create_order_notification(event.order_id, event.status)
+
+
+@handler
+def settle_stock(event):
+    if event.status in (Order.DRIVER_DELIVERED, Order.DELIVERED):
+        updated = commit_stock(event.order)
+        if updated:
+            logger.info(f"Took {event.order.quantity_value} off the stock of {updated} products for order {event.order_id}")
+    elif event.status == Order.CANCELLED:
+        release_stock(event.order)
+
+
+@handler
+def record_sales(event):
+    if event.status == Order.DELIVERED:
+        record_order_sales(event.order)
+
+
+def claim_batch(limit, token):
+    """
+    Lease up to limit pending events to the worker token. Events behind an
+    earlier pending event of their order that is not available (leased or
+    backing off) are skipped, so an order's events are never handled out of
+    order, and leased or stuck events never take up a worker's batch.
+    """
+    now = timezone.now()
+    earlier = OrderEvent.objects.filter(
+        order_id=OuterRef('order_id'), id__lt=OuterRef('id'), processed_at__isnull=True
+    )
+    ids = list(
+        OrderEvent.objects.filter(processed_at__isnull=True, available_at__lte=now)
+        .exclude(Exists(earlier.filter(available_at__gt=now)))
+        .order_by('id').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    lease = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+    OrderEvent.objects.filter(id__in=ids, processed_at__isnull=True, available_at__lte=now).update(
+        available_at=lease, claimed_by=token
+    )
+    # Another worker may have leased an earlier event of the order in between, give the later ones back
+    OrderEvent.objects.filter(id__in=ids, claimed_by=token).filter(
+        Exists(earlier.exclude(claimed_by=token))
+    ).update(available_at=now, claimed_by='')
+    return list(
+        OrderEvent.objects.filter(id__in=ids, claimed_by=token, processed_at__isnull=True)
+        .select_related('order').order_by('id')
+    )
+
+
+def handle_events(events, token):
+    """Run the handlers for one order's events in order, stopping at the first failure"""
+    handled = 0
+    for index, event in enumerate(events):
+        try:
+            with transaction.atomic():
+                for func in HANDLERS:
+                    func(event)
+                # Lost leases are not marked, the new owner handles the event again
+                OrderEvent.objects.filter(pk=event.pk, claimed_by=token).update(
+                    processed_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+                )
+            handled += 1
+        except Exception as e:
+            logger.error(f"Order event {event.pk} for order {event.order_id} failed: {str(e)}")
+            delay = min(2 ** event.attempts, MAX_BACKOFF_SECONDS)
+            OrderEvent.objects.filter(pk=event.pk, claimed_by=token).update(
+                attempts=F('attempts') + 1, last_error=str(e)[:1000],
+                available_at=timezone.now() + timedelta(seconds=delay),
+            )
+            # Give the later events back, they wait behind this one anyway
+            OrderEvent.objects.filter(pk__in=[later.pk for later in events[index + 1:]], claimed_by=token).update(
+                available_at=timezone.now(), claimed_by=''
+            )
+            break
+    return handled
+
+
+def _handle_in_thread(events, token):
+    # Pool threads keep their own connection, drop it when it is stale or broken
+    close_old_connections()
+    try:
+        return handle_events(events, token)
+    finally:
+        close_old_connections()
+
+
+def process_batch(limit=None, executor=None, token=None):
+    """
+    Claim and handle one batch of events, the orders in parallel on the
+    executor if one is given. Returns (events claimed, events handled).
+    """
+    token = token or uuid.uuid4().hex
+    events = claim_batch(limit or settings.OUTBOX_BATCH_SIZE, token)
+
+    groups = {}
+    for event in events:
+        groups.setdefault(event.order_id, []).append(event)
+
+    if executor is None:
+        handled = sum(handle_events(group, token) for group in groups.values())
+    else:
+        futures = [executor.submit(_handle_in_thread, group, token) for group in groups.values()]
+        handled = sum(future.result() for future in futures)
+    return len(events), handled
+
+
+def purge_processed(older_than, limit=1000):
+    """Delete up to limit events processed before older_than. Returns the number deleted."""
+    ids = list(
+        OrderEvent.objects.filter(processed_at__lt=older_than)
+        .order_by('id').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return 0
+    return OrderEvent.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Keyset pagination that only applies when the client asks for it with
+    ?cursor= or ?page_size=, so existing clients keep receiving a plain list.
+    Pages are fetched with a WHERE on the ordering column instead of an
+    OFFSET, so deep pages cost the same as the first.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class OrderCursorPagination(OptionalCursorPagination):
+    # id breaks ties between orders placed in the same instant
+    ordering = ('-order_date', '-id')
@@ -0,0 +1,61 @@
+"""
+Payment references.
+
+Chapa transactions are recorded in PaymentTransaction, keyed by their
+unique tx_ref. Orders used to carry the reference in their quantity text
+("1 [TX:<tx_ref>]"); split_tx_ref reads that legacy format, which
+migration 0017 moves into the table.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from django.utils import timezone
+from .models import BuyerProfile, PaymentTransaction, Product
+
+TX_MARKER_PATTERN = re.compile(r'\s*\[TX:([^\]]+)\]')
+
+
+def split_tx_ref(quantity):
+    """Return (quantity without the [TX:...] marker, tx_ref or None)"""
+    match = TX_MARKER_PATTERN.search(quantity or '')
+    if not match:
+        return quantity, None
+    return TX_MARKER_PATTERN.sub('', quantity, count=1).strip(), match.group(1).strip()
+
+
+def record_payment(tx_ref, user=None, product_id=None, amount=None):
+    """Create or refresh the row of an initialized payment"""
+    buyer = BuyerProfile.objects.filter(user_id=user.id).first() if user and user.is_authenticated else None
+    product = Product.objects.filter(pk=product_id).first() if str(product_id or '').isdigit() else None
+    try:
+        amount = Decimal(str(amount)) if amount not in (None, '') else None
+    except InvalidOperation:
+        amount = None
+    defaults = {'amount': amount}
+    if buyer:
+        defaults['buyer'] = buyer
+    if product:
+        defaults['product'] = product
+    payment, _ = PaymentTransaction.objects.update_or_create(tx_ref=tx_ref, defaults=defaults)
+    return payment
+
+
+def link_payment(tx_ref, order, product=None):
+    """Attach the order (and product) a payment was made for, creating the row if needed"""
+    defaults = {'order': order, 'buyer_id': order.buyer_id}
+    if product:
+        defaults['product'] = product
+    payment, _ = PaymentTransaction.objects.update_or_create(tx_ref=tx_ref, defaults=defaults)
+    return payment
+
+
+def find_payment(tx_ref):
+    """The payment with its order and product, or None"""
+    if not tx_ref:
+        return None
+    return PaymentTransaction.objects.select_related('order', 'product').filter(tx_ref=tx_ref).first()
+
+
+def mark_payment(tx_ref, succeeded):
+    """Store a verification result. Returns the number of payments updated (0 or 1)."""
+    new_status = PaymentTransaction.SUCCESS if succeeded else PaymentTransaction.FAILED
+    return PaymentTransaction.objects.filter(tx_ref=tx_ref).update(status=new_status, updated_at=timezone.now())
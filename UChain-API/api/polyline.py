@@ -0,0 +1,68 @@
+"""
+Compact coordinate encodings for tracking history and route geometry.
+
+- Encoded polyline: Google's polyline algorithm (precision 1e-5 degrees),
+  decodable by common map libraries such as Leaflet plugins.
+- Packed int32: little-endian int32 pairs of latitude and longitude in
+  1e-7 degrees, the precision TrackingLocation stores.
+
+Both take an (N, 2) array of [latitude, longitude] rows.
+"""
+import numpy as np
+
+POLYLINE_PRECISION = 5
+INT32_SCALE = 10 ** 7
+# Enough 5-bit chunks for any zigzagged delta of valid coordinates
+_MAX_CHUNKS = 7
+
+
+def encode_polyline(points, precision=POLYLINE_PRECISION):
+    """Encode [lat, lng] rows as a Google encoded polyline string"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if not len(points):
+        return ""
+
+    fixed = np.round(points * 10 ** precision).astype(np.int64)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = (deltas << 1) ^ (deltas >> 63)
+
+    # Split every value into 5-bit chunks, least significant first
+    shifts = np.arange(_MAX_CHUNKS, dtype=np.int64) * 5
+    chunks = (values[:, None] >> shifts) & 0x1F
+    remaining = values[:, None] >> shifts
+    # A chunk is emitted if it or any higher chunk is non-zero (at least one per value)
+    emitted = remaining > 0
+    emitted[:, 0] = True
+    # Every emitted chunk except a value's last one carries the continuation bit
+    has_next = np.zeros_like(emitted)
+    has_next[:, :-1] = emitted[:, 1:]
+
+    characters = (chunks | (has_next * 0x20)) + 63
+    return characters[emitted].astype(np.uint8).tobytes().decode('ascii')
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    """Decode a Google encoded polyline string into an (N, 2) float array"""
+    values = []
+    value = shift = 0
+    for character in encoded.encode('ascii'):
+        chunk = character - 63
+        value |= (chunk & 0x1F) << shift
+        shift += 5
+        if not chunk & 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+
+    deltas = np.asarray(values, dtype=np.int64).reshape(-1, 2)
+    return np.cumsum(deltas, axis=0) / 10 ** precision
+
+
+def pack_int32(points):
+    """Pack [lat, lng] rows as little-endian int32 pairs in 1e-7 degrees"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return np.round(points * INT32_SCALE).astype('<i4').tobytes()
+
+
+def unpack_int32(data):
+    """Unpack bytes produced by pack_int32 into an (N, 2) float array"""
+    return np.frombuffer(data, dtype='<i4').reshape(-1, 2) / INT32_SCALE
@@ -0,0 +1,138 @@
+"""
+Minimal publish/subscribe used to push live updates to streaming clients.
+
+The default broker keeps subscribers in process memory, so it only reaches
+clients connected to the same ASGI worker. Deployments running several
+workers can point the PUBSUB_BROKER setting at a class exposing the same
+publish/subscribe interface on top of Redis or another message broker.
+"""
+import asyncio
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered per subscriber before the oldest ones are dropped
+DEFAULT_QUEUE_SIZE = 100
+
+
+def tracking_channel(order_id):
+    """Channel carrying new tracking positions of an order"""
+    return f"tracking.order.{order_id}"
+
+
+def notification_channel(user_id):
+    """Channel waking the notification feeds of a user"""
+    return f"notifications.user.{user_id}"
+
+
+def broadcast_channel(audience):
+    """Channel waking the notification feeds of an audience of broadcasts"""
+    return f"notifications.audience.{audience}"
+
+
+class Subscription:
+    """A subscriber's queue on one channel, used as an async context manager"""
+
+    def __init__(self, broker, channel, loop, queue):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = queue
+
+    async def get(self, timeout=None):
+        """Wait for the next message, raising asyncio.TimeoutError on timeout"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class InProcessBroker:
+    """
+    Thread-safe in-memory broker. Subscribers are asyncio queues owned by the
+    event loop of the streaming response, while publishers are usually sync
+    views running in a worker thread, so delivery is handed over to the
+    subscriber's loop. Idle subscribers just await their queue and cost no
+    CPU or database work until something is published.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel, queue_size=DEFAULT_QUEUE_SIZE):
+        """Subscribe to a channel from within a running event loop"""
+        subscription = Subscription(
+            self, channel, asyncio.get_running_loop(), asyncio.Queue(maxsize=queue_size)
+        )
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+    def publish(self, channel, message):
+        """Deliver a message to every subscriber of the channel"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription.queue, message)
+            except RuntimeError:
+                # The subscriber's event loop has been closed
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+    @staticmethod
+    def _deliver(queue, message):
+        if queue.full():
+            # Slow consumers only need the most recent messages
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker configured by PUBSUB_BROKER"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, 'PUBSUB_BROKER', 'api.pubsub.InProcessBroker'))
+                _broker = broker_class()
+    return _broker
+
+
+def publish_on_commit(channel, message):
+    """Publish once the current transaction commits, so subscribers never see rolled back data"""
+    def publish():
+        try:
+            get_broker().publish(channel, message)
+        except Exception as e:
+            logger.error(f"Error publishing to {channel}: {str(e)}")
+
+    transaction.on_commit(publish)
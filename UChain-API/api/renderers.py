@@ -0,0 +1,106 @@
+"""
+Compact renderers for endpoints returning coordinates.
+
+Clients opt in with an Accept header or the ?format= query parameter:
+
+- application/vnd.uchain.polyline (format=polyline): encoded polyline text
+- application/vnd.uchain.int32 (format=int32): packed little-endian int32
+  latitude/longitude pairs in 1e-7 degrees
+
+Points are emitted in the same order as the JSON representation. Anything
+else in the JSON body is dropped, except the history cursor which is sent
+in the X-Next-Cursor header.
+"""
+from abc import ABC, abstractmethod
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from .polyline import encode_polyline, pack_int32
+
+
+def _geometry_points(geometry):
+    """Collect [lat, lng] rows from a GeoJSON geometry, feature or collection"""
+    if not isinstance(geometry, dict):
+        return []
+
+    geometry_type = geometry.get('type')
+    if geometry_type == 'FeatureCollection':
+        return [point for feature in geometry.get('features') or [] for point in _geometry_points(feature)]
+    if geometry_type == 'Feature':
+        return _geometry_points(geometry.get('geometry'))
+    if geometry_type == 'LineString':
+        lines = [geometry.get('coordinates') or []]
+    elif geometry_type == 'MultiLineString':
+        lines = geometry.get('coordinates') or []
+    else:
+        return []
+
+    # GeoJSON positions are [longitude, latitude]
+    return [[position[1], position[0]] for line in lines for position in line]
+
+
+def extract_points(data):
+    """Return an (N, 2) array of [lat, lng] rows from a tracking or route payload"""
+    if isinstance(data, dict) and 'results' in data:
+        data = data['results']
+
+    if isinstance(data, dict):
+        points = _geometry_points(data.get('route_geometry'))
+        if not points and data.get('start_latitude') is not None:
+            # No stored geometry, fall back to the straight start/end line
+            points = [
+                [data['start_latitude'], data['start_longitude']],
+                [data['end_latitude'], data['end_longitude']],
+            ]
+    else:
+        points = [[row['latitude'], row['longitude']] for row in data or []]
+
+    return np.asarray(points, dtype=float).reshape(-1, 2)
+
+
+class CoordinatesRenderer(BaseRenderer, ABC):
+    """Base class for renderers that only keep the coordinates of a payload"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get('response')
+        if response is not None and isinstance(data, dict) and 'next_cursor' in data:
+            response['X-Next-Cursor'] = str(data['next_cursor'])
+        return self.encode(extract_points(data))
+
+    @abstractmethod
+    def encode(self, points):
+        """Return the body for an (N, 2) array of [lat, lng] rows"""
+
+
+class EncodedPolylineRenderer(CoordinatesRenderer):
+    media_type = 'application/vnd.uchain.polyline'
+    format = 'polyline'
+    charset = 'utf-8'
+
+    def encode(self, points):
+        return encode_polyline(points).encode(self.charset)
+
+
+class PackedInt32Renderer(CoordinatesRenderer):
+    media_type = 'application/vnd.uchain.int32'
+    format = 'int32'
+    charset = None
+    render_style = 'binary'
+
+    def encode(self, points):
+        return pack_int32(points)
+
+
+class CoordinateRenderersMixin:
+    """
+    Adds the compact coordinate renderers to an APIView. Error responses keep
+    their JSON body whatever format was negotiated.
+    """
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [EncodedPolylineRenderer, PackedInt32Renderer]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if response.status_code >= 400 and isinstance(getattr(request, 'accepted_renderer', None), CoordinatesRenderer):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,174 @@
+"""
+Live ETA: snap an order's latest position onto its DeliveryRoute.
+
+The route polyline is projected once into per-segment NumPy arrays
+(start/end points, lengths and the cumulative distance at each segment
+start). Snapping a position is then a single broadcast point-to-segment
+computation over every segment at once.
+
+Segment arrays are kept in a per-process LRU keyed by order. Saving a route
+writes its updated_at stamp to the shared cache, so every worker notices a
+changed route on its next ETA request; while the stamp matches, an ETA costs
+no database query at all.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .geo import project_to_meters, point_segment_distances
+from .models import DeliveryRoute
+from .renderers import extract_points
+from .tracking_cache import get_last_location
+
+
+def route_stamp_key(order_id):
+    return f"route:stamp:{order_id}"
+
+
+class RouteSegments:
+    """Projected segment arrays of one route polyline"""
+
+    def __init__(self, route):
+        self.route_id = route.id
+        self.stamp = route.updated_at.isoformat()
+        self.distance_km = route.distance_km
+        self.estimated_time_min = route.estimated_time_min
+
+        points = extract_points({
+            'route_geometry': route.route_geometry,
+            'start_latitude': route.start_latitude,
+            'start_longitude': route.start_longitude,
+            'end_latitude': route.end_latitude,
+            'end_longitude': route.end_longitude,
+        })
+        self.latitudes = points[:, 0]
+        self.longitudes = points[:, 1]
+        self.origin_latitude = float(self.latitudes.mean()) if len(points) else 0.0
+
+        x, y = project_to_meters(self.latitudes, self.longitudes, self.origin_latitude)
+        self.ax, self.ay = x[:-1], y[:-1]
+        self.bx, self.by = x[1:], y[1:]
+        self.lengths = np.hypot(self.bx - self.ax, self.by - self.ay)
+        # Distance along the route at the start of every segment
+        self.offsets = np.concatenate(([0.0], np.cumsum(self.lengths)[:-1])) if len(self.lengths) else self.lengths
+        self.total_m = float(self.lengths.sum())
+
+    def snap(self, latitude, longitude):
+        """
+        Project a position onto the nearest segment. Returns the snapped
+        latitude/longitude, the distance from the route and the distance
+        travelled along it, in meters.
+        """
+        px, py = project_to_meters(latitude, longitude, self.origin_latitude)
+        distances, t = point_segment_distances(px, py, self.ax, self.ay, self.bx, self.by)
+        nearest = int(np.argmin(distances))
+        fraction = t[nearest]
+
+        # Interpolating the coordinates is exact on the equirectangular plane
+        snapped_latitude = self.latitudes[nearest] + fraction * (self.latitudes[nearest + 1] - self.latitudes[nearest])
+        snapped_longitude = self.longitudes[nearest] + fraction * (self.longitudes[nearest + 1] - self.longitudes[nearest])
+        travelled = self.offsets[nearest] + fraction * self.lengths[nearest]
+        return float(snapped_latitude), float(snapped_longitude), float(distances[nearest]), float(travelled)
+
+
+_segments = OrderedDict()
+_segments_lock = threading.Lock()
+
+
+def _cache_size():
+    return getattr(settings, 'ROUTE_SEGMENT_CACHE_SIZE', 256)
+
+
+def _timeout():
+    return getattr(settings, 'TRACKING_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def remember_route(route):
+    """Publish a saved route's stamp so workers rebuild their segment arrays"""
+    cache.set(route_stamp_key(route.order_id), route.updated_at.isoformat(), _timeout())
+
+
+def get_route_segments(order_id):
+    """Return the RouteSegments of an order's latest route, or None without a route"""
+    stamp = cache.get(route_stamp_key(order_id))
+    with _segments_lock:
+        segments = _segments.get(order_id)
+        if segments is not None and stamp is not None and segments.stamp == stamp:
+            _segments.move_to_end(order_id)
+            return segments
+
+    route = DeliveryRoute.objects.filter(order_id=order_id).order_by('-created_at').first()
+    if route is None:
+        return None
+
+    segments = RouteSegments(route)
+    cache.set(route_stamp_key(order_id), segments.stamp, _timeout())
+    with _segments_lock:
+        _segments[order_id] = segments
+        _segments.move_to_end(order_id)
+        while len(_segments) > _cache_size():
+            _segments.popitem(last=False)
+    return segments
+
+
+def clear_route_segments():
+    with _segments_lock:
+        _segments.clear()
+
+
+def estimate_arrival(segments, location, now=None):
+    """Remaining distance and ETA for a serialized tracking location on a route"""
+    now = now or timezone.now()
+    snapped_latitude, snapped_longitude, off_route_m, travelled_m = segments.snap(
+        float(location['latitude']), float(location['longitude'])
+    )
+    progress = travelled_m / segments.total_m if segments.total_m else 1.0
+    remaining_fraction = 1.0 - progress
+
+    # Scale the stored road distance and duration when available, the polyline
+    # length and the default speed otherwise
+    if segments.distance_km:
+        remaining_km = remaining_fraction * segments.distance_km
+    else:
+        remaining_km = remaining_fraction * segments.total_m / 1000
+    if segments.estimated_time_min:
+        remaining_min = remaining_fraction * segments.estimated_time_min
+    else:
+        remaining_min = remaining_km / getattr(settings, 'ROUTE_DEFAULT_SPEED_KMH', 40) * 60
+
+    position_time = parse_datetime(location.get('timestamp') or '') or now
+    return {
+        'route_id': segments.route_id,
+        'position': {
+            'latitude': float(location['latitude']),
+            'longitude': float(location['longitude']),
+            'timestamp': location.get('timestamp'),
+        },
+        'snapped': {'latitude': round(snapped_latitude, 7), 'longitude': round(snapped_longitude, 7)},
+        'off_route_m': round(off_route_m, 1),
+        'progress': round(progress, 4),
+        'remaining_distance_km': round(remaining_km, 3),
+        'remaining_time_min': round(remaining_min, 1),
+        # A stale position already left that time behind, but the ETA never lies in the past
+        'eta': max(position_time + timedelta(minutes=remaining_min), now).isoformat(),
+    }
+
+
+def get_order_eta(order_id):
+    """
+    Return the live ETA of an order, or None with the reason it cannot be
+    computed ('route' or 'location' missing)
+    """
+    segments = get_route_segments(order_id)
+    if segments is None or not len(segments.lengths):
+        return None, 'route'
+
+    location = get_last_location(order_id)
+    if location is None:
+        return None, 'location'
+
+    return estimate_arrival(segments, location), None
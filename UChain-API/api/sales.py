@@ -0,0 +1,105 @@
+"""
+Seller sales rollups.
+
+SellerSalesDay holds revenue, units and delivered orders per seller,
+product and day of delivery. A delivered order is added once, by the
+outbox handler for its Delivered event: record_order_sales flips
+Order.sales_recorded with a compare-and-set UPDATE before touching the
+rollups, so a repeated event is a no-op. rebuild_sales recomputes every
+rollup from the delivered orders, e.g. for orders delivered before the
+rollups existed.
+
+Both lock the rows of the sellers they write for, always before any order
+row and in id order. A rebuild therefore waits for running increments to
+commit, and increments wait for the rebuild, so none is lost to it.
+
+Revenue is the product's current price times the ordered amount, the
+same for each product of an order.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import Order, SellerProfile, SellerSalesDay
+
+
+def _add(seller_id, product_id, day, revenue, units):
+    keys = {'seller_id': seller_id, 'product_id': product_id, 'day': day}
+    increments = {'revenue': F('revenue') + revenue, 'units': F('units') + units, 'orders': F('orders') + 1}
+    if SellerSalesDay.objects.filter(**keys).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            SellerSalesDay.objects.create(revenue=revenue, units=units, orders=1, **keys)
+    except IntegrityError:
+        # Another worker created the row first
+        SellerSalesDay.objects.filter(**keys).update(**increments)
+
+
+def _lock_sellers(seller_ids=None):
+    """Lock the given sellers' rows, or every seller's, in id order. Returns the locked ids."""
+    sellers = SellerProfile.objects.select_for_update().order_by('pk')
+    if seller_ids is not None:
+        sellers = sellers.filter(pk__in=seller_ids)
+    return list(sellers.values_list('pk', flat=True))
+
+
+def record_order_sales(order):
+    """Add a delivered order to its sellers' rollups. Returns False if it was already counted."""
+    with transaction.atomic():
+        lines = list(order.product.values_list('id', 'seller_id', 'price'))
+        _lock_sellers({seller_id for _, seller_id, _ in lines})
+        claimed = Order.objects.filter(pk=order.pk, status=Order.DELIVERED, sales_recorded=False).update(
+            sales_recorded=True
+        )
+        if not claimed:
+            return False
+
+        units = order.quantity_value or 0
+        day = timezone.localdate(order.delivered_at or order.order_date)
+        for product_id, seller_id, price in lines:
+            _add(seller_id, product_id, day, price * units, units)
+    return True
+
+
+def rebuild_sales(batch_size=2000):
+    """
+    Recompute the rollups of every seller from the delivered orders,
+    replacing only those sellers' rows. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        # Taken before the first plain read, so on MySQL the snapshot read
+        # below already sees every increment committed before the locks
+        seller_ids = _lock_sellers()
+        # Claim the orders first, so workers skip the ones counted here
+        Order.objects.filter(status=Order.DELIVERED, sales_recorded=False).update(sales_recorded=True)
+
+        units = Coalesce(F('order__quantity_value'), Value(0))
+        rows = (
+            Order.product.through.objects
+            .filter(order__status=Order.DELIVERED, order__sales_recorded=True, product__seller_id__in=seller_ids)
+            .annotate(day=TruncDate(Coalesce('order__delivered_at', 'order__order_date')))
+            .values('product__seller_id', 'product_id', 'day')
+            .annotate(
+                revenue=Sum(ExpressionWrapper(F('product__price') * units,
+                                              output_field=DecimalField(max_digits=14, decimal_places=2))),
+                units=Sum(units),
+                orders=Count('order_id'),
+            )
+            .order_by()
+        )
+
+        # Sellers who signed up since the locks keep the rows their increments wrote
+        SellerSalesDay.objects.filter(seller_id__in=seller_ids).delete()
+        written = 0
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(SellerSalesDay(
+                seller_id=row['product__seller_id'], product_id=row['product_id'], day=row['day'],
+                revenue=row['revenue'] or 0, units=row['units'] or 0, orders=row['orders'],
+            ))
+            if len(batch) >= batch_size:
+                written += len(SellerSalesDay.objects.bulk_create(batch))
+                batch = []
+        written += len(SellerSalesDay.objects.bulk_create(batch))
+    return written
@@ -0,0 +1,39 @@
+"""
+Maintenance of the SellerOrder index.
+
+Order.product changes are mirrored through m2m_changed (see api/signals.py).
+Code writing the product through table directly, e.g. with bulk_create,
+must call sync_seller_orders for the affected orders itself.
+"""
+from .models import Order, SellerOrder
+
+
+def sync_seller_orders(order_ids):
+    """Bring the SellerOrder rows of the given orders in line with their products"""
+    order_ids = set(order_ids)
+    if not order_ids:
+        return
+
+    wanted = set(
+        Order.product.through.objects.filter(order_id__in=order_ids)
+        .values_list('product__seller_id', 'order_id')
+        .distinct()
+    )
+    existing = set(SellerOrder.objects.filter(order_id__in=order_ids).values_list('seller_id', 'order_id'))
+
+    stale = existing - wanted
+    if stale:
+        for seller_id, order_id in stale:
+            SellerOrder.objects.filter(seller_id=seller_id, order_id=order_id).delete()
+
+    missing = wanted - existing
+    if missing:
+        SellerOrder.objects.bulk_create(
+            [SellerOrder(seller_id=seller_id, order_id=order_id) for seller_id, order_id in missing],
+            ignore_conflicts=True
+        )
+
+
+def seller_has_order(seller, order):
+    """Return True if one of the seller's products is part of the order"""
+    return SellerOrder.objects.filter(seller=seller, order=order).exists()
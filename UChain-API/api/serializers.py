@@ -1,6 +1,10 @@
 from rest_framework import serializers
-from .models import CustomUser, BuyerProfile, SellerProfile, DriverProfile, Product, Order, Message, Rating, TrackingLocation, DeliveryRoute, Notification
+from .models import CustomUser, BuyerProfile, SellerProfile, DriverProfile, Product, Order, Message, Rating, TrackingLocation, DeliveryRoute, Notification, BroadcastNotification
 from django.contrib.auth.hashers import make_password
+from django.conf import settings
+from django.db import transaction
+from .broadcasts import ID_PREFIX as BROADCAST_ID_PREFIX
+from .inventory import parse_product_quantity, parse_order_quantity, available_quantity, resize_reservation
 
 # Base User Serializer to register a user
 class CustomUserSerializer(serializers.ModelSerializer):
@@ -43,11 +47,22 @@ class DriverProfileSerializer(serializers.ModelSerializer):
 # Serializer for Product
 class ProductSerializer(serializers.ModelSerializer):
     seller = serializers.PrimaryKeyRelatedField(read_only=True)
+    quantity_available = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'quantity', 'product_type', 'image', 'seller']
-        read_only_fields = ['seller']  # Exclude 'seller' from writable fields
+        fields = ['id', 'name', 'description', 'price', 'quantity', 'quantity_value', 'quantity_unit',
+                  'quantity_reserved', 'quantity_available', 'product_type', 'image', 'seller']
+        read_only_fields = ['seller', 'quantity_value', 'quantity_unit', 'quantity_reserved']  # Exclude 'seller' from writable fields
+
+    def get_quantity_available(self, obj):
+        return available_quantity(obj)
+
+    def validate(self, attrs):
+        # Keep the numeric stock in step with the quantity text
+        if 'quantity' in attrs:
+            attrs['quantity_value'], attrs['quantity_unit'] = parse_product_quantity(attrs['quantity'])
+        return attrs
 
     def create(self, validated_data):
         # Getting authenticated user's profile
@@ -67,8 +82,14 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ["id", "quantity", "status", "order_date", "product", "driver", "buyer"]
-        read_only_fields = ["buyer"]
+        fields = ["id", "quantity", "quantity_value", "status", "order_date", "product", "driver", "buyer"]
+        read_only_fields = ["buyer", "quantity_value"]
+
+    def validate(self, attrs):
+        # Keep the numeric amount in step with the quantity text
+        if 'quantity' in attrs:
+            attrs['quantity_value'] = parse_order_quantity(attrs['quantity'])
+        return attrs
     
     def create(self, validated_data): 
         products = self.initial_data['product']
@@ -99,6 +120,32 @@ class OrderSerializer(serializers.ModelSerializer):
         order.product.set(productInstances)
         return order
 
+    def update(self, instance, validated_data):
+        # Write only the submitted fields, so an update never overwrites a
+        # status changed concurrently through api/order_status.py
+        with transaction.atomic():
+            if 'quantity_value' in validated_data and validated_data['quantity_value'] != instance.quantity_value:
+                # The held stock follows the new amount, or InsufficientStock rolls the edit back
+                resize_reservation(instance, validated_data['quantity_value'])
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if validated_data:
+                instance.save(update_fields=list(validated_data))
+        return instance
+
+# Serializers for a cart checkout, see api/checkout.py
+class CheckoutItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.CharField(max_length=100)
+
+    def validate(self, attrs):
+        attrs['quantity_value'] = parse_order_quantity(attrs['quantity'])
+        return attrs
+
+class CheckoutSerializer(serializers.Serializer):
+    items = CheckoutItemSerializer(many=True, allow_empty=False, max_length=settings.CHECKOUT_MAX_ITEMS)
+    driver = serializers.PrimaryKeyRelatedField(queryset=DriverProfile.objects.all(), required=False)
+
 # Serializer for Message
 class MessageSerializer(serializers.ModelSerializer):
     sender = serializers.SlugRelatedField(many=False, slug_field='username', queryset=CustomUser.objects.all())
@@ -121,8 +168,8 @@ class RatingSerializer(serializers.ModelSerializer):
 class TrackingLocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = TrackingLocation
-        fields = ['id', 'order', 'driver', 'latitude', 'longitude', 'timestamp', 'status']
-        read_only_fields = ['id', 'timestamp']
+        fields = ['id', 'order', 'driver', 'latitude', 'longitude', 'timestamp', 'last_seen', 'status']
+        read_only_fields = ['id', 'timestamp', 'last_seen']
 
 # Detailed Tracking Location Serializer with nested objects
 class TrackingLocationDetailSerializer(serializers.ModelSerializer):
@@ -152,8 +199,47 @@ class DeliveryRouteSerializer(serializers.ModelSerializer):
 # Serializer for Notification
 class NotificationSerializer(serializers.ModelSerializer):
     """Serializer for the Notification model"""
+    broadcast = serializers.SerializerMethodField()
+
     class Meta:
         model = Notification
         fields = ['id', 'notification_type', 'message', 'related_order', 
-                 'sender_name', 'is_read', 'created_at']
+                 'sender_name', 'is_read', 'created_at', 'broadcast']
         read_only_fields = ['id', 'created_at']
+
+    def get_broadcast(self, obj):
+        return False
+
+    def update(self, instance, validated_data):
+        # Write only the submitted fields, so a stale is_read is never saved
+        # back over a concurrent change, see NotificationViewSet.perform_update
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
+        return instance
+
+# Serializer for a BroadcastNotification in the shape of a Notification
+class BroadcastNotificationSerializer(serializers.ModelSerializer):
+    """Read state comes from the user's watermark, passed as context['watermark']"""
+    id = serializers.SerializerMethodField()
+    related_order = serializers.SerializerMethodField()
+    is_read = serializers.SerializerMethodField()
+    broadcast = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BroadcastNotification
+        fields = ['id', 'notification_type', 'message', 'related_order', 'related_product',
+                  'sender_name', 'is_read', 'created_at', 'broadcast']
+
+    def get_id(self, obj):
+        return f"{BROADCAST_ID_PREFIX}{obj.id}"
+
+    def get_related_order(self, obj):
+        return None
+
+    def get_is_read(self, obj):
+        return obj.id <= self.context.get('watermark', 0)
+
+    def get_broadcast(self, obj):
+        return True
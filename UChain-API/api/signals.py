@@ -0,0 +1,31 @@
+from django.db.models.signals import m2m_changed, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Order, Product
+from .seller_orders import sync_seller_orders
+
+
+@receiver(m2m_changed, sender=Order.product.through)
+def order_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+
+    if not reverse:
+        sync_seller_orders([instance.pk])
+    elif action == 'pre_clear':
+        # product.order_set.clear(): remember the orders before the rows go
+        instance._cleared_order_ids = list(instance.order_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        sync_seller_orders(getattr(instance, '_cleared_order_ids', []))
+    else:
+        sync_seller_orders(pk_set or [])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance, **kwargs):
+    # The through rows are deleted without m2m_changed
+    instance._deleted_order_ids = list(instance.order_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    sync_seller_orders(getattr(instance, '_deleted_order_ids', []))
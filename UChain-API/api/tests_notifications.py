@@ -0,0 +1,316 @@
+import asyncio
+from datetime import timedelta
+from io import StringIO
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from .models import (
+    CustomUser, BuyerProfile, SellerProfile, DriverProfile, Product, Order, Notification, BroadcastNotification,
+    NotificationCounter,
+)
+from .broadcasts import broadcast
+from .notification_retention import purge_notifications
+from .notification_views import NotificationService, NotificationViewSet
+from .serializers import NotificationSerializer
+from .unread_counter import add_unread
+
+
+class NotificationTestMixin:
+    """Creates a seller and a few buyers registered a day ago"""
+
+    def setUp(self):
+        self.seller_user = CustomUser.objects.create_user(username="seller", password="pass", is_seller=True)
+        self.seller = SellerProfile.objects.create(user=self.seller_user, tax_number="TX-1")
+        self.buyers = [self.create_buyer(f"buyer{i}") for i in range(3)]
+        self.buyer_user = self.buyers[0]
+        CustomUser.objects.update(registration_date=timezone.now() - timedelta(days=1))
+        for user in [self.seller_user] + self.buyers:
+            user.refresh_from_db()
+
+    def create_buyer(self, username):
+        user = CustomUser.objects.create_user(username=username, password="pass", is_buyer=True)
+        BuyerProfile.objects.create(user=user)
+        return user
+
+    def notify(self, user, message="Order update"):
+        return Notification.objects.create(recipient=user, notification_type="order_shipped", message=message)
+
+
+class BroadcastNotificationTest(NotificationTestMixin, APITestCase):
+    def create_product(self):
+        self.client.force_authenticate(user=self.seller_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse("product-create-view"), {
+                "name": "Teff", "description": "White teff", "price": "80.00",
+                "quantity": "20 bags", "product_type": "teff",
+            }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return len(context.captured_queries)
+
+    def unread(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.get(reverse("notification-unread-count")).data["count"]
+
+    def test_new_product_is_one_write_for_any_number_of_buyers(self):
+        # The first request also loads the seller profile of the user
+        self.create_product()
+        few = self.create_product()
+        for i in range(20):
+            self.create_buyer(f"late{i}")
+        many = self.create_product()
+        self.assertEqual(few, many)
+        self.assertEqual(BroadcastNotification.objects.count(), 3)
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_broadcasts_merge_into_the_list_newest_first(self):
+        self.notify(self.buyer_user, "older")
+        self.create_product()
+        self.notify(self.buyer_user, "newer")
+
+        self.client.force_authenticate(user=self.buyer_user)
+        data = self.client.get(reverse("notification-list")).data
+        self.assertEqual([item["message"] for item in data], ["newer", "New teff available: Teff", "older"])
+        self.assertEqual([item["broadcast"] for item in data], [False, True, False])
+        self.assertTrue(str(data[1]["id"]).startswith("b"))
+
+        # Not shown to sellers, nor to buyers who registered later
+        self.client.force_authenticate(user=self.seller_user)
+        self.assertEqual(self.client.get(reverse("notification-list")).data, [])
+        self.client.force_authenticate(user=self.create_buyer("newcomer"))
+        self.assertEqual(self.client.get(reverse("notification-list")).data, [])
+
+    def test_unread_count_follows_the_watermark(self):
+        self.notify(self.buyer_user)
+        self.create_product()
+        self.create_product()
+        self.assertEqual(self.unread(self.buyer_user), 3)
+        self.assertEqual(self.unread(self.buyers[1]), 2)
+
+        # Reading the newest broadcast reads the older ones too
+        newest = BroadcastNotification.objects.order_by("-id").first()
+        response = self.client.patch(reverse("notification-detail", args=[f"b{newest.id}"]), {"is_read": True}, format="json")
+        self.assertTrue(response.data["is_read"])
+        self.assertEqual(self.unread(self.buyers[1]), 0)
+        self.assertEqual(self.unread(self.buyer_user), 3)
+
+        self.client.post(reverse("notification-mark-all-read"))
+        self.assertEqual(self.unread(self.buyer_user), 0)
+        broadcast(BroadcastNotification.BUYERS, "new_product", "Another one")
+        self.assertEqual(self.unread(self.buyer_user), 1)
+
+    def test_deleting_a_broadcast_only_dismisses_it(self):
+        self.create_product()
+        notification = BroadcastNotification.objects.get()
+        self.client.force_authenticate(user=self.buyer_user)
+        response = self.client.delete(reverse("notification-detail", args=[f"b{notification.id}"]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(BroadcastNotification.objects.filter(pk=notification.pk).exists())
+        self.assertEqual(self.unread(self.buyer_user), 0)
+        self.assertEqual(self.unread(self.buyers[1]), 1)
+
+        self.client.force_authenticate(user=self.seller_user)
+        response = self.client.get(reverse("notification-detail", args=[f"b{notification.id}"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderNotificationTest(NotificationTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.driver_user = CustomUser.objects.create_user(username="driver", password="pass", is_driver=True)
+        driver = DriverProfile.objects.create(user=self.driver_user, license_number="DL-1", car_model="Isuzu")
+        self.product = Product.objects.create(
+            seller=self.seller, name="Teff", description="White teff", price=80, quantity="20 bags", product_type="teff"
+        )
+        self.order = Order.objects.create(buyer=self.buyer_user.buyerprofile, driver=driver, quantity="2")
+        self.order.product.add(self.product)
+
+    def test_delivered_fan_out_is_one_read_and_two_writes(self):
+        # The read, the notifications INSERT and the counters UPDATE, plus a savepoint around the writes
+        with self.assertNumQueries(5):
+            self.assertTrue(NotificationService.create_order_notification(self.order.id, "Delivered"))
+        recipients = sorted(Notification.objects.values_list("recipient__username", "notification_type"))
+        self.assertEqual(recipients, [
+            ("buyer0", "order_delivered"),
+            ("driver", "order_delivered"), ("driver", "payment_received"),
+            ("seller", "order_delivered"), ("seller", "payment_received"),
+        ])
+
+    def test_other_statuses(self):
+        NotificationService.create_order_notification(self.order.id, "Pending")
+        self.assertEqual(Notification.objects.get().recipient, self.seller_user)
+        with self.assertNumQueries(1):
+            # Nothing to send for a driver's delivery, nor for a missing order
+            self.assertTrue(NotificationService.create_order_notification(self.order.id, "Driver_Delivered"))
+        self.assertFalse(NotificationService.create_order_notification(self.order.id + 1, "Pending"))
+
+
+class UnreadCounterTest(NotificationTestMixin, APITestCase):
+    def unread(self):
+        self.client.force_authenticate(user=self.buyer_user)
+        return self.client.get(reverse("notification-unread-count")).data["count"]
+
+    def create(self, message="Order update"):
+        return NotificationService.create_notification(self.buyer_user.id, "order_shipped", message)
+
+    def test_counter_follows_every_write(self):
+        self.create()
+        # The first count creates the counter from the real count
+        self.assertEqual(self.unread(), 1)
+        self.assertEqual(NotificationCounter.objects.get(user=self.buyer_user).unread, 1)
+
+        first = self.create()
+        second = self.create()
+        self.assertEqual(NotificationCounter.objects.get(user=self.buyer_user).unread, 3)
+        self.client.force_authenticate(user=self.buyer_user)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.unread(), 3)
+        # The counter, the broadcast watermark and the broadcasts after it; no COUNT over notifications
+        self.assertFalse([query for query in context.captured_queries if "api_notification\"" in query["sql"]])
+
+        detail = reverse("notification-detail", args=[first.id])
+        self.client.patch(detail, {"is_read": True}, format="json")
+        self.client.patch(detail, {"is_read": True}, format="json")
+        self.assertEqual(self.unread(), 2)
+        self.client.patch(detail, {"is_read": False}, format="json")
+        self.assertEqual(self.unread(), 3)
+
+        self.client.delete(reverse("notification-detail", args=[second.id]))
+        self.assertEqual(self.unread(), 2)
+        self.client.patch(detail, {"is_read": True}, format="json")
+        self.client.delete(detail)
+        self.assertEqual(self.unread(), 1)
+
+        self.client.post(reverse("notification-mark-all-read"))
+        self.assertEqual(self.unread(), 0)
+        self.create()
+        self.assertEqual(self.unread(), 1)
+
+    def test_concurrent_reads_count_once(self):
+        notification = self.create()
+        self.create()
+        self.assertEqual(self.unread(), 2)
+        # Two requests that both loaded the notification while it was unread
+        for _ in range(2):
+            serializer = NotificationSerializer(notification, data={"is_read": True}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            view = NotificationViewSet()
+            view.perform_update(serializer)
+            notification.is_read = False
+        self.assertEqual(self.unread(), 1)
+
+    def test_decrements_stop_at_zero(self):
+        self.assertEqual(self.unread(), 0)
+        with CaptureQueriesContext(connection) as context:
+            add_unread({self.buyer_user.id: -3})
+        self.assertEqual(NotificationCounter.objects.get(user=self.buyer_user).unread, 0)
+        # Clamped with CASE, not GREATEST(unread - 3, 0): the unsigned column rejects the negative difference on MySQL
+        self.assertNotIn("MAX(", context.captured_queries[0]["sql"])
+
+    def test_reconcile_repairs_drift(self):
+        self.create()
+        self.assertEqual(self.unread(), 1)
+        # Written behind the counter's back
+        self.notify(self.buyer_user)
+        self.notify(self.buyer_user)
+        NotificationCounter.objects.create(user=self.buyers[1], unread=4)
+        self.assertEqual(self.unread(), 1)
+
+        call_command("reconcile_notification_counters", stdout=StringIO())
+        self.assertEqual(self.unread(), 3)
+        self.assertEqual(NotificationCounter.objects.get(user=self.buyers[1]).unread, 0)
+
+
+class NotificationFeedTest(NotificationTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.auth = {"Authorization": f"Token {Token.objects.create(user=self.buyer_user).key}"}
+
+    def poll(self, **params):
+        return self.client.get(reverse("notification-poll"), params, headers=self.auth).json()
+
+    def test_returns_newer_notifications_at_once(self):
+        older = self.notify(self.buyer_user, "older")
+        newer = self.notify(self.buyer_user, "newer")
+        latest = broadcast(BroadcastNotification.BUYERS, "new_product", "New teff")
+        self.notify(self.buyers[1], "not mine")
+
+        data = self.poll(since_id=older.id, since_broadcast_id=0, timeout=5)
+        self.assertEqual([item["message"] for item in data["notifications"]], ["newer", "New teff"])
+        self.assertEqual((data["since_id"], data["since_broadcast_id"]), (newer.id, latest.id))
+
+    def test_times_out_with_the_current_cursor(self):
+        latest = self.notify(self.buyer_user)
+        # Without a cursor the poll starts from now
+        data = self.poll(timeout=0)
+        self.assertEqual(data, {"notifications": [], "since_id": latest.id, "since_broadcast_id": 0})
+        self.assertEqual(self.client.get(reverse("notification-poll")).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse("notification-poll"), {"since_id": "x"}, headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_wakes_on_a_new_notification(self):
+        def create():
+            with self.captureOnCommitCallbacks(execute=True):
+                NotificationService.create_notification(self.buyer_user.id, "order_shipped", "On the way")
+
+        async def poll_while_creating():
+            waiting = asyncio.ensure_future(
+                self.async_client.get(reverse("notification-poll"), {"since_id": 0, "timeout": 10}, headers=self.auth)
+            )
+            # Let the poll find nothing and start waiting
+            await asyncio.sleep(0.2)
+            self.assertFalse(waiting.done())
+            await sync_to_async(create)()
+            return (await asyncio.wait_for(waiting, 5)).json()
+
+        data = async_to_sync(poll_while_creating)()
+        self.assertEqual([item["message"] for item in data["notifications"]], ["On the way"])
+
+
+class NotificationRetentionTest(NotificationTestMixin, APITestCase):
+    def aged(self, user, notification_type, days, is_read=True):
+        return Notification.objects.create(
+            recipient=user, notification_type=notification_type, message="Old", is_read=is_read,
+            created_at=timezone.now() - timedelta(days=days),
+        )
+
+    def test_purge_applies_the_policy_of_each_type(self):
+        expired = [
+            self.aged(self.buyer_user, "order_shipped", 40),
+            self.aged(self.buyer_user, "order_placed", 400),
+            self.aged(self.buyers[1], "order_shipped", 35, is_read=False),
+        ]
+        kept = [
+            self.aged(self.buyer_user, "order_delivered", 40),
+            self.aged(self.buyer_user, "order_placed", 20),
+            self.aged(self.buyer_user, "order_shipped", 10),
+        ]
+        policies = {"order_shipped": 30, "default": 60}
+
+        self.assertEqual(purge_notifications(policies, batch_size=2, dry_run=True), 3)
+        self.assertEqual(Notification.objects.count(), 6)
+        self.assertEqual(purge_notifications(policies, batch_size=2), 3)
+        self.assertEqual(
+            sorted(Notification.objects.values_list("id", flat=True)), [notification.id for notification in kept]
+        )
+        self.assertFalse(Notification.objects.filter(id__in=[n.id for n in expired]).exists())
+
+    def test_purge_keeps_unread_counters_and_stops_at_recent_rows(self):
+        self.aged(self.buyer_user, "order_shipped", 100, is_read=False)
+        self.aged(self.buyer_user, "order_shipped", 100, is_read=False)
+        self.client.force_authenticate(user=self.buyer_user)
+        self.notify(self.buyer_user)
+        self.assertEqual(self.client.get(reverse("notification-unread-count")).data["count"], 3)
+
+        call_command("purge_notifications", "--batch-size", "1", "--pause", "0", stdout=StringIO())
+        self.assertEqual(self.client.get(reverse("notification-unread-count")).data["count"], 1)
+
+        # Only recent rows are left: one batch looks at the first of them and stops
+        with self.assertNumQueries(1):
+            self.assertEqual(purge_notifications({"default": 1}, batch_size=1), 0)
+
@@ -0,0 +1,744 @@
+import importlib
+import io
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from unittest import mock
+from django.apps import apps
+from django.db import connection, OperationalError
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+from .models import CustomUser, BuyerProfile, SellerProfile, DriverProfile, Product, Order, StockReservation, SellerOrder, Notification, PaymentTransaction, OrderEvent, SellerSalesDay
+from .order_status import transition
+from .inventory import parse_product_quantity, parse_order_quantity, reserve_stock, InsufficientStock
+from .payments import split_tx_ref
+from .outbox import claim_batch, process_batch
+from .sales import rebuild_sales, record_order_sales
+from django.core.management import call_command
+
+
+class OrderTestMixin:
+    """Creates a buyer, a seller with two products and a driver"""
+
+    def setUp(self):
+        self.buyer_user = CustomUser.objects.create_user(username="buyer", password="pass", is_buyer=True)
+        self.seller_user = CustomUser.objects.create_user(username="seller", password="pass", is_seller=True)
+        self.driver_user = CustomUser.objects.create_user(username="driver", password="pass", is_driver=True)
+
+        self.buyer = BuyerProfile.objects.create(user=self.buyer_user)
+        self.seller = SellerProfile.objects.create(user=self.seller_user, tax_number="TX-1")
+        self.driver = DriverProfile.objects.create(user=self.driver_user, license_number="DL-1", car_model="Isuzu")
+
+        self.products = [
+            Product.objects.create(
+                seller=self.seller, name=name, description="Washed coffee",
+                price=100, quantity="50 kg", quantity_value=50, quantity_unit="kg", product_type="coffee"
+            )
+            for name in ("Yirgacheffe", "Sidamo")
+        ]
+
+    def create_orders(self, count, **kwargs):
+        orders = []
+        for _ in range(count):
+            order = Order.objects.create(buyer=self.buyer, driver=self.driver, quantity="5", quantity_value=5, **kwargs)
+            order.product.add(*self.products)
+            orders.append(order)
+        return orders
+
+    def run_outbox(self):
+        """Handle the waiting order events like the process_order_events worker"""
+        while process_batch()[0]:
+            pass
+
+
+class OrderListQueryCountTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("order-list-view")
+
+    def count_queries(self, user, params=None):
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.create_orders(2)
+        few, response = self.count_queries(self.buyer_user)
+        self.assertEqual(len(response.data), 2)
+
+        self.create_orders(20)
+        many, response = self.count_queries(self.buyer_user)
+        self.assertEqual(len(response.data), 22)
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.data[0]["product"]), 2)
+
+    def test_driver_and_seller_lists_are_constant(self):
+        self.create_orders(3)
+        for user in (self.driver_user, self.seller_user):
+            few, _ = self.count_queries(user)
+            self.create_orders(10)
+            many, _ = self.count_queries(user)
+            self.assertEqual(few, many)
+
+    def test_keyset_pages_walk_newest_first(self):
+        orders = self.create_orders(5)
+        _, response = self.count_queries(self.buyer_user, {"page_size": 2})
+        self.assertEqual([row["id"] for row in response.data["results"]], [orders[4].id, orders[3].id])
+
+        seen = [row["id"] for row in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen += [row["id"] for row in response.data["results"]]
+        self.assertEqual(seen, [order.id for order in reversed(orders)])
+
+    def test_plain_list_without_pagination_params(self):
+        self.create_orders(3)
+        _, response = self.count_queries(self.buyer_user)
+        self.assertIsInstance(response.data, list)
+
+
+class OrderFilterTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+        self.pending = self.create_orders(2)
+        self.shipped = self.create_orders(3, status=Order.SHIPPED)
+        self.unassigned = Order.objects.create(buyer=self.buyer, quantity="1", quantity_value=1, status=Order.DELIVERED)
+        Order.objects.filter(pk=self.pending[0].pk).update(order_date=datetime(2026, 1, 15, 10, tzinfo=dt_timezone.utc))
+
+    def list_ids(self, **params):
+        response = self.client.get(reverse("order-list-view"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {order["id"] for order in response.data}
+
+    def test_status_filter(self):
+        self.assertEqual(self.list_ids(status="Shipped"), {order.id for order in self.shipped})
+        self.assertEqual(self.list_ids(status="pending,delivered"), {order.id for order in self.pending} | {self.unassigned.id})
+
+    def test_date_range_filter(self):
+        self.assertEqual(self.list_ids(date_from="2026-01-01", date_to="2026-01-15"), {self.pending[0].id})
+        self.assertEqual(self.list_ids(date_to="2026-01-15T09:59:59Z"), set())
+        self.assertNotIn(self.pending[0].id, self.list_ids(date_from="2026-01-16"))
+
+    def test_driver_filter(self):
+        self.assertEqual(self.list_ids(driver="none"), {self.unassigned.id})
+        self.assertEqual(len(self.list_ids(driver=str(self.driver_user.id))), 5)
+
+    def test_invalid_filters_are_rejected(self):
+        for params in ({"status": "Lost"}, {"date_from": "yesterday"}, {"date_to": "2026-02-30"}, {"driver": "me"}):
+            response = self.client.get(reverse("order-list-view"), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_status_counts_in_one_query(self):
+        url = reverse("order-status-counts-view")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(response.data["total"], 6)
+        self.assertEqual(
+            (response.data["counts"][Order.PENDING], response.data["counts"][Order.SHIPPED], response.data["counts"][Order.CANCELLED]),
+            (2, 3, 0)
+        )
+        # Date and driver filters apply, a status filter does not
+        response = self.client.get(url, {"driver": "none", "status": "Pending"})
+        self.assertEqual((response.data["total"], response.data["counts"][Order.DELIVERED]), (1, 1))
+
+
+class SellerOrderIndexTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        other_user = CustomUser.objects.create_user(username="other-seller", password="pass", is_seller=True)
+        self.other_seller = SellerProfile.objects.create(user=other_user, tax_number="TX-2")
+        self.other_product = Product.objects.create(
+            seller=self.other_seller, name="Teff", description="White teff",
+            price=50, quantity="100 kg", product_type="teff"
+        )
+
+    def test_index_follows_order_products(self):
+        order = self.create_orders(1)[0]
+        self.assertEqual(set(order.seller_links.values_list("seller_id", flat=True)), {self.seller.pk})
+
+        order.product.add(self.other_product)
+        order.product.remove(*self.products)
+        self.assertEqual(set(order.seller_links.values_list("seller_id", flat=True)), {self.other_seller.pk})
+
+        self.other_product.order_set.clear()
+        self.assertFalse(order.seller_links.exists())
+
+    def test_deleting_a_product_drops_its_links(self):
+        order = self.create_orders(1)[0]
+        order.product.add(self.other_product)
+        self.other_product.delete()
+        self.assertEqual(set(order.seller_links.values_list("seller_id", flat=True)), {self.seller.pk})
+
+    def test_seller_lists_only_orders_of_own_products(self):
+        own = self.create_orders(2)
+        other = Order.objects.create(buyer=self.buyer, quantity="1")
+        other.product.add(self.other_product)
+
+        self.client.force_authenticate(user=self.seller_user)
+        response = self.client.get(reverse("order-list-view"))
+        self.assertEqual(sorted(row["id"] for row in response.data), sorted(order.id for order in own))
+
+    def test_seller_cannot_update_other_sellers_order(self):
+        other = Order.objects.create(buyer=self.buyer, quantity="1")
+        other.product.add(self.other_product)
+
+        self.client.force_authenticate(user=self.seller_user)
+        response = self.client.patch(reverse("order-update-view", args=[other.id]), {"quantity": "2"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderStatusTransitionTest(OrderTestMixin, APITestCase):
+    def test_forward_transitions_only(self):
+        order = self.create_orders(1)[0]
+        self.assertTrue(transition(order, Order.ACCEPTED))
+        self.assertTrue(transition(order, "on_route"))
+        self.assertEqual(order.status, Order.SHIPPED)
+        self.assertTrue(transition(order, Order.DELIVERED))
+        self.assertFalse(transition(order, Order.SHIPPED))
+        self.assertFalse(transition(order, Order.DRIVER_DELIVERED))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.DELIVERED)
+
+    def test_statuses_are_not_skipped(self):
+        order = self.create_orders(1)[0]
+        for target in (Order.SHIPPED, Order.DRIVER_DELIVERED, Order.DELIVERED):
+            self.assertFalse(transition(order, target))
+        self.assertTrue(transition(order, Order.ACCEPTED))
+        self.assertFalse(transition(order, Order.DELIVERED))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.ACCEPTED)
+
+    def test_stale_instance_does_not_downgrade(self):
+        order = self.create_orders(1, status=Order.SHIPPED)[0]
+        stale = Order.objects.get(pk=order.pk)
+        transition(order, Order.DELIVERED)
+
+        self.assertFalse(transition(stale, Order.SHIPPED))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.DELIVERED)
+
+    def test_update_view_rejects_illegal_transition(self):
+        order = self.create_orders(1, status=Order.DELIVERED)[0]
+        self.client.force_authenticate(user=self.buyer_user)
+        url = reverse("order-update-view", args=[order.id])
+
+        response = self.client.patch(url, {"status": "Shipped"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.patch(url, {"status": "bogus"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_fields_leave_the_status_unchanged(self):
+        order = self.create_orders(1, status=Order.SHIPPED)[0]
+        self.client.force_authenticate(user=self.buyer_user)
+        response = self.client.patch(
+            reverse("order-update-view", args=[order.id]), {"status": "Delivered", "driver": 999999}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.SHIPPED)
+        self.assertFalse(OrderEvent.objects.filter(order=order).exists())
+
+    def test_tracking_ping_does_not_revert_confirmed_delivery(self):
+        order = self.create_orders(1, status=Order.DELIVERED)[0]
+        self.client.force_authenticate(user=self.driver_user)
+        self.client.post(reverse("update-order-status", args=[order.id]), {"status": "on_route"}, format="json")
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.DELIVERED)
+
+
+class InventoryDecrementTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+
+    def deliver(self, order, status_value):
+        return self.client.patch(reverse("order-update-view", args=[order.id]), {"status": status_value}, format="json")
+
+    def test_quantity_parsing_rules(self):
+        self.assertEqual(parse_product_quantity("50 kg"), (50, "kg"))
+        self.assertEqual(parse_product_quantity("120bags"), (120, "bags"))
+        self.assertEqual(parse_product_quantity("plenty"), (None, ""))
+        self.assertEqual(parse_order_quantity("1 [TX:tx-42]"), 1)
+
+    def test_delivery_decrements_once_in_one_update(self):
+        order = self.create_orders(1, status=Order.SHIPPED)[0]
+        self.assertEqual(self.deliver(order, "Driver_Delivered").status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as context:
+            self.run_outbox()
+        product_updates = [q for q in context.captured_queries if q["sql"].startswith('UPDATE "api_product"')]
+        self.assertEqual(len(product_updates), 1)
+
+        # The buyer's confirmation does not take the stock a second time
+        self.deliver(order, "Delivered")
+        self.run_outbox()
+        for product in Product.objects.filter(id__in=[product.id for product in self.products]):
+            self.assertEqual((product.quantity_value, product.quantity), (45, "45 kg"))
+
+    def test_stock_never_goes_below_zero(self):
+        order = Order.objects.create(buyer=self.buyer, quantity="80", quantity_value=80, status=Order.SHIPPED)
+        order.product.add(self.products[0])
+        self.deliver(order, "Delivered")
+        with CaptureQueriesContext(connection) as context:
+            self.run_outbox()
+        self.products[0].refresh_from_db()
+        self.assertEqual((self.products[0].quantity_value, self.products[0].quantity), (0, "0 kg"))
+        # Clamped with CASE, not GREATEST(stock - amount, 0): unsigned columns reject the negative difference on MySQL
+        updates = [query["sql"] for query in context.captured_queries if query["sql"].startswith('UPDATE "api_product"')]
+        self.assertTrue(updates)
+        self.assertFalse([sql for sql in updates if "MAX(" in sql])
+
+    def test_serializer_parses_quantity_text(self):
+        self.client.force_authenticate(user=self.seller_user)
+        response = self.client.post(reverse("product-create-view"), {
+            "name": "Harar", "description": "Natural", "price": "120.00",
+            "quantity": "30 bags", "product_type": "coffee",
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data["quantity_value"], response.data["quantity_unit"]), (30, "bags"))
+
+
+class StockReservationTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+
+    def place(self, quantity):
+        return self.client.post(reverse("order-create-api-view"), {
+            "quantity": quantity, "product": [{"id": self.products[0].id}],
+        }, format="json")
+
+    def stock(self):
+        product = Product.objects.get(pk=self.products[0].id)
+        return product.quantity_value, product.quantity_reserved
+
+    def test_creating_an_order_reserves_stock(self):
+        response = self.place("20")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stock(), (50, 20))
+        self.assertEqual(StockReservation.objects.get(order_id=response.data["id"]).state, StockReservation.HELD)
+
+        response = self.client.get(reverse("product-retrieve-view", args=[self.products[0].id]))
+        self.assertEqual(response.data["quantity_available"], 30)
+
+    def test_overselling_is_rejected(self):
+        self.assertEqual(self.place("40").status_code, status.HTTP_201_CREATED)
+        response = self.place("20")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        # The rejected order is rolled back with its reservation
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.stock(), (50, 40))
+
+    def test_cancelling_releases_stock(self):
+        order_id = self.place("20").data["id"]
+        response = self.client.patch(reverse("order-update-view", args=[order_id]), {"status": "Cancelled"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.stock(), (50, 20))
+        self.run_outbox()
+        self.assertEqual(self.stock(), (50, 0))
+        self.assertEqual(StockReservation.objects.get(order_id=order_id).state, StockReservation.RELEASED)
+
+    def test_editing_the_quantity_moves_the_reservation(self):
+        order_id = self.place("20").data["id"]
+        url = reverse("order-update-view", args=[order_id])
+        self.assertEqual(self.client.patch(url, {"quantity": "30"}, format="json").status_code, status.HTTP_200_OK)
+        self.assertEqual(self.stock(), (50, 30))
+        self.client.patch(url, {"quantity": "5"}, format="json")
+        self.assertEqual(self.stock(), (50, 5))
+        self.assertEqual(StockReservation.objects.get(order_id=order_id).quantity, 5)
+
+        # More than is available leaves the order and its reservation as they were
+        response = self.client.patch(url, {"quantity": "60"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Order.objects.get(pk=order_id).quantity_value, 5)
+        self.assertEqual(self.stock(), (50, 5))
+
+        # The committed amount is the edited one
+        for status_value in ("Accepted", "Shipped", "Driver_Delivered", "Delivered"):
+            self.client.patch(url, {"status": status_value}, format="json")
+        self.run_outbox()
+        self.assertEqual(self.stock(), (45, 0))
+
+    def test_deleting_releases_stock(self):
+        order_id = self.place("20").data["id"]
+        response = self.client.delete(reverse("order-destroy-view", args=[order_id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.stock(), (50, 0))
+
+    def test_delivery_commits_reservation(self):
+        order_id = self.place("20").data["id"]
+        url = reverse("order-update-view", args=[order_id])
+        for status_value in ("Accepted", "Shipped", "Driver_Delivered", "Delivered"):
+            self.assertEqual(self.client.patch(url, {"status": status_value}, format="json").status_code, status.HTTP_200_OK)
+        self.run_outbox()
+        self.assertEqual(self.stock(), (30, 0))
+        self.assertEqual(Product.objects.get(pk=self.products[0].id).quantity, "30 kg")
+        self.assertEqual(StockReservation.objects.get(order_id=order_id).state, StockReservation.COMMITTED)
+
+        # A delivered order can no longer be cancelled to get its stock back
+        response = self.client.patch(url, {"status": "Cancelled"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.stock(), (30, 0))
+
+
+class CheckoutTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+        self.url = reverse("order-checkout-view")
+
+    def cart(self, count, quantity="1"):
+        return {"items": [{"product": self.products[i % 2].id, "quantity": quantity} for i in range(count)]}
+
+    def checkout(self, payload):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, payload, format="json")
+        return response, len(context.captured_queries)
+
+    def test_checkout_places_an_order_per_item(self):
+        response, _ = self.checkout(self.cart(3, quantity="4 kg"))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        orders = Order.objects.filter(buyer=self.buyer)
+        self.assertEqual(orders.count(), 3)
+        self.assertEqual({order.quantity_value for order in orders}, {4})
+        self.assertEqual([len(data["product"]) for data in response.data], [1, 1, 1])
+        self.assertEqual(SellerOrder.objects.filter(seller=self.seller).count(), 3)
+        self.run_outbox()
+        self.assertEqual(Notification.objects.filter(recipient=self.seller_user, notification_type="order_placed").count(), 3)
+        self.assertEqual(Product.objects.get(pk=self.products[0].id).quantity_reserved, 8)
+
+    def test_query_count_does_not_grow_with_cart(self):
+        _, few = self.checkout(self.cart(2))
+        _, many = self.checkout(self.cart(20))
+        self.assertEqual(few, many)
+        self.assertEqual(Order.objects.count(), 22)
+
+    def test_query_count_does_not_grow_without_bulk_returning(self):
+        # Like MySQL, which reports no ids for a multi-row INSERT
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            _, few = self.checkout(self.cart(2))
+            response, many = self.checkout(self.cart(20))
+        self.assertEqual(few, many)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([data["product"][0]["id"] for data in response.data], [self.products[i % 2].id for i in range(20)])
+
+    def test_short_stock_places_nothing(self):
+        response, _ = self.checkout(self.cart(6, quantity="20"))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(StockReservation.objects.count(), 0)
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_unknown_product_is_rejected(self):
+        response, _ = self.checkout({"items": [{"product": 9999, "quantity": "1"}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_only_buyers_check_out(self):
+        self.client.force_authenticate(user=self.seller_user)
+        response, _ = self.checkout(self.cart(1))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentReferenceTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+
+    def select_driver(self, tx_ref):
+        return self.client.post(reverse("select-driver-view"), {
+            "driver_id": self.driver_user.id, "transaction_reference": tx_ref, "product_id": self.products[0].id,
+        }, format="json")
+
+    def test_split_tx_ref(self):
+        self.assertEqual(split_tx_ref("1 [TX:tx-42]"), ("1", "tx-42"))
+        self.assertEqual(split_tx_ref("5 kg"), ("5 kg", None))
+
+    def test_driver_assignment_links_the_order_to_the_payment(self):
+        response = self.select_driver("tx-1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = Order.objects.get(pk=response.data["order_id"])
+        self.assertEqual(order.quantity, "1")
+        payment = PaymentTransaction.objects.get(tx_ref="tx-1")
+        self.assertEqual((payment.order_id, payment.product_id, payment.buyer_id), (order.id, self.products[0].id, self.buyer.pk))
+
+        # The same reference finds the same order instead of placing another
+        self.create_orders(5)
+        response = self.select_driver("tx-1")
+        self.assertEqual(response.data["order_id"], order.id)
+        self.assertEqual(Order.objects.count(), 6)
+
+    def test_reference_of_another_buyer_is_rejected(self):
+        other = BuyerProfile.objects.create(user=CustomUser.objects.create_user(username="other", password="pass", is_buyer=True))
+        order = Order.objects.create(buyer=other, quantity="1", quantity_value=1)
+        PaymentTransaction.objects.create(tx_ref="tx-2", order=order)
+        self.assertEqual(self.select_driver("tx-2").status_code, status.HTTP_409_CONFLICT)
+
+        # Nor can a buyer claim another buyer's payment that has no order yet
+        PaymentTransaction.objects.create(tx_ref="tx-3", buyer=other)
+        self.assertEqual(self.select_driver("tx-3").status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(PaymentTransaction.objects.get(tx_ref="tx-3").buyer_id, other.pk)
+
+    def test_verification_and_callback_store_the_result(self):
+        order = self.create_orders(1)[0]
+        PaymentTransaction.objects.create(tx_ref="tx-3", order=order)
+        with mock.patch("api.views.chapa.verify", return_value={"status": "success"}):
+            self.assertEqual(self.client.post(reverse("verify"), {"tx_ref": "tx-3"}, format="json").status_code, status.HTTP_200_OK)
+        self.assertEqual(PaymentTransaction.objects.get(tx_ref="tx-3").status, PaymentTransaction.SUCCESS)
+
+        with mock.patch("api.views.chapa.verify", return_value={"status": "failed"}):
+            response = self.client.get(reverse("payment-callback-view"), {"trx_ref": "tx-3"})
+        self.assertEqual((response.data["status"], response.data["order_id"]), (PaymentTransaction.FAILED, order.id))
+        self.assertEqual(self.client.get(reverse("payment-callback-view"), {"trx_ref": "nope"}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_migration_moves_markers_out_of_quantities(self):
+        order = Order.objects.create(buyer=self.buyer, quantity="1 [TX:GEN-20250101-7]", quantity_value=1)
+        order.product.add(self.products[1])
+        migration = importlib.import_module("api.migrations.0017_paymenttransaction")
+        migration.move_tx_refs(apps, None)
+
+        order.refresh_from_db()
+        self.assertEqual(order.quantity, "1")
+        payment = PaymentTransaction.objects.get(tx_ref="GEN-20250101-7")
+        self.assertEqual((payment.order_id, payment.product_id), (order.id, self.products[1].id))
+
+
+class OrderEventOutboxTest(OrderTestMixin, APITestCase):
+    def test_status_changes_write_events(self):
+        order = self.create_orders(1, status=Order.ACCEPTED)[0]
+        transition(order, Order.SHIPPED)
+        transition(order, Order.PENDING)  # illegal, no event
+        transition(order, Order.DELIVERED)
+        self.assertEqual(list(order.events.order_by("id").values_list("status", flat=True)), [Order.SHIPPED, Order.DELIVERED])
+
+    def test_events_of_an_order_run_in_order_and_wait_for_failures(self):
+        first, second = self.create_orders(2, status=Order.ACCEPTED)
+        seen = []
+        failing = {Order.SHIPPED}
+
+        def record(event):
+            if event.order_id == first.id and event.status in failing:
+                raise RuntimeError("notification backend down")
+            seen.append((event.order_id, event.status))
+
+        for target in (Order.SHIPPED, Order.DELIVERED):
+            transition(first, target)
+            transition(second, target)
+
+        with mock.patch("api.outbox.HANDLERS", [record]):
+            self.run_outbox()
+            # The other order is not held back, the failed one keeps its order
+            self.assertEqual(seen, [(second.id, Order.SHIPPED), (second.id, Order.DELIVERED)])
+            failed = first.events.get(status=Order.SHIPPED)
+            self.assertEqual((failed.attempts, failed.processed_at), (1, None))
+            self.assertIn("backend down", failed.last_error)
+
+            # Once the backoff is over and the handler works, both run in order
+            failing.clear()
+            OrderEvent.objects.filter(order=first).update(available_at=failed.created_at)
+            self.run_outbox()
+        self.assertEqual(seen[2:], [(first.id, Order.SHIPPED), (first.id, Order.DELIVERED)])
+        self.assertFalse(OrderEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_leased_events_are_not_claimed_twice(self):
+        order = self.create_orders(1, status=Order.ACCEPTED)[0]
+        transition(order, Order.SHIPPED)
+        with mock.patch("api.outbox.HANDLERS", []):
+            self.assertEqual(len(claim_batch(10, "worker-a")), 1)
+            self.assertEqual(claim_batch(10, "worker-b"), [])
+
+    def test_workers_share_the_queue_past_leased_and_failing_events(self):
+        orders = self.create_orders(4, status=Order.ACCEPTED)
+        for order in orders:
+            transition(order, Order.SHIPPED)
+        transition(orders[0], Order.DELIVERED)
+        with mock.patch("api.outbox.HANDLERS", []):
+            claimed = claim_batch(2, "worker-a")
+            self.assertEqual([event.order_id for event in claimed], [orders[0].id, orders[1].id])
+            # The second worker gets the next orders, not the first one's later event
+            self.assertEqual([event.order_id for event in claim_batch(10, "worker-b")], [orders[2].id, orders[3].id])
+
+            # Events backing off hold back only their own order
+            OrderEvent.objects.filter(claimed_by="worker-a").update(claimed_by="", available_at=timezone.now() + timedelta(minutes=5))
+            OrderEvent.objects.filter(claimed_by="worker-b").update(processed_at=timezone.now())
+            transition(orders[2], Order.DELIVERED)
+            self.assertEqual([event.order_id for event in claim_batch(1, "worker-c")], [orders[2].id])
+
+    def test_worker_command_sends_notifications(self):
+        order = self.create_orders(1)[0]
+        transition(order, Order.ACCEPTED)
+        stderr = io.StringIO()
+        call_command("process_order_events", "--once", "--threads", "1", stdout=io.StringIO(), stderr=stderr)
+        # Its notifications cannot wake feeds served by other processes
+        self.assertIn("PUBSUB_BROKER is in-process", stderr.getvalue())
+        self.assertTrue(Notification.objects.filter(recipient=self.buyer_user, notification_type="order_accepted").exists())
+        self.assertIsNotNone(order.events.get().processed_at)
+
+
+class SellerSalesRollupTest(OrderTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("seller-sales-summary")
+
+    def deliver(self, count):
+        orders = self.create_orders(count, status=Order.SHIPPED)
+        for order in orders:
+            transition(order, Order.DELIVERED)
+        self.run_outbox()
+        return orders
+
+    def summary(self, **params):
+        self.client.force_authenticate(user=self.seller_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, len(context.captured_queries)
+
+    def test_delivery_updates_rollups_once(self):
+        orders = self.deliver(3)
+        day = SellerSalesDay.objects.get(product=self.products[0])
+        # 3 orders of 5 units at 100 each
+        self.assertEqual((day.units, day.orders, day.revenue), (15, 3, 500 * 3))
+
+        Order.objects.filter(pk=orders[0].pk).update(status=Order.DELIVERED)
+        orders[0].refresh_from_db()
+        self.assertFalse(record_order_sales(orders[0]))
+        self.assertEqual(SellerSalesDay.objects.get(product=self.products[0]).units, 15)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.deliver(4)
+        # Orders delivered before the rollups existed
+        self.create_orders(2, status=Order.DELIVERED)
+        incremental = {row.product_id: row.units for row in SellerSalesDay.objects.all()}
+        call_command("rebuild_sales_rollups", stdout=io.StringIO())
+        rebuilt = {row.product_id: (row.units, row.orders) for row in SellerSalesDay.objects.all()}
+        self.assertEqual({pk: units for pk, (units, _) in rebuilt.items()}, {pk: units + 10 for pk, units in incremental.items()})
+        self.assertEqual({orders for _, orders in rebuilt.values()}, {6})
+
+    def test_rebuild_only_replaces_the_sellers_it_locked(self):
+        self.deliver(1)
+        # Rows an increment wrote for a seller the rebuild did not lock
+        with mock.patch("api.sales._lock_sellers", return_value=[]):
+            rebuild_sales()
+        self.assertEqual(SellerSalesDay.objects.get(product=self.products[0]).units, 5)
+
+        SellerSalesDay.objects.update(units=99)
+        rebuild_sales()
+        self.assertEqual(SellerSalesDay.objects.get(product=self.products[0]).units, 5)
+
+    def test_summary_cost_does_not_grow_with_orders(self):
+        self.deliver(2)
+        data, few = self.summary(group_by="product")
+        self.assertEqual(data["totals"], {"revenue": "2000.00", "units": 20, "orders": 4})
+        self.assertEqual([row["product_id"] for row in data["rows"]], [product.id for product in self.products])
+
+        self.deliver(10)
+        data, many = self.summary(group_by="day")
+        self.assertEqual(len(data["rows"]), 1)
+        self.assertEqual(data["totals"]["units"], 120)
+        self.assertEqual(few, many)
+
+    def test_summary_validates_input(self):
+        self.client.force_authenticate(user=self.seller_user)
+        self.assertEqual(self.client.get(self.url, {"start": "2026-02-30"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {"group_by": "week"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=self.buyer_user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ConcurrentReservationTest(OrderTestMixin, TransactionTestCase):
+    """A burst of orders on one product on real connections"""
+
+    def test_burst_never_oversells(self):
+        product = self.products[0]
+        orders = []
+        for _ in range(30):
+            order = Order.objects.create(buyer=self.buyer, quantity="5", quantity_value=5)
+            order.product.add(product)
+            orders.append(order)
+        barrier = threading.Barrier(len(orders))
+        results = []
+
+        def place(order):
+            try:
+                barrier.wait()
+                # SQLite allows a single writer, retry while the table is locked
+                for _ in range(200):
+                    try:
+                        results.append(reserve_stock(order))
+                        return
+                    except InsufficientStock:
+                        results.append(0)
+                        return
+                    except OperationalError:
+                        time.sleep(0.005)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=place, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), len(orders))
+        self.assertEqual(results.count(1), 10)
+        product.refresh_from_db()
+        self.assertEqual((product.quantity_value, product.quantity_reserved), (50, 50))
+        self.assertEqual(StockReservation.objects.filter(product=product).count(), 10)
+
+
+class ConcurrentOrderStatusTest(OrderTestMixin, TransactionTestCase):
+    """Racing tracking pings and buyer confirmations on real connections"""
+
+    def test_delivered_orders_are_never_reverted(self):
+        orders = self.create_orders(20, status=Order.SHIPPED)
+        targets = [Order.SHIPPED, Order.DRIVER_DELIVERED, Order.DELIVERED] * 4
+        barrier = threading.Barrier(len(targets))
+        applied = []
+        errors = []
+
+        def apply(order, target):
+            # SQLite allows a single writer, retry while the table is locked
+            for _ in range(200):
+                try:
+                    return transition(Order(pk=order.pk), target)
+                except OperationalError:
+                    time.sleep(0.005)
+            raise AssertionError("Database stayed locked")
+
+        def writer(target):
+            try:
+                barrier.wait()
+                for order in orders:
+                    if apply(order, target):
+                        applied.append((order.pk, target))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # Reverting a delivered order and delivering it again would show up as
+        # a second successful move to Delivered
+        for order in orders:
+            moves = [target for order_id, target in applied if order_id == order.pk]
+            self.assertEqual(moves.count(Order.DELIVERED), 1)
+            self.assertLessEqual(moves.count(Order.DRIVER_DELIVERED), 1)
+            self.assertNotIn(Order.SHIPPED, moves)
+        self.assertEqual(
+            set(Order.objects.filter(pk__in=[order.pk for order in orders]).values_list("status", flat=True)),
+            {Order.DELIVERED}
+        )
@@ -0,0 +1,504 @@
+import asyncio
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+from .models import CustomUser, BuyerProfile, SellerProfile, DriverProfile, Product, Order, TrackingLocation, ArchivedTrack, DeliveryRoute
+from .polyline import encode_polyline, decode_polyline, unpack_int32
+from .pubsub import InProcessBroker, tracking_channel
+from .route_eta import clear_route_segments
+
+
+class TrackingTestMixin:
+    """Creates a buyer, a seller with one product, a driver and an order"""
+
+    def setUp(self):
+        cache.clear()
+        buyer_user = CustomUser.objects.create_user(username="buyer", password="pass", is_buyer=True)
+        seller_user = CustomUser.objects.create_user(username="seller", password="pass", is_seller=True)
+        driver_user = CustomUser.objects.create_user(username="driver", password="pass", is_driver=True)
+
+        self.buyer = BuyerProfile.objects.create(user=buyer_user)
+        self.seller = SellerProfile.objects.create(user=seller_user, tax_number="TX-1")
+        self.driver = DriverProfile.objects.create(user=driver_user, license_number="DL-1", car_model="Isuzu")
+        self.driver_user = driver_user
+        self.buyer_user = buyer_user
+
+        self.product = Product.objects.create(
+            seller=self.seller, name="Yirgacheffe", description="Washed coffee",
+            price=100, quantity="50 kg", product_type="coffee"
+        )
+        self.order = self.create_order()
+
+    def create_order(self, **kwargs):
+        order = Order.objects.create(buyer=self.buyer, driver=self.driver, quantity="5", **kwargs)
+        order.product.add(self.product)
+        return order
+
+
+class BatchTrackingIngestTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("batch-update-tracking-location")
+        self.client.force_authenticate(user=self.driver_user)
+
+    def test_batch_is_written_with_client_timestamps(self):
+        other_order = self.create_order()
+        pings = [
+            {"orderId": self.order.id, "latitude": 9.03, "longitude": 38.74, "timestamp": "2025-04-03T10:00:00Z"},
+            {"orderId": other_order.id, "latitude": 7.67, "longitude": 36.83, "timestamp": "2025-04-03T10:00:05Z"},
+            {"orderId": self.order.id, "latitude": 9.04, "longitude": 38.75, "timestamp": "2025-04-03T10:00:10Z"},
+        ]
+
+        # One order lookup, one route lookup for the geofences and one insert
+        # (plus the savepoint pair); status-free pings update no orders
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, {"pings": pings}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(TrackingLocation.objects.filter(order=self.order).count(), 2)
+        latest = TrackingLocation.objects.filter(order=self.order).first()
+        self.assertEqual(latest.timestamp.isoformat(), "2025-04-03T10:00:10+00:00")
+
+    def test_status_applied_once_from_latest_ping(self):
+        Order.objects.filter(pk=self.order.pk).update(status=Order.ACCEPTED)
+        pings = [
+            {"orderId": self.order.id, "latitude": 9.03, "longitude": 38.74,
+             "status": "delivered", "timestamp": "2025-04-03T10:00:10Z"},
+            {"orderId": self.order.id, "latitude": 9.02, "longitude": 38.73,
+             "status": "on_route", "timestamp": "2025-04-03T10:00:00Z"},
+        ]
+        response = self.client.post(self.url, {"pings": pings}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["status_updated"], [self.order.id])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.DRIVER_DELIVERED)
+
+    def test_rejects_orders_of_other_drivers(self):
+        self.client.force_authenticate(user=self.buyer_user)
+        pings = [{"orderId": self.order.id, "latitude": 9.03, "longitude": 38.74}]
+        response = self.client.post(self.url, {"pings": pings}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(TrackingLocation.objects.exists())
+
+    def test_rejects_invalid_ping(self):
+        pings = [{"orderId": self.order.id, "latitude": 9.03}]
+        response = self.client.post(self.url, {"pings": pings}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rejects_bad_coordinates_with_their_index(self):
+        for latitude, longitude in (("north", 38.74), (91, 38.74), (9.03, -180.5), (9.03, None)):
+            pings = [
+                {"orderId": self.order.id, "latitude": 9.03, "longitude": 38.74},
+                {"orderId": self.order.id, "latitude": latitude, "longitude": longitude},
+            ]
+            response = self.client.post(self.url, {"pings": pings}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("Ping 1", response.data["error"])
+        self.assertFalse(TrackingLocation.objects.exists())
+
+    def test_accepts_zero_coordinates(self):
+        pings = [{"orderId": self.order.id, "latitude": 0, "longitude": "0.0"}]
+        response = self.client.post(self.url, {"pings": pings}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(TrackingLocation.objects.get().latitude, 0)
+
+
+class LocationStreamTest(TrackingTestMixin, APITestCase):
+    def test_broker_delivers_published_messages(self):
+        broker = InProcessBroker()
+
+        async def receive():
+            async with broker.subscribe("channel") as subscription:
+                # Publishers normally run in another thread
+                await asyncio.get_running_loop().run_in_executor(None, broker.publish, "channel", {"id": 1})
+                return await subscription.get(timeout=1)
+
+        self.assertEqual(async_to_sync(receive)(), {"id": 1})
+        self.assertEqual(broker.subscriber_count("channel"), 0)
+
+    def test_ingest_publishes_to_order_channel(self):
+        published = []
+        self.client.force_authenticate(user=self.driver_user)
+        with patch("api.pubsub.get_broker") as get_broker:
+            get_broker.return_value.publish.side_effect = lambda channel, message: published.append((channel, message))
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("update-tracking-location"),
+                    {"orderId": self.order.id, "latitude": 9.03, "longitude": 38.74},
+                    format="json"
+                )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(published, [(tracking_channel(self.order.id), response.data)])
+
+    def test_stream_requires_token(self):
+        response = self.client.get(reverse("order-location-stream", args=[self.order.id]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LastLocationCacheTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.driver_user)
+
+    def test_location_served_from_cache_after_ingest(self):
+        self.client.post(
+            reverse("update-tracking-location"),
+            {"orderId": self.order.id, "latitude": 9.03, "longitude": 38.74},
+            format="json"
+        )
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("get-order-location", args=[self.order.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["latitude"], "9.0300000")
+
+    def test_cache_miss_falls_back_to_database(self):
+        TrackingLocation.objects.create(order=self.order, driver=self.driver_user, latitude=7.67, longitude=36.83)
+
+        response = self.client.get(reverse("get-order-location", args=[self.order.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["longitude"], "36.8300000")
+
+        # The miss repopulated the cache
+        with self.assertNumQueries(0):
+            self.client.get(reverse("get-order-location", args=[self.order.id]))
+
+    def test_older_batched_ping_does_not_replace_cached_position(self):
+        url = reverse("batch-update-tracking-location")
+        self.client.post(url, {"pings": [
+            {"orderId": self.order.id, "latitude": 9.05, "longitude": 38.76, "timestamp": "2025-04-03T10:05:00Z"},
+        ]}, format="json")
+        self.client.post(url, {"pings": [
+            {"orderId": self.order.id, "latitude": 9.01, "longitude": 38.71, "timestamp": "2025-04-03T10:00:00Z"},
+        ]}, format="json")
+
+        response = self.client.get(reverse("get-order-location", args=[self.order.id]))
+        self.assertEqual(response.data["latitude"], "9.0500000")
+
+
+class DeadbandIngestTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.driver_user)
+        self.url = reverse("batch-update-tracking-location")
+
+    def ping(self, seconds, latitude=9.03, longitude=38.74, status=None):
+        timestamp = datetime(2025, 4, 3, 10, 0, tzinfo=dt_timezone.utc) + timedelta(seconds=seconds)
+        return {"orderId": self.order.id, "latitude": latitude, "longitude": longitude,
+                "status": status, "timestamp": timestamp.isoformat()}
+
+    def test_stationary_pings_extend_last_seen(self):
+        # Parked for a minute, then the truck moves ~1 km north
+        pings = [self.ping(seconds) for seconds in range(0, 60, 10)] + [self.ping(70, latitude=9.04)]
+        response = self.client.post(self.url, {"pings": pings}, format="json")
+
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["coalesced"], 5)
+        parked = TrackingLocation.objects.filter(order=self.order).order_by("timestamp").first()
+        self.assertEqual(parked.last_seen.isoformat(), "2025-04-03T10:00:50+00:00")
+
+    def test_coalesces_into_previously_stored_point(self):
+        self.client.post(self.url, {"pings": [self.ping(0)]}, format="json")
+        # ~3 m away, GPS jitter
+        response = self.client.post(self.url, {"pings": [self.ping(2, latitude=9.03003)]}, format="json")
+
+        self.assertEqual(response.data["coalesced"], 1)
+        self.assertEqual(TrackingLocation.objects.filter(order=self.order).count(), 1)
+        location = self.client.get(reverse("get-order-location", args=[self.order.id])).data
+        self.assertEqual(location["last_seen"], "2025-04-03T10:00:02Z")
+
+    def test_fast_ping_that_moved_far_is_stored(self):
+        # One second later but ~1 km away
+        pings = [self.ping(0), self.ping(1, latitude=9.04)]
+        response = self.client.post(self.url, {"pings": pings}, format="json")
+
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["coalesced"], 0)
+
+    def test_status_pings_are_always_stored(self):
+        pings = [self.ping(0), self.ping(1, status="picked_up")]
+        response = self.client.post(self.url, {"pings": pings}, format="json")
+
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["coalesced"], 0)
+
+    def test_single_update_and_counters(self):
+        url = reverse("update-tracking-location")
+        payload = {"orderId": self.order.id, "latitude": 9.03, "longitude": 38.74}
+        self.assertEqual(self.client.post(url, payload, format="json").status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(url, payload, format="json").status_code, status.HTTP_200_OK)
+        self.assertEqual(TrackingLocation.objects.filter(order=self.order).count(), 1)
+
+        admin = CustomUser.objects.create_user(username="admin", password="pass", is_staff=True)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse("tracking-ingest-stats"))
+        self.assertEqual(response.data, {"stored": 1, "suppressed": 1})
+
+
+class IncrementalTrackingHistoryTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+        self.url = reverse("get-tracking-history", args=[self.order.id])
+
+    def add_locations(self, coordinates, status=None):
+        return [
+            TrackingLocation.objects.create(
+                order=self.order, driver=self.driver_user, latitude=lat, longitude=lng, status=status
+            )
+            for lat, lng in coordinates
+        ]
+
+    def test_since_returns_only_newer_pings(self):
+        first = self.add_locations([(9.0, 38.7), (9.1, 38.7)])
+        response = self.client.get(self.url, {"since": 0})
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(response.data["next_cursor"], first[-1].id)
+
+        newer = self.add_locations([(9.2, 38.7)])
+        response = self.client.get(self.url, {"since": response.data["next_cursor"]})
+        self.assertEqual([row["id"] for row in response.data["results"]], [newer[0].id])
+
+        response = self.client.get(self.url, {"since": response.data["next_cursor"]})
+        self.assertEqual(response.data["results"], [])
+        self.assertEqual(response.data["next_cursor"], newer[0].id)
+
+    def test_tolerance_drops_collinear_points_but_keeps_status_pings(self):
+        # A straight northbound run with a status ping in the middle
+        self.add_locations([(9.00 + i * 0.001, 38.7) for i in range(10)])
+        status_ping = self.add_locations([(9.0105, 38.7)], status="picked_up")[0]
+        last = self.add_locations([(9.02, 38.7)])[0]
+
+        response = self.client.get(self.url, {"tolerance": 5})
+        ids = [row["id"] for row in response.data["results"]]
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(ids[0], last.id)
+        self.assertIn(status_ping.id, ids)
+
+    def test_rejects_invalid_parameters(self):
+        response = self.client.get(self.url, {"since": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_plain_history_is_unchanged(self):
+        self.add_locations([(9.0, 38.7)])
+        response = self.client.get(self.url)
+        self.assertIsInstance(response.data, list)
+
+
+class RouteEtaTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        clear_route_segments()
+        self.client.force_authenticate(user=self.driver_user)
+        self.url = reverse("get-order-eta", args=[self.order.id])
+
+    def save_route(self, coordinates, **extra):
+        payload = {
+            "orderId": self.order.id,
+            "startPoint": {"latitude": coordinates[0][1], "longitude": coordinates[0][0]},
+            "endPoint": {"latitude": coordinates[-1][1], "longitude": coordinates[-1][0]},
+            "routeGeometry": {"type": "LineString", "coordinates": coordinates},
+            **extra,
+        }
+        return self.client.post(reverse("save-route"), payload, format="json")
+
+    def test_eta_from_snapped_position(self):
+        # A northbound road with a bend, the truck slightly east of its midpoint
+        self.save_route([[38.70, 9.00], [38.70, 9.05], [38.70, 9.10]], distance=12, estimatedTime=60)
+        self.client.post(reverse("update-tracking-location"),
+                         {"orderId": self.order.id, "latitude": 9.05, "longitude": 38.7005}, format="json")
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(response.data["progress"], 0.5, places=3)
+        self.assertAlmostEqual(response.data["remaining_distance_km"], 6, places=2)
+        self.assertAlmostEqual(response.data["remaining_time_min"], 30, places=1)
+        self.assertEqual(response.data["snapped"], {"latitude": 9.05, "longitude": 38.7})
+        self.assertAlmostEqual(response.data["off_route_m"], 55, delta=1)
+
+    def test_repeated_requests_use_cached_segments(self):
+        self.save_route([[38.70, 9.00], [38.70, 9.10]])
+        self.client.post(reverse("update-tracking-location"),
+                         {"orderId": self.order.id, "latitude": 9.02, "longitude": 38.70}, format="json")
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            first = self.client.get(self.url)
+        self.assertAlmostEqual(first.data["progress"], 0.2, places=3)
+
+        # Saving a new geometry invalidates the cached segments
+        self.save_route([[38.70, 9.00], [38.70, 9.04]])
+        self.assertAlmostEqual(self.client.get(self.url).data["progress"], 0.5, places=3)
+
+    def test_missing_route_or_location(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.save_route([[38.70, 9.00], [38.70, 9.10]])
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data["error"], "No tracking information available yet")
+
+
+class GeofenceArrivalTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.order.status = Order.SHIPPED
+        self.order.save()
+        self.client.force_authenticate(user=self.driver_user)
+        # Delivering to Jimma, ~110 m per 0.001 degrees of latitude
+        self.client.post(reverse("save-route"), {
+            "orderId": self.order.id,
+            "startPoint": {"latitude": 9.03, "longitude": 38.74},
+            "endPoint": {"latitude": 7.67, "longitude": 36.83},
+        }, format="json")
+
+    def post_location(self, latitude, longitude):
+        return self.client.post(reverse("update-tracking-location"),
+                                {"orderId": self.order.id, "latitude": latitude, "longitude": longitude}, format="json")
+
+    def test_arrival_marks_order_driver_delivered(self):
+        self.post_location(7.672, 36.83)
+        self.order.refresh_from_db()
+        self.assertNotEqual(self.order.status, Order.DRIVER_DELIVERED)
+
+        response = self.post_location(7.6705, 36.8302)
+        self.assertEqual(response.data["status"], "delivered")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.DRIVER_DELIVERED)
+
+    def test_only_the_assigned_driver_of_an_accepted_order_arrives(self):
+        other_user = CustomUser.objects.create_user(username="other-driver", password="pass", is_driver=True)
+        DriverProfile.objects.create(user=other_user, license_number="DL-2", car_model="Isuzu")
+        self.client.force_authenticate(user=other_user)
+        self.assertIsNone(self.post_location(7.6705, 36.8302).data["status"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.SHIPPED)
+
+        # Nobody has accepted the order yet
+        Order.objects.filter(pk=self.order.pk).update(status=Order.PENDING)
+        self.client.force_authenticate(user=self.driver_user)
+        self.assertIsNone(self.post_location(7.6704, 36.8302).data["status"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.PENDING)
+
+    def test_bounding_box_rejects_without_distance_check(self):
+        with patch("api.geofence.haversine_m") as haversine:
+            self.post_location(8.5, 37.5)
+        haversine.assert_not_called()
+
+    def test_batch_marks_only_first_ping_inside(self):
+        pings = [
+            {"orderId": self.order.id, "latitude": 7.70, "longitude": 36.83, "timestamp": "2025-04-03T10:00:00Z"},
+            {"orderId": self.order.id, "latitude": 7.6704, "longitude": 36.83, "timestamp": "2025-04-03T10:01:00Z"},
+            {"orderId": self.order.id, "latitude": 7.6701, "longitude": 36.83, "timestamp": "2025-04-03T10:02:00Z"},
+        ]
+        response = self.client.post(reverse("batch-update-tracking-location"), {"pings": pings}, format="json")
+
+        self.assertEqual(response.data["status_updated"], [self.order.id])
+        statuses = list(TrackingLocation.objects.filter(order=self.order).order_by("timestamp").values_list("status", flat=True))
+        self.assertEqual(statuses, [None, "delivered", None])
+
+    def test_order_without_route_is_not_checked_again(self):
+        other_order = self.create_order()
+        url = reverse("update-tracking-location")
+        self.client.post(url, {"orderId": other_order.id, "latitude": 7.67, "longitude": 36.83}, format="json")
+        # Only the order lookup and the insert, the missing route is cached
+        with self.assertNumQueries(2):
+            self.client.post(url, {"orderId": other_order.id, "latitude": 7.0, "longitude": 36.0}, format="json")
+
+
+class TrackingCompactionTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+        self.order.status = Order.DELIVERED
+        self.order.save()
+
+        # Archived timestamps keep millisecond precision
+        start = (timezone.now() - timedelta(days=60)).replace(microsecond=0)
+        self.locations = [
+            TrackingLocation.objects.create(
+                order=self.order, driver=self.driver_user,
+                latitude=Decimal("9.0300000") + Decimal(i) / 10000, longitude=Decimal("38.7400000") - Decimal(i) / 10000,
+                timestamp=start + timedelta(seconds=30 * i), status="delivered" if i == 19 else None
+            )
+            for i in range(20)
+        ]
+
+    def test_compaction_round_trips_history(self):
+        before = self.client.get(reverse("get-tracking-history", args=[self.order.id])).data
+
+        call_command("compact_tracking", days=30, stdout=StringIO())
+
+        self.assertFalse(TrackingLocation.objects.filter(order=self.order).exists())
+        track = ArchivedTrack.objects.get(order=self.order)
+        self.assertEqual(track.point_count, 20)
+
+        after = self.client.get(reverse("get-tracking-history", args=[self.order.id])).data
+        strip = lambda rows: [{k: v for k, v in row.items() if k != "id"} for row in rows]
+        self.assertEqual(strip(after), strip(before))
+
+    def test_recent_or_undelivered_orders_are_kept(self):
+        pending = self.create_order()
+        TrackingLocation.objects.create(
+            order=pending, driver=self.driver_user, latitude=9, longitude=38,
+            timestamp=timezone.now() - timedelta(days=60)
+        )
+
+        call_command("compact_tracking", days=90, stdout=StringIO())
+        call_command("compact_tracking", days=30, stdout=StringIO())
+
+        self.assertFalse(ArchivedTrack.objects.filter(order=pending).exists())
+        self.assertEqual(TrackingLocation.objects.filter(order=pending).count(), 1)
+
+
+class CompactCoordinateFormatsTest(TrackingTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyer_user)
+        self.coordinates = [[9.03, 38.74], [8.5, 37.9], [7.67, 36.83]]
+
+    def test_known_polyline_encoding(self):
+        encoded = encode_polyline([(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)])
+        self.assertEqual(encoded, "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_history_as_polyline_and_int32(self):
+        for lat, lng in self.coordinates:
+            TrackingLocation.objects.create(order=self.order, driver=self.driver_user, latitude=lat, longitude=lng)
+        url = reverse("get-tracking-history", args=[self.order.id])
+
+        response = self.client.get(url, HTTP_ACCEPT="application/vnd.uchain.polyline")
+        self.assertEqual(response["Content-Type"], "application/vnd.uchain.polyline; charset=utf-8")
+        # History is newest first
+        self.assertEqual(decode_polyline(response.content.decode()).tolist(), self.coordinates[::-1])
+
+        response = self.client.get(url, {"format": "int32", "since": 0})
+        self.assertEqual(unpack_int32(response.content).tolist(), self.coordinates[::-1])
+        self.assertEqual(response["X-Next-Cursor"], str(TrackingLocation.objects.order_by("-id").first().id))
+
+    def test_route_geometry_as_polyline(self):
+        DeliveryRoute.objects.create(
+            order=self.order, driver=self.driver_user,
+            start_latitude=9.03, start_longitude=38.74, end_latitude=7.67, end_longitude=36.83,
+            route_geometry={"type": "LineString", "coordinates": [[lng, lat] for lat, lng in self.coordinates]},
+        )
+        response = self.client.get(reverse("get-route", args=[self.order.id]), {"format": "polyline"})
+        self.assertEqual(decode_polyline(response.content.decode()).tolist(), self.coordinates)
+
+    def test_errors_stay_json(self):
+        response = self.client.get(reverse("get-route", args=[self.order.id]), {"format": "polyline"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response["Content-Type"], "application/json")
@@ -0,0 +1,142 @@
+"""
+Compaction of tracking pings into compact per-order archived tracks.
+
+Binary layout of ArchivedTrack.data (little-endian, zlib compressed):
+
+    header   magic b"UCTK", version (u8), flags (u8), 2 pad bytes, count (u32)
+    bases    first latitude and longitude in 1e-7 degrees and first
+             timestamp in milliseconds since the epoch (3 x i64)
+    deltas   count - 1 latitude deltas, then longitude deltas, then time
+             deltas; i32 unless the WIDE flag is set, in which case i64
+
+Coordinates keep the full 7 decimal places of TrackingLocation, timestamps
+are kept to the millisecond. Statuses and drivers change rarely and are
+stored beside the binary as [point index, value] pairs.
+"""
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from .models import ArchivedTrack, TrackingLocation
+
+MAGIC = b"UCTK"
+VERSION = 1
+FLAG_WIDE = 0x01
+
+HEADER = struct.Struct('<4sBBxxI')
+BASES = struct.Struct('<qqq')
+COORDINATE_SCALE = 10 ** 7
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+def _to_fixed(value):
+    return int((Decimal(str(value)) * COORDINATE_SCALE).to_integral_value())
+
+
+def _to_millis(timestamp):
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+
+def encode_track(locations):
+    """Pack time-ordered TrackingLocation objects into (data, statuses, drivers)"""
+    count = len(locations)
+    latitudes = np.fromiter((_to_fixed(location.latitude) for location in locations), np.int64, count)
+    longitudes = np.fromiter((_to_fixed(location.longitude) for location in locations), np.int64, count)
+    times = np.fromiter((_to_millis(location.timestamp) for location in locations), np.int64, count)
+
+    deltas = np.concatenate([np.diff(latitudes), np.diff(longitudes), np.diff(times)])
+    flags = 0
+    if deltas.size and (deltas.min() < INT32_MIN or deltas.max() > INT32_MAX):
+        flags |= FLAG_WIDE
+    delta_dtype = '<i8' if flags & FLAG_WIDE else '<i4'
+
+    payload = (
+        HEADER.pack(MAGIC, VERSION, flags, count)
+        + BASES.pack(int(latitudes[0]), int(longitudes[0]), int(times[0]))
+        + deltas.astype(delta_dtype).tobytes()
+    )
+
+    statuses = [[index, location.status] for index, location in enumerate(locations) if location.status]
+    drivers = []
+    for index, location in enumerate(locations):
+        if not drivers or drivers[-1][1] != location.driver_id:
+            drivers.append([index, location.driver_id])
+
+    return zlib.compress(payload, 9), statuses, drivers
+
+
+def decode_track(track):
+    """Unpack an ArchivedTrack into unsaved TrackingLocation objects, oldest first"""
+    payload = zlib.decompress(bytes(track.data))
+    magic, version, flags, count = HEADER.unpack_from(payload, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported archived track format for order {track.order_id}")
+
+    base_latitude, base_longitude, base_time = BASES.unpack_from(payload, HEADER.size)
+    delta_dtype = '<i8' if flags & FLAG_WIDE else '<i4'
+    deltas = np.frombuffer(payload, dtype=delta_dtype, offset=HEADER.size + BASES.size).astype(np.int64)
+    deltas = deltas.reshape(3, count - 1)
+
+    latitudes = np.concatenate([[base_latitude], base_latitude + np.cumsum(deltas[0])])
+    longitudes = np.concatenate([[base_longitude], base_longitude + np.cumsum(deltas[1])])
+    times = np.concatenate([[base_time], base_time + np.cumsum(deltas[2])])
+
+    statuses = {index: value for index, value in track.statuses}
+    driver_changes = {index: value for index, value in track.drivers}
+
+    locations = []
+    driver_id = None
+    for index in range(count):
+        driver_id = driver_changes.get(index, driver_id)
+        locations.append(TrackingLocation(
+            order_id=track.order_id,
+            driver_id=driver_id,
+            latitude=Decimal(int(latitudes[index])).scaleb(-7),
+            longitude=Decimal(int(longitudes[index])).scaleb(-7),
+            timestamp=EPOCH + timedelta(milliseconds=int(times[index])),
+            status=statuses.get(index),
+        ))
+    return locations
+
+
+def archived_locations(order_id):
+    """Decoded archived pings of an order, or an empty list if it was never compacted"""
+    track = ArchivedTrack.objects.filter(order_id=order_id).first()
+    return decode_track(track) if track else []
+
+
+def compact_order(order_id):
+    """
+    Move all raw pings of an order into its archived track, merging with a
+    previously archived track if there is one. Returns the number of raw
+    pings compacted.
+    """
+    with transaction.atomic():
+        locations = list(
+            TrackingLocation.objects.select_for_update()
+            .filter(order_id=order_id).order_by('timestamp', 'id')
+        )
+        if not locations:
+            return 0
+
+        track = ArchivedTrack.objects.select_for_update().filter(order_id=order_id).first()
+        points = locations
+        if track is not None:
+            points = sorted(decode_track(track) + locations, key=lambda location: location.timestamp)
+        else:
+            track = ArchivedTrack(order_id=order_id)
+
+        track.data, track.statuses, track.drivers = encode_track(points)
+        track.point_count = len(points)
+        track.started_at = points[0].timestamp
+        track.ended_at = points[-1].timestamp
+        track.save()
+
+        # Rows inserted after the read above have larger ids and are left alone
+        TrackingLocation.objects.filter(
+            order_id=order_id, id__lte=max(location.id for location in locations)
+        ).delete()
+        return len(locations)
@@ -0,0 +1,90 @@
+"""
+Per-order "last known position" cache.
+
+Tracking ingest writes through to the cache so reading an order's latest
+position is a single key lookup instead of an ordered scan of the ever
+growing TrackingLocation table. Misses fall back to the database and
+repopulate the cache.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from .models import TrackingLocation
+from .serializers import TrackingLocationSerializer
+from .tracking_archive import archived_locations
+
+
+def last_location_key(order_id):
+    return f"tracking:last:{order_id}"
+
+
+def _timeout():
+    return getattr(settings, 'TRACKING_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_cached_location(order_id):
+    """Return the cached serialized latest location of an order, or None on a miss"""
+    return cache.get(last_location_key(order_id))
+
+
+def get_cached_locations(order_ids):
+    """Return {order_id: cached serialized latest location} for the cached orders"""
+    keys = {last_location_key(order_id): order_id for order_id in order_ids}
+    return {keys[key]: data for key, data in cache.get_many(list(keys)).items()}
+
+
+def remember_location(tracking_location):
+    """
+    Write a newly stored location through to the cache, unless the cache
+    already holds a newer one (batched pings may arrive out of order).
+    Returns the serialized location.
+    """
+    data = TrackingLocationSerializer(tracking_location).data
+    key = last_location_key(tracking_location.order_id)
+
+    cached = cache.get(key)
+    if cached is not None:
+        cached_timestamp = parse_datetime(cached.get('timestamp') or '')
+        if cached_timestamp and cached_timestamp > tracking_location.timestamp:
+            return data
+
+    cache.set(key, dict(data), _timeout())
+    return data
+
+
+def get_last_location(order_id):
+    """Return the serialized latest location of an order, reading through to the database"""
+    data = get_cached_location(order_id)
+    if data is not None:
+        return data
+
+    latest_location = TrackingLocation.objects.filter(order_id=order_id).order_by('-timestamp').first()
+    if latest_location is None:
+        # The order's pings may have been compacted into an archived track
+        archived = archived_locations(order_id)
+        if not archived:
+            return None
+        latest_location = archived[-1]
+
+    data = dict(TrackingLocationSerializer(latest_location).data)
+    cache.set(last_location_key(order_id), data, _timeout())
+    return data
+
+
+def touch_location(order_id, location_data, last_seen):
+    """
+    Return a copy of a serialized location with last_seen moved forward,
+    refreshing the cache if it still holds that point.
+    """
+    data = dict(location_data)
+    data['last_seen'] = TrackingLocationSerializer().fields['last_seen'].to_representation(last_seen)
+
+    key = last_location_key(order_id)
+    cached = cache.get(key)
+    if cached is not None and cached.get('timestamp') == data.get('timestamp'):
+        cache.set(key, data, _timeout())
+    return data
+
+
+def forget_location(order_id):
+    cache.delete(last_location_key(order_id))
@@ -0,0 +1,88 @@
+"""
+Per-user unread notification counters.
+
+NotificationCounter.unread mirrors COUNT(*) of a user's unread
+Notification rows so the unread count is a primary key lookup. Every
+write path adjusts it in the same transaction as the notifications:
+NotificationService on create, NotificationViewSet on read, delete and
+mark_all_read. A user's row is created on their first unread count from
+the real COUNT, and increments only touch existing rows, so a missing row
+is never wrong. The reconcile_notification_counters command repairs any
+drift, e.g. from notifications written outside these paths.
+"""
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, PositiveIntegerField, Value, When
+from .models import Notification, NotificationCounter
+
+
+def add_unread(deltas):
+    """Apply {user id: change} to the existing counters, in one UPDATE"""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Decrements are clamped with a CASE: unread is unsigned on MySQL, where
+    # a negative intermediate result fails before GREATEST could clamp it
+    unread = Case(
+        *[
+            When(user_id=user_id, then=F('unread') + delta) if delta > 0 else
+            When(user_id=user_id, unread__gte=-delta, then=F('unread') + delta)
+            for user_id, delta in deltas.items()
+        ],
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    )
+    NotificationCounter.objects.filter(user_id__in=deltas).update(unread=unread)
+
+
+def count_new(notifications):
+    """Add freshly created notifications to their recipients' counters"""
+    add_unread(Counter(notification.recipient_id for notification in notifications if not notification.is_read))
+
+
+def reset_unread(user_id):
+    NotificationCounter.objects.filter(user_id=user_id).update(unread=0)
+
+
+def _count(user_id):
+    return Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+
+
+def unread_count(user_id):
+    """The user's unread personal notifications, counted once and then looked up"""
+    unread = NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+    if unread is not None:
+        return unread
+    try:
+        with transaction.atomic():
+            return NotificationCounter.objects.create(user_id=user_id, unread=_count(user_id)).unread
+    except IntegrityError:
+        # Created concurrently
+        return NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+
+
+def reconcile(batch_size=1000):
+    """
+    Set every counter to the real count, batch by batch. Returns the
+    number of counters that were wrong.
+    """
+    fixed = 0
+    last_id = 0
+    while True:
+        counters = list(
+            NotificationCounter.objects.filter(user_id__gt=last_id)
+            .order_by('user_id').values_list('user_id', 'unread')[:batch_size]
+        )
+        if not counters:
+            return fixed
+        last_id = counters[-1][0]
+        actual = dict(
+            Notification.objects.filter(recipient_id__in=[user_id for user_id, _ in counters], is_read=False)
+            .values_list('recipient_id').annotate(count=Count('id')).order_by()
+        )
+        for user_id, unread in counters:
+            if actual.get(user_id, 0) != unread:
+                # Compare-and-set, so a concurrent change is not overwritten with a stale count
+                with transaction.atomic():
+                    count = _count(user_id)
+                    fixed += NotificationCounter.objects.filter(user_id=user_id).exclude(unread=count).update(unread=count)
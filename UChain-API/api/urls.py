@@ -2,6 +2,8 @@ from django.urls import path, include
 from . import views
 from . import views_tracking
 from . import views_route
+from . import views_sales
+from . import views_stream
 from .notification_views import NotificationViewSet
 from django.conf import settings
 from django.conf.urls.static import static
@@ -28,7 +30,9 @@ urlpatterns = [
 
     # Endpoints related to order
     path("order/create", views.OrderCreateView.as_view(), name="order-create-api-view"),
+    path("order/checkout", views.OrderCheckoutView.as_view(), name="order-checkout-view"),
     path("orders", views.OrderListView.as_view(), name="order-list-view"),
+    path("orders/counts", views.OrderStatusCountsView.as_view(), name="order-status-counts-view"),
     path("order/<int:pk>", views.OrderRetrieveView.as_view(), name="order-retrieve-view"),
     path("order/<int:pk>/update", views.OrderUpdateView.as_view(), name="order-update-view"),
     path("order/<int:pk>/destroy", views.OrderDestroyView.as_view(), name="order-destroy-view"),
@@ -42,6 +46,7 @@ urlpatterns = [
     # Endpoints related to payment
     path('pay/', views.Payment.as_view(), name='pay'),
     path('verify/', views.PaymentVerify.as_view(), name='verify'),
+    path('api/callback', views.PaymentCallbackView.as_view(), name='payment-callback-view'),
     path('payment/diagnostic', views.PaymentDiagnostic.as_view(), name='payment-diagnostic-view'),
 
     # Endpoint related to rating
@@ -63,14 +68,21 @@ urlpatterns = [
     
     # Tracking endpoints
     path("api/tracking/update-location", views_tracking.UpdateTrackingLocationView.as_view(), name="update-tracking-location"),
+    path("api/tracking/update-location/batch", views_tracking.BatchUpdateTrackingLocationView.as_view(), name="batch-update-tracking-location"),
+    path("api/tracking/ingest-stats", views_tracking.TrackingIngestStatsView.as_view(), name="tracking-ingest-stats"),
     path("api/tracking/location/<int:order_id>", views_tracking.GetOrderLocationView.as_view(), name="get-order-location"),
     path("api/tracking/history/<int:order_id>", views_tracking.GetTrackingHistoryView.as_view(), name="get-tracking-history"),
     path("api/tracking/status/<int:order_id>", views_tracking.UpdateOrderStatusView.as_view(), name="update-order-status"),
+    path("api/tracking/stream/<int:order_id>", views_stream.order_location_stream, name="order-location-stream"),
+    path("api/notifications/poll", views_stream.notification_poll, name="notification-poll"),
+    path("api/notifications/stream", views_stream.notification_stream, name="notification-stream"),
     
     # Route endpoints
     path("api/route/create", views_route.CreateRouteView.as_view(), name="create-route"),
     path("api/route/save", views_route.SaveRouteView.as_view(), name="save-route"),
     path("api/route/<int:order_id>", views_route.GetRouteView.as_view(), name="get-route"),
+    path("api/route/<int:order_id>/eta", views_route.GetOrderETAView.as_view(), name="get-order-eta"),
+    path("api/sales/summary", views_sales.SellerSalesSummaryView.as_view(), name="seller-sales-summary"),
     
     # Notification endpoints
     path("api/", include(router.urls))
@@ -7,9 +7,9 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
-from .models import CustomUser, BuyerProfile, DriverProfile, Product, Order, Message, Rating, SellerProfile
+from .models import CustomUser, BuyerProfile, DriverProfile, Product, Order, Message, Rating, SellerProfile, PaymentTransaction, OrderEvent
 from django.contrib.auth import authenticate
-from .serializers import CustomUserSerializer, BuyerProfileSerializer, SellerProfileSerializer, DriverProfileSerializer, ProductSerializer, OrderSerializer, MessageSerializer, RatingSerializer
+from .serializers import CustomUserSerializer, BuyerProfileSerializer, SellerProfileSerializer, DriverProfileSerializer, ProductSerializer, OrderSerializer, MessageSerializer, RatingSerializer, CheckoutSerializer
 from django.conf import settings
 from chapa import Chapa
 from datetime import datetime
@@ -20,6 +20,15 @@ from django.core.mail import send_mail
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from .notification_views import NotificationService
+from .pagination import OrderCursorPagination
+from .order_filters import filter_orders, visible_orders
+from .seller_orders import seller_has_order
+from .order_status import normalize_status, transition
+from .inventory import release_stock, reserve_stock
+from .checkout import checkout
+from .payments import find_payment, link_payment, mark_payment, record_payment
+from django.db import transaction
+from django.db.models import Count
 import logging
 
 logger = logging.getLogger(__name__)
@@ -294,51 +303,74 @@ class OrderCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        # Save the order with the buyer profile
-        order = serializer.save(buyer=self.request.user.buyerprofile, status='Pending')
-        
-        # Create notifications for the new order
-        NotificationService.create_order_notification(order.id, 'Pending')
+        with transaction.atomic():
+            # Save the order with the buyer profile
+            order = serializer.save(buyer=self.request.user.buyerprofile, status=Order.PENDING)
+            # Hold the stock last so the product rows stay locked only briefly;
+            # InsufficientStock rolls the order back and answers 409
+            reserve_stock(order)
+            # The seller is notified from the outbox, see api/outbox.py
+            OrderEvent.objects.create(order=order, status=Order.PENDING)
+
+# view to place one order per cart line item in a single request
+class OrderCheckoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        buyer = getattr(request.user, 'buyerprofile', None) if request.user.is_buyer else None
+        if buyer is None:
+            raise PermissionDenied("Only buyers can check out.")
+
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        orders = checkout(buyer, serializer.validated_data['items'], serializer.validated_data.get('driver'))
+
+        queryset = Order.objects.filter(id__in=[order.id for order in orders]).prefetch_related('product').order_by('id')
+        return Response(OrderSerializer(queryset, many=True).data, status=status.HTTP_201_CREATED)
 
 # view to retrieve all orders
 class OrderListView(generics.ListAPIView):
+    """
+    Orders visible to the authenticated user, narrowed by the status, date
+    and driver filters of api/order_filters.py. Returns a plain list unless
+    ?cursor= or ?page_size= is given, then keyset pages of the newest orders
+    first. Products are prefetched, so a page costs the same number of
+    queries however many orders and products it holds.
+    """
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
         # Return orders based on user role
-        user = self.request.user
-        
         try:
-            if user.is_buyer:
-                # Buyer can see their own orders
-                buyer_profile = getattr(user, 'buyerprofile', None)
-                if buyer_profile:
-                    return Order.objects.filter(buyer=buyer_profile)
-                else:
-                    # Return empty queryset if profile doesn't exist
-                    return Order.objects.none()
-            elif user.is_seller:
-                # Seller can see orders for their products
-                return Order.objects
-            elif user.is_driver:
-                # Driver can see orders assigned to them
-                driver_profile = getattr(user, 'driverprofile', None)
-                if driver_profile:
-                    return Order.objects.filter(driver=driver_profile)
-                else:
-                    # Return empty queryset if profile doesn't exist
-                    return Order.objects.none()
-            else:
-                return Order.objects.none()
+            queryset = visible_orders(self.request.user)
         except Exception as e:
             # Log the error and return empty queryset
             print(f"Error in OrderListView: {str(e)}")
             return Order.objects.none()
+        # Invalid filters answer 400
+        queryset = filter_orders(queryset, self.request.query_params)
+        return queryset.prefetch_related('product').order_by('-order_date', '-id')
+
+# view to count the visible orders per status, for the dashboard tabs
+class OrderStatusCountsView(APIView):
+    """
+    Number of orders per status, with the same date and driver filters as
+    the order list, in one grouped query.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        queryset = filter_orders(visible_orders(request.user), request.query_params, by_status=False)
+        counts = dict.fromkeys([value for value, _ in Order.STATUS_CHOICES], 0)
+        for order_status, count in queryset.values_list('status').annotate(count=Count('id')).order_by():
+            counts[order_status] = counts.get(order_status, 0) + count
+        return Response({"counts": counts, "total": sum(counts.values())})
 
 # view to retrieve a specific order
 class OrderRetrieveView(generics.RetrieveAPIView):
-    queryset = Order.objects.all()
+    queryset = Order.objects.prefetch_related('product')
     serializer_class = OrderSerializer
     lookup_field = "pk"
     permission_classes = [IsAuthenticated]
@@ -349,7 +381,7 @@ class OrderRetrieveView(generics.RetrieveAPIView):
 
         # Check if user has permission to view this order
         if (user.is_buyer and hasattr(user, 'buyerprofile') and instance.buyer == user.buyerprofile) or \
-           (user.is_seller and instance.product.seller_id == user.id) or \
+           (user.is_seller and hasattr(user, 'sellerprofile') and seller_has_order(user.sellerprofile, instance)) or \
            (user.is_driver and hasattr(user, 'driverprofile') and instance.driver == user.driverprofile):
             return instance
         
@@ -370,79 +402,36 @@ class OrderUpdateView(generics.UpdateAPIView):
         # Check permissions - FIX: Handle product ManyToManyField properly
         if user.is_seller and hasattr(user, 'sellerprofile'):
             # For sellers, check if they are associated with any product in this order
-            seller_has_product = False
-            for product in instance.product.all():
-                if product.seller == user.sellerprofile:
-                    seller_has_product = True
-                    break
-            
-            if not seller_has_product:
+            if not seller_has_order(user.sellerprofile, instance):
                 raise PermissionDenied("You are not authorized to update this order.")
         elif user.is_buyer and hasattr(user, 'buyerprofile') and instance.buyer != user.buyerprofile:
             raise PermissionDenied("You are not authorized to update this order.")
         elif user.is_driver and hasattr(user, 'driverprofile') and instance.driver != user.driverprofile:
             raise PermissionDenied("You are not authorized to update this order.")
         
-        # Save the old status for comparison after update
-        old_status = instance.status
-            
-        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        # Status changes go through the state machine as a compare-and-set,
+        # the serializer only saves the remaining fields
+        data = request.data.copy()
+        target = None
+        if 'status' in data:
+            target = normalize_status(data.get('status'))
+            del data['status']
+            if target is None:
+                return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Validate before changing anything, then commit the status and the
+        # other fields together so a failed save never leaves a new status
+        serializer = self.get_serializer(instance, data=data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        
-        # Check if status changed and trigger notifications
-        if 'status' in request.data and old_status != instance.status:
-            try:
-                # Import the notification service (add this import at the top of the file)
-                from .notification_views import NotificationService
-                
-                # Trigger notifications based on the new status
-                NotificationService.create_order_notification(instance.id, instance.status)
-                
-                # Update product quantity when order is delivered
-                if instance.status == Order.DELIVERED or instance.status == Order.DRIVER_DELIVERED:
-                    # Get the order quantity
-                    order_quantity_str = instance.quantity
-                    
-                    # Try to extract the numeric part from the quantity string
-                    import re
-                    numeric_match = re.search(r'(\d+)', order_quantity_str)
-                    if numeric_match:
-                        ordered_quantity = int(numeric_match.group(1))
-                        
-                        # Update each product's quantity
-                        for product in instance.product.all():
-                            # Get current product quantity
-                            product_quantity_str = product.quantity
-                            
-                            # Try to extract the numeric part and unit from the product quantity
-                            product_match = re.search(r'(\d+)\s*([a-zA-Z]*)', product_quantity_str)
-                            if product_match:
-                                current_quantity = int(product_match.group(1))
-                                unit = product_match.group(2)
-                                
-                                # Calculate new quantity (ensure it doesn't go below 0)
-                                new_quantity = max(0, current_quantity - ordered_quantity)
-                                
-                                # Update product quantity
-                                if unit:
-                                    product.quantity = f"{new_quantity} {unit}"
-                                else:
-                                    product.quantity = str(new_quantity)
-                                
-                                # Save the updated product
-                                product.save()
-                                
-                                # Log the inventory update
-                                logger.info(f"Updated inventory for product {product.id}: {product.name} - Old quantity: {product_quantity_str}, New quantity: {product.quantity}")
-                                
-                                # If inventory reaches zero, log a warning
-                                if new_quantity == 0:
-                                    logger.warning(f"Product {product.id}: {product.name} is now out of stock!")
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Error processing order {instance.id}: {str(e)}")
+        with transaction.atomic():
+            # Notifications and stock follow from the OrderEvent the
+            # transition writes, see api/outbox.py
+            if target is not None and normalize_status(instance.status) != target and not transition(instance, target):
+                return Response(
+                    {"error": f"Order cannot move from {instance.status} to {target}"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            self.perform_update(serializer)
 
         if getattr(instance, '_prefetched_objects_cache', None):
             # If 'prefetch_related' has been applied to a queryset, we need to
@@ -463,7 +452,7 @@ class OrderDestroyView(generics.DestroyAPIView):
         
         user = request.user
         # Check permissions
-        if user.is_seller and instance.product.seller_id != user.id:
+        if user.is_seller and not (hasattr(user, 'sellerprofile') and seller_has_order(user.sellerprofile, instance)):
             raise PermissionDenied("You are not authorized to delete this order.")
         elif user.is_buyer and hasattr(user, 'buyerprofile') and instance.buyer != user.buyerprofile:
             raise PermissionDenied("You are not authorized to delete this order.")
@@ -471,6 +460,12 @@ class OrderDestroyView(generics.DestroyAPIView):
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Give back the stock the order still holds before its ledger rows go
+            release_stock(instance)
+            instance.delete()
+
 # view to send a message
 class SendMessageAPIView(APIView):
     def post(self, request):
@@ -626,6 +621,7 @@ class Payment(APIView):
                         # Check for success or failure
                         if response.get('status') == 'success' and 'data' in response and response['data'] and 'checkout_url' in response['data']:
                             print("Payment initialization successful!")
+                            record_payment(tx_ref, request.user, product_id, payment_data['amount'])
                             
                             # Return the successful response
                             data = {
@@ -742,7 +738,9 @@ class PaymentVerify(APIView):
                     )
                 
                 # Check if it's a successful response based on Chapa's format
-                if isinstance(verification_response, dict) and verification_response.get('status') == 'success':
+                succeeded = isinstance(verification_response, dict) and verification_response.get('status') == 'success'
+                mark_payment(tx_ref, succeeded)
+                if succeeded:
                     return Response(verification_response, status=status.HTTP_200_OK)
                 else:
                     # Format a proper error response
@@ -765,6 +763,38 @@ class PaymentVerify(APIView):
             print(traceback.format_exc())
             return Response({"status": "error", "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Chapa calls this after a payment with the reference and its status
+class PaymentCallbackView(APIView):
+    def get(self, request):
+        return self.handle(request.query_params)
+
+    def post(self, request):
+        return self.handle(request.data)
+
+    def handle(self, params):
+        tx_ref = params.get('trx_ref') or params.get('tx_ref')
+        if not tx_ref:
+            return Response({"error": "tx_ref parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        payment = find_payment(tx_ref)
+        if not payment:
+            return Response({"error": "Unknown transaction reference"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            # The callback is unauthenticated, confirm the result with Chapa
+            verification_response = chapa.verify(tx_ref)
+        except Exception as e:
+            logger.error(f"Payment callback verification failed for {tx_ref}: {str(e)}")
+            return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+
+        succeeded = isinstance(verification_response, dict) and verification_response.get('status') == 'success'
+        mark_payment(tx_ref, succeeded)
+        return Response({
+            "tx_ref": tx_ref,
+            "status": PaymentTransaction.SUCCESS if succeeded else PaymentTransaction.FAILED,
+            "order_id": payment.order_id,
+        }, status=status.HTTP_200_OK)
+
 # view to update a message
 class MessageUpdateView(generics.UpdateAPIView):
     queryset = Message.objects.all()
@@ -864,36 +894,12 @@ class RatingSendAPIView(APIView):
             # back to SHIPPED before the rating was submitted.
             if order is not None:
                 try:
-                    from .models import Order as OrderModel
-
-                    current_status = (order.status or '').upper()
-
-                    # Values that mean the order is still in transit but ready
-                    # to be finalized once the buyer confirms
-                    promotable_statuses = {
-                        getattr(OrderModel, 'DRIVER_DELIVERED', 'Driver_Delivered').upper(),
-                        getattr(OrderModel, 'SHIPPED', 'Shipped').upper(),
-                        'DRIVER_DELIVERED',
-                        'SHIPPED',
-                    }
-
-                    # Final delivered value from the model (fallback to literal)
-                    final_delivered = getattr(OrderModel, 'DELIVERED', 'Delivered')
-
-                    if current_status in promotable_statuses and current_status != final_delivered.upper():
-                        old_status = order.status
-
-                        # Promote to final delivered state
-                        order.status = final_delivered
-                        order.save(update_fields=['status'])
-
-                        # Create delivered notifications for buyer, seller, and driver
-                        try:
-                            from .notification_views import NotificationService
-                            NotificationService.create_order_notification(order.id, order.status)
-                        except Exception as notify_error:
-                            print(f"Error creating delivered notifications after rating: {notify_error}")
+                    old_status = order.status
 
+                    # Promote to final delivered state, only from the states
+                    # meaning the order is in transit but ready to be finalized
+                    # Delivered notifications follow from the order event
+                    if transition(order, Order.DELIVERED, from_statuses=[Order.SHIPPED, Order.DRIVER_DELIVERED]):
                         print(f"Order {order.id} status promoted from {old_status} to {order.status} after rating")
 
                 except Exception as order_update_error:
@@ -1063,57 +1069,39 @@ class SelectDriverView(APIView):
                 transaction_reference = f"GEN-{datetime.now().strftime('%Y%m%d%H%M%S')}-{request.user.id}"
                 print(f"Generated reference number: {transaction_reference}")
                 
-            # Create or update an order
+            # Create or update the order paid for with this reference
             try:
-                if product_id:
-                    try:
-                        product = Product.objects.get(pk=product_id)
-                        
-                        # Check for existing orders with this product for this buyer
-                        order = None
-                        existing_orders = Order.objects.filter(buyer=buyer_profile)
-                        
-                        for existing_order in existing_orders:
-                            if product in existing_order.product.all():
-                                order = existing_order
-                                break
-                        
-                        # If no existing order, create one
-                        if not order:
-                            order = Order.objects.create(
-                                buyer=buyer_profile,
-                                driver=driver_profile,
-                                quantity=f"1 [TX:{transaction_reference}]",  # Store tx ref in quantity field
-                                status='pending'
-                            )
+                payment = find_payment(transaction_reference)
+                # A payment started by another buyer is theirs even before it has an order
+                if payment and (
+                    (payment.buyer_id is not None and payment.buyer_id != buyer_profile.pk)
+                    or (payment.order and payment.order.buyer_id != buyer_profile.pk)
+                ):
+                    return Response({'error': 'Transaction reference belongs to another buyer'}, status=status.HTTP_409_CONFLICT)
+
+                order = payment.order if payment else None
+                if order:
+                    order.driver = driver_profile
+                    order.save(update_fields=['driver'])
+                else:
+                    product = payment.product if payment and payment.product else None
+                    if product is None and str(product_id or '').isdigit():
+                        product = Product.objects.filter(pk=product_id).first()
+                        if not product:
+                            print(f"Product {product_id} not found")
+
+                    with transaction.atomic():
+                        order = Order.objects.create(
+                            buyer=buyer_profile,
+                            driver=driver_profile,
+                            quantity="1",
+                            quantity_value=1,
+                            status=Order.PENDING
+                        )
+                        if product:
                             order.product.add(product)
-                        else:
-                            # Update existing order
-                            order.driver = driver_profile
-                            order.quantity = f"1 [TX:{transaction_reference}]"  # Update with tx ref
-                            order.save()
-                        
-                        return Response({
-                            'success': True,
-                            'message': f'Driver {driver.username} assigned successfully',
-                            'order_id': order.id,
-                            'driver_id': driver.id,
-                            'driver_name': driver.username,
-                            'transaction_reference': transaction_reference
-                        }, status=status.HTTP_200_OK)
-                        
-                    except Product.DoesNotExist:
-                        print(f"Product {product_id} not found")
-                        # Continue to fallback
-                
-                # Fallback - create generic order without product
-                order = Order.objects.create(
-                    buyer=buyer_profile,
-                    driver=driver_profile,
-                    quantity=f"1 [TX:{transaction_reference}]",  # Store tx ref in quantity field
-                    status='pending'
-                )
-                
+                        link_payment(transaction_reference, order, product)
+
                 return Response({
                     'success': True,
                     'message': f'Driver {driver.username} assigned successfully',
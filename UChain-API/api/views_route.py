@@ -4,6 +4,10 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from .models import DeliveryRoute, Order, CustomUser
 from .serializers import DeliveryRouteSerializer
+from .renderers import CoordinateRenderersMixin
+from .route_eta import get_order_eta, remember_route
+from .geofence import remember_geofence
+from .order_status import transition
 import logging
 
 logger = logging.getLogger(__name__)
@@ -81,6 +85,8 @@ class CreateRouteView(APIView):
                 )
             
             route.save()
+            remember_route(route)
+            remember_geofence(route)
             
             # Return serialized data
             serializer = DeliveryRouteSerializer(route)
@@ -94,9 +100,12 @@ class CreateRouteView(APIView):
             )
 
 
-class GetRouteView(APIView):
+class GetRouteView(CoordinateRenderersMixin, APIView):
     """
     API view to get the route for an order
+
+    Besides JSON the route geometry can be requested as an encoded polyline
+    or packed int32 pairs, see api/renderers.py.
     """
     permission_classes = [IsAuthenticated]
     
@@ -146,6 +155,44 @@ class GetRouteView(APIView):
             )
 
 
+class GetOrderETAView(APIView):
+    """
+    API view to get the live ETA of an order, computed by snapping its latest
+    tracking position onto the stored route (see api/route_eta.py)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, order_id):
+        try:
+            eta, missing = get_order_eta(order_id)
+
+            if missing == 'route':
+                # Tell a missing order apart from an order without a route
+                if not Order.objects.filter(id=order_id).exists():
+                    return Response(
+                        {"error": "Order not found"},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                return Response(
+                    {"error": "No route found for this order"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            if missing == 'location':
+                return Response(
+                    {"error": "No tracking information available yet"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            return Response({"order_id": order_id, **eta})
+
+        except Exception as e:
+            logger.error(f"Error computing ETA: {str(e)}")
+            return Response(
+                {"error": f"An error occurred: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 class SaveRouteView(APIView):
     """
     API view to save a route from the tracking component
@@ -202,10 +249,11 @@ class SaveRouteView(APIView):
                     }
                 )
                 
-                # Update order status to on_route
-                if order.status != 'ON_ROUTE':
-                    order.status = 'ON_ROUTE'
-                    order.save()
+                remember_route(route)
+                remember_geofence(route)
+                
+                # A saved route means the order is on its way
+                transition(order, Order.SHIPPED)
                 
                 # Return serialized data
                 serializer = DeliveryRouteSerializer(route)
@@ -0,0 +1,92 @@
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
+from .models import SellerSalesDay
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default range of the summary when no start date is given
+DEFAULT_RANGE_DAYS = 30
+
+GROUPINGS = {
+    'day': ['day'],
+    'product': ['product_id', 'product__name'],
+    'day_product': ['day', 'product_id', 'product__name'],
+}
+
+
+def _money(value):
+    return f"{value or 0:.2f}"
+
+
+def _parse_day(value, default):
+    if not value:
+        return default
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+class SellerSalesSummaryView(APIView):
+    """
+    Revenue, units sold and delivered orders of the authenticated seller
+    between ?start= and ?end= (inclusive, YYYY-MM-DD), grouped by
+    ?group_by=day|product|day_product. Read from the daily rollups, so the
+    cost depends on the days and products in the range, not on the number
+    of orders. An order with several products counts once per product.
+    Staff may pass ?seller_id=.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            user = request.user
+            if user.is_staff and str(request.query_params.get('seller_id', '')).isdigit():
+                seller_id = int(request.query_params['seller_id'])
+            elif user.is_seller and hasattr(user, 'sellerprofile'):
+                seller_id = user.sellerprofile.pk
+            else:
+                return Response({"error": "Only sellers have sales"}, status=status.HTTP_403_FORBIDDEN)
+
+            end = _parse_day(request.query_params.get('end'), timezone.localdate())
+            start = _parse_day(request.query_params.get('start'), end and end - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+            if start is None or end is None or start > end:
+                return Response(
+                    {"error": "start and end must be dates (YYYY-MM-DD) with start <= end"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            group_by = request.query_params.get('group_by', 'day')
+            if group_by not in GROUPINGS:
+                return Response(
+                    {"error": f"group_by must be one of {', '.join(GROUPINGS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            days = SellerSalesDay.objects.filter(seller_id=seller_id, day__range=(start, end))
+            sums = {'revenue': Sum('revenue'), 'units': Sum('units'), 'orders': Sum('orders')}
+            totals = days.aggregate(**sums)
+            rows = days.values(*GROUPINGS[group_by]).annotate(**sums).order_by(*GROUPINGS[group_by])
+
+            return Response({
+                "seller_id": seller_id,
+                "start": start,
+                "end": end,
+                "group_by": group_by,
+                "totals": {
+                    "revenue": _money(totals['revenue']),
+                    "units": totals['units'] or 0,
+                    "orders": totals['orders'] or 0,
+                },
+                "rows": [dict(row, revenue=_money(row['revenue'])) for row in rows],
+            })
+        except Exception as e:
+            logger.error(f"Error computing sales summary: {str(e)}")
+            return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,198 @@
+"""
+Streaming endpoints served as Server-Sent Events.
+
+These are plain async Django views rather than DRF views so that an open
+stream holds no worker thread. They must be served through the ASGI
+application in uchain/asgi.py; under WSGI a stream never completes.
+"""
+import asyncio
+import json
+from contextlib import AsyncExitStack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authtoken.models import Token
+from .broadcasts import parse_broadcast_id
+from .models import Order
+from .notification_feed import FEED_LIMIT, feed_channels, notifications_after, parse_cursor
+from .pubsub import get_broker, tracking_channel
+from .tracking_cache import get_last_location
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def authenticate_token(request):
+    """
+    Resolve the DRF auth token from the Authorization header, or from the
+    `token` query parameter since EventSource cannot set request headers.
+    """
+    key = None
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Token '):
+        key = header[len('Token '):].strip()
+    if not key:
+        key = request.GET.get('token')
+    if not key:
+        return None
+
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def format_event(data, event=None, event_id=None):
+    """Format one Server-Sent Event frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def location_events(order_id):
+    keepalive = getattr(settings, 'STREAM_KEEPALIVE_SECONDS', 15)
+
+    # Subscribe before reading the snapshot so no ping can slip in between
+    async with get_broker().subscribe(tracking_channel(order_id)) as subscription:
+        latest = await sync_to_async(get_last_location)(order_id)
+        if latest:
+            yield format_event(latest, event='location', event_id=latest.get('id'))
+
+        while True:
+            try:
+                location = await subscription.get(timeout=keepalive)
+            except asyncio.TimeoutError:
+                # Comment frame keeping proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(location, event='location', event_id=location.get('id'))
+
+
+async def order_location_stream(request, order_id):
+    """
+    Stream the latest and every new tracking position of an order.
+    Emits a `location` event with the TrackingLocationSerializer payload.
+    """
+    user = await authenticate_token(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+    if not await Order.objects.filter(id=order_id).aexists():
+        return JsonResponse({"error": "Order not found"}, status=404)
+
+    return event_stream_response(location_events(order_id))
+
+
+async def subscribe_all(stack, channels):
+    broker = get_broker()
+    return [await stack.enter_async_context(broker.subscribe(channel)) for channel in channels]
+
+
+async def wait_any(subscriptions, timeout):
+    """Wait for a message on any of the subscriptions; False on timeout"""
+    waiters = [asyncio.ensure_future(subscription.get()) for subscription in subscriptions]
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+    return bool(done)
+
+
+def _request_cursor(request, user):
+    """The cursor of an SSE Last-Event-ID ("<since_id>.<since_broadcast_id>") or of the query"""
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.count('.') == 1:
+        return parse_cursor(user, *last_event_id.split('.'))
+    return parse_cursor(user, request.GET.get('since_id'), request.GET.get('since_broadcast_id'))
+
+
+async def notification_poll(request):
+    """
+    Long-poll for notifications newer than ?since_id= (personal) and
+    ?since_broadcast_id=. Answers at once when there are some, otherwise
+    waits up to ?timeout= seconds for a NotificationService write or a
+    broadcast to wake it, holding no database query meanwhile. Returns the
+    notifications, oldest first, and the cursor to pass next time.
+    """
+    user = await authenticate_token(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+    default_timeout = getattr(settings, 'NOTIFICATION_POLL_TIMEOUT_SECONDS', 25)
+    try:
+        timeout = float(request.GET.get('timeout', default_timeout))
+    except ValueError:
+        return JsonResponse({"error": "timeout must be a number of seconds"}, status=400)
+    timeout = min(max(timeout, 0), getattr(settings, 'NOTIFICATION_POLL_MAX_SECONDS', 60))
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    async with AsyncExitStack() as stack:
+        # Subscribe before the first read so no notification can slip in between
+        subscriptions = await subscribe_all(stack, feed_channels(user))
+        try:
+            cursor = await sync_to_async(_request_cursor)(request, user)
+        except ValueError:
+            return JsonResponse({"error": "since_id and since_broadcast_id must be ids"}, status=400)
+
+        items, cursor = await sync_to_async(notifications_after)(user, *cursor)
+        while not items and await wait_any(subscriptions, deadline - loop.time()):
+            items, cursor = await sync_to_async(notifications_after)(user, *cursor)
+
+    return JsonResponse({"notifications": items, "since_id": cursor[0], "since_broadcast_id": cursor[1]})
+
+
+async def notification_events(user, cursor):
+    keepalive = getattr(settings, 'STREAM_KEEPALIVE_SECONDS', 15)
+
+    async with AsyncExitStack() as stack:
+        subscriptions = await subscribe_all(stack, feed_channels(user))
+        while True:
+            items, next_cursor = await sync_to_async(notifications_after)(user, *cursor)
+            since_id, since_broadcast_id = cursor
+            for item in items:
+                if item['broadcast']:
+                    since_broadcast_id = parse_broadcast_id(item['id'])
+                else:
+                    since_id = item['id']
+                yield format_event(item, event='notification', event_id=f"{since_id}.{since_broadcast_id}")
+            cursor = next_cursor
+
+            # A full page means there may be more waiting already
+            if len(items) < FEED_LIMIT and not await wait_any(subscriptions, keepalive):
+                # Comment frame keeping proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+
+async def notification_stream(request):
+    """
+    Stream new notifications as `notification` events carrying the
+    NotificationSerializer payload. Starts after ?since_id= and
+    ?since_broadcast_id= like the long-poll, or after the Last-Event-ID
+    the browser sends when it reconnects.
+    """
+    user = await authenticate_token(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+    try:
+        cursor = await sync_to_async(_request_cursor)(request, user)
+    except ValueError:
+        return JsonResponse({"error": "since_id and since_broadcast_id must be ids"}, status=400)
+
+    return event_stream_response(notification_events(user, cursor))
+
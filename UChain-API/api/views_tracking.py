@@ -1,17 +1,89 @@
 from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from .models import TrackingLocation, Order, CustomUser
 from .serializers import TrackingLocationSerializer, TrackingLocationDetailSerializer
-from .notification_views import NotificationService
+from .pubsub import publish_on_commit, tracking_channel
+from .tracking_cache import get_cached_location, get_cached_locations, get_last_location, remember_location
+from .geo import simplify_polyline
+from .tracking_archive import archived_locations
+from .renderers import CoordinateRenderersMixin
+from .order_status import normalize_status, transition
+from .geofence import contains, get_geofence, get_geofences
+from .deadband import anchor_timestamp, is_redundant, coalesce, count_ingest, ingest_counters
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from django.db import transaction
+from decimal import Decimal, InvalidOperation
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on the number of pings accepted in one batch request
+MAX_TRACKING_BATCH_SIZE = 500
+
+
+def parse_coordinate(value, limit):
+    """Return value as a Decimal within [-limit, limit], None if it is not one"""
+    if isinstance(value, bool):
+        return None
+    try:
+        coordinate = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    if not coordinate.is_finite() or abs(coordinate) > limit:
+        return None
+    return coordinate
+
+
+def can_update_tracking(order, user):
+    """Return True if the user may post tracking data for the order"""
+    return order.driver_id == user.id or user.is_driver
+
+
+def arrival_status(order, user, geofence, latitude, longitude):
+    """
+    Return 'delivered' if a status-less ping places the order's assigned
+    driver within the arrival geofence of its route while the order is
+    accepted or on its way, None otherwise
+    """
+    if geofence is None or order.driver_id != user.id:
+        return None
+    # Drivers of other orders may ping too, see can_update_tracking, and an
+    # order nobody has accepted yet cannot have arrived
+    if normalize_status(order.status) not in {Order.ACCEPTED, Order.SHIPPED}:
+        return None
+    return 'delivered' if contains(geofence, latitude, longitude) else None
+
+
+def apply_tracking_status(order, status_update):
+    """
+    Mirror a tracking status onto the order. The state machine never
+    downgrades a delivered order back to an in-transit status, since periodic
+    location pings may continue to send 'on_route' even after the buyer has
+    confirmed delivery. Returns True if the order status changed.
+    """
+    normalized_status = status_update.lower()
+
+    if normalized_status == 'delivered':
+        # Use DRIVER_DELIVERED for collaborative confirmation flow
+        target = Order.DRIVER_DELIVERED
+    elif normalized_status in ('picked_up', 'on_route'):
+        target = Order.SHIPPED
+    else:
+        return False
+    return transition(order, target)
+
 class UpdateTrackingLocationView(APIView):
     """
     API view to update tracking location for an order
+
+    Redundant pings are coalesced into the previous point (200 with that
+    point) rather than stored (201), see api/deadband.py. A ping within the
+    arrival geofence of the order's route moves the order to
+    DRIVER_DELIVERED, see api/geofence.py.
     """
     permission_classes = [IsAuthenticated]
     
@@ -40,12 +112,25 @@ class UpdateTrackingLocationView(APIView):
                 )
             
             # Validate the user is the driver for this order
-            if str(order.driver) != str(request.user.id) and not request.user.is_driver:
+            if not can_update_tracking(order, request.user):
                 return Response(
                     {"error": "Only the assigned driver can update tracking location"},
                     status=status.HTTP_403_FORBIDDEN
                 )
             
+            # Reaching the route's end point marks the order delivered by the driver
+            if not status_update:
+                status_update = arrival_status(order, request.user, get_geofence(order.id), latitude, longitude)
+            
+            # A status-less ping that carries no new position only extends the
+            # last-seen time of the previous point instead of adding a row
+            if not status_update:
+                now = timezone.now()
+                previous = get_last_location(order.id)
+                if is_redundant(previous, latitude, longitude, now):
+                    count_ingest(suppressed=1)
+                    return Response(coalesce(order.id, previous, now), status=status.HTTP_200_OK)
+            
             # Create tracking location
             tracking_location = TrackingLocation(
                 order=order,
@@ -54,38 +139,18 @@ class UpdateTrackingLocationView(APIView):
                 longitude=longitude
             )
             
-            # Update status if provided
+            # Update status if provided, also mirroring it onto the order
             if status_update:
                 tracking_location.status = status_update
-
-                # Also update the order status if needed, but never downgrade a
-                # fully delivered order back to an in-transit status. Periodic
-                # location pings may continue to send 'on_route' even after the
-                # buyer has confirmed delivery, so we guard against that here.
-                normalized_status = status_update.lower()
-
-                # Get canonical status values from the Order model
-                final_delivered = getattr(Order, "DELIVERED", "Delivered")
-                driver_delivered = getattr(Order, "DRIVER_DELIVERED", "Driver_Delivered")
-                shipped_status = getattr(Order, "SHIPPED", "Shipped")
-
-                current_status = (order.status or "").upper()
-
-                # Only update when the order is not already in a delivered state
-                if current_status not in {final_delivered.upper(), driver_delivered.upper()}:
-                    if normalized_status == 'delivered':
-                        # Use DRIVER_DELIVERED for collaborative confirmation flow
-                        order.status = driver_delivered
-                        order.save()
-                    elif normalized_status in ('picked_up', 'on_route'):
-                        order.status = shipped_status
-                        order.save()
+                apply_tracking_status(order, status_update)
             
             tracking_location.save()
+            count_ingest(stored=1)
             
-            # Return serialized data
-            serializer = TrackingLocationSerializer(tracking_location)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Cache as the latest position, push it to live viewers and return it
+            data = remember_location(tracking_location)
+            publish_on_commit(tracking_channel(order.id), data)
+            return Response(data, status=status.HTTP_201_CREATED)
         
         except Exception as e:
             logger.error(f"Error updating tracking location: {str(e)}")
@@ -95,6 +160,221 @@ class UpdateTrackingLocationView(APIView):
             )
 
 
+class BatchUpdateTrackingLocationView(APIView):
+    """
+    API view to ingest a batch of tracking pings, possibly across several
+    orders. Ownership is checked once per order, all pings are written with a
+    single bulk insert and the order status is updated once per order from
+    its latest ping carrying a status. Redundant pings are coalesced as in
+    UpdateTrackingLocationView.
+
+    Expected payload:
+        {"pings": [{"orderId": 1, "latitude": 9.03, "longitude": 38.74,
+                    "status": "on_route", "timestamp": "2025-04-03T10:00:00Z"}]}
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            pings = request.data.get('pings')
+
+            if not isinstance(pings, list) or not pings:
+                return Response(
+                    {"error": "A non-empty list of pings is required"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            if len(pings) > MAX_TRACKING_BATCH_SIZE:
+                return Response(
+                    {"error": f"At most {MAX_TRACKING_BATCH_SIZE} pings can be sent in one batch"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Validate every ping before touching the database
+            parsed_pings = []
+            now = timezone.now()
+            for index, ping in enumerate(pings):
+                if not isinstance(ping, dict):
+                    return Response(
+                        {"error": f"Ping {index} must be an object"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                order_id = ping.get('orderId')
+                latitude = ping.get('latitude')
+                longitude = ping.get('longitude')
+                # 0 is a valid coordinate, only missing values are rejected
+                if order_id is None or latitude is None or longitude is None:
+                    return Response(
+                        {"error": f"Ping {index}: order ID, latitude and longitude are required"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                latitude = parse_coordinate(latitude, 90)
+                longitude = parse_coordinate(longitude, 180)
+                if latitude is None or longitude is None:
+                    return Response(
+                        {"error": f"Ping {index}: latitude must be a number within ±90 and longitude within ±180"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                try:
+                    order_id = int(order_id)
+                except (TypeError, ValueError):
+                    return Response(
+                        {"error": f"Ping {index}: invalid order ID"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                # Client timestamps are optional, default to the server time
+                timestamp = now
+                raw_timestamp = ping.get('timestamp')
+                if raw_timestamp:
+                    timestamp = parse_datetime(str(raw_timestamp))
+                    if timestamp is None:
+                        return Response(
+                            {"error": f"Ping {index}: invalid timestamp"},
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    if timezone.is_naive(timestamp):
+                        timestamp = timezone.make_aware(timestamp)
+
+                parsed_pings.append({
+                    'order_id': order_id,
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    'status': ping.get('status') or None,
+                    'timestamp': timestamp,
+                })
+
+            # Fetch every referenced order in one query
+            order_ids = {ping['order_id'] for ping in parsed_pings}
+            orders = Order.objects.in_bulk(order_ids)
+
+            missing = sorted(order_ids - set(orders))
+            if missing:
+                return Response(
+                    {"error": "Order not found", "orders": missing},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            # Validate ownership once per order
+            forbidden = sorted(
+                order.id for order in orders.values()
+                if not can_update_tracking(order, request.user)
+            )
+            if forbidden:
+                return Response(
+                    {"error": "Only the assigned driver can update tracking location", "orders": forbidden},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+
+            tracking_locations = []
+            latest_status = {}
+            latest_location = {}
+            # Stored points whose last_seen moves forward, per order
+            coalesced_stored = {}
+            coalesced = 0
+
+            pings_by_order = {}
+            for ping in parsed_pings:
+                pings_by_order.setdefault(ping['order_id'], []).append(ping)
+
+            # The dead-band compares each ping with the last point kept, either
+            # already stored or earlier in this batch. Stored points come from
+            # the cache only, so a batch stays a constant number of queries.
+            cached_locations = get_cached_locations(pings_by_order)
+            geofences = get_geofences(pings_by_order)
+
+            for order_id, order_pings in pings_by_order.items():
+                order_pings.sort(key=lambda ping: ping['timestamp'])
+                anchor = cached_locations.get(order_id)
+                anchor_location = None
+
+                for ping in order_pings:
+                    if not ping['status']:
+                        ping['status'] = arrival_status(
+                            orders[order_id], request.user, geofences.get(order_id), ping['latitude'], ping['longitude']
+                        )
+                        if ping['status']:
+                            # Only the first ping inside the geofence carries the arrival
+                            geofences.pop(order_id)
+
+                    if not ping['status'] and is_redundant(anchor, ping['latitude'], ping['longitude'], ping['timestamp']):
+                        coalesced += 1
+                        if anchor_location is not None:
+                            anchor_location.last_seen = ping['timestamp']
+                        else:
+                            coalesced_stored[order_id] = (anchor, ping['timestamp'])
+                        continue
+
+                    tracking_location = TrackingLocation(
+                        order=orders[order_id],
+                        driver=request.user,
+                        latitude=ping['latitude'],
+                        longitude=ping['longitude'],
+                        timestamp=ping['timestamp'],
+                        status=ping['status'],
+                    )
+                    tracking_locations.append(tracking_location)
+
+                    # Pings are sorted, so each stored one is the order's newest so far
+                    latest_location[order_id] = tracking_location
+                    # Late pings are kept as history but do not move the anchor
+                    if anchor is None or ping['timestamp'] >= anchor_timestamp(anchor):
+                        anchor = {
+                            'latitude': ping['latitude'],
+                            'longitude': ping['longitude'],
+                            'timestamp': ping['timestamp'],
+                        }
+                        anchor_location = tracking_location
+
+                    # Remember only the latest ping carrying a status per order
+                    if ping['status']:
+                        latest_status[order_id] = ping
+
+            with transaction.atomic():
+                TrackingLocation.objects.bulk_create(tracking_locations)
+
+                updated_orders = [
+                    order_id for order_id, ping in latest_status.items()
+                    if apply_tracking_status(orders[order_id], ping['status'])
+                ]
+
+            for order_id, (previous, last_seen) in coalesced_stored.items():
+                coalesce(order_id, previous, last_seen)
+            count_ingest(stored=len(tracking_locations), suppressed=coalesced)
+
+            # The cache and live viewers only need the newest position of each order
+            for order_id, tracking_location in latest_location.items():
+                publish_on_commit(tracking_channel(order_id), remember_location(tracking_location))
+
+            return Response({
+                "created": len(tracking_locations),
+                "coalesced": coalesced,
+                "orders": sorted(order_ids),
+                "status_updated": sorted(updated_orders),
+            }, status=status.HTTP_201_CREATED)
+
+        except Exception as e:
+            logger.error(f"Error ingesting tracking batch: {str(e)}")
+            return Response(
+                {"error": f"An error occurred: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class TrackingIngestStatsView(APIView):
+    """
+    API view reporting how many pings were stored and how many were
+    suppressed by the dead-band filter
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(ingest_counters(), status=status.HTTP_200_OK)
+
+
 class GetOrderLocationView(APIView):
     """
     API view to get the latest location for an order
@@ -103,16 +383,6 @@ class GetOrderLocationView(APIView):
     
     def get(self, request, order_id):
         try:
-            # Get the order
-            try:
-                # Convert string order_id to integer
-                order = Order.objects.get(id=int(order_id))
-            except Order.DoesNotExist:
-                return Response(
-                    {"error": "Order not found"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
             # Temporarily allow all authenticated users to view tracking info
             # This is a simplified authorization check to get things working
             is_authorized = True  # Allow all users to view tracking for now
@@ -123,10 +393,24 @@ class GetOrderLocationView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Get the latest tracking location
-            latest_location = TrackingLocation.objects.filter(
-                order=order
-            ).order_by('-timestamp').first()
+            # Serve the latest position straight from the cache when possible,
+            # a cached position implies the order exists
+            latest_location = get_cached_location(int(order_id))
+            if latest_location is not None:
+                return Response(latest_location)
+            
+            # Get the order
+            try:
+                # Convert string order_id to integer
+                order = Order.objects.get(id=int(order_id))
+            except Order.DoesNotExist:
+                return Response(
+                    {"error": "Order not found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            # Fall back to the database, repopulating the cache
+            latest_location = get_last_location(order.id)
             
             if not latest_location:
                 return Response(
@@ -134,9 +418,7 @@ class GetOrderLocationView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Return serialized data
-            serializer = TrackingLocationSerializer(latest_location)
-            return Response(serializer.data)
+            return Response(latest_location)
         
         except Exception as e:
             logger.error(f"Error getting order location: {str(e)}")
@@ -146,14 +428,39 @@ class GetOrderLocationView(APIView):
             )
 
 
-class GetTrackingHistoryView(APIView):
+class GetTrackingHistoryView(CoordinateRenderersMixin, APIView):
     """
     API view to get all tracking history for an order
+
+    Besides JSON the coordinates can be requested as an encoded polyline or
+    packed int32 pairs, see api/renderers.py.
+
+    Optional query parameters switch the response to an incremental envelope
+    {"results": [...], "next_cursor": <id>}:
+    - since: only return pings stored after this cursor (a previous next_cursor)
+    - tolerance: simplify the track, dropping points closer than this many
+      meters to the simplified line; pings carrying a status are always kept
     """
     permission_classes = [IsAuthenticated]
     
     def get(self, request, order_id):
         try:
+            since = request.query_params.get('since')
+            tolerance = request.query_params.get('tolerance')
+            try:
+                since = int(since) if since not in (None, '') else None
+                tolerance = float(tolerance) if tolerance not in (None, '') else None
+            except ValueError:
+                return Response(
+                    {"error": "since must be an integer cursor and tolerance a number of meters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if (since is not None and since < 0) or (tolerance is not None and tolerance < 0):
+                return Response(
+                    {"error": "since and tolerance cannot be negative"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
             # Get the order
             try:
                 print(f"GetTrackingHistoryView: Looking for order with ID {order_id}")
@@ -177,10 +484,18 @@ class GetTrackingHistoryView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Get all tracking locations
-            tracking_history = TrackingLocation.objects.filter(
+            if since is not None or tolerance is not None:
+                return Response(self.get_incremental_history(order, since, tolerance))
+            
+            # Get all tracking locations, including pings compacted into an archived track
+            tracking_history = list(TrackingLocation.objects.filter(
                 order=order
-            ).order_by('-timestamp')
+            ).order_by('-timestamp'))
+            archived = archived_locations(order.id)
+            if archived:
+                tracking_history = sorted(
+                    tracking_history + archived, key=lambda location: location.timestamp, reverse=True
+                )
             
             if not tracking_history:
                 # Return empty array instead of 404
@@ -197,6 +512,35 @@ class GetTrackingHistoryView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def get_incremental_history(self, order, since, tolerance):
+        """Pings newer than the cursor, optionally simplified, newest first"""
+        tracking_history = TrackingLocation.objects.filter(order=order)
+        if since:
+            tracking_history = tracking_history.filter(id__gt=since)
+
+        locations = list(tracking_history.order_by('timestamp', 'id'))
+        next_cursor = max((location.id for location in locations), default=since or 0)
+
+        # Archived pings predate every cursor, so they only show up in a full read
+        if not since:
+            archived = archived_locations(order.id)
+            if archived:
+                locations = sorted(archived + locations, key=lambda location: location.timestamp)
+
+        if tolerance and len(locations) > 2:
+            count = len(locations)
+            latitudes = np.fromiter((float(location.latitude) for location in locations), float, count)
+            longitudes = np.fromiter((float(location.longitude) for location in locations), float, count)
+            keep = simplify_polyline(latitudes, longitudes, tolerance)
+            keep |= np.fromiter((bool(location.status) for location in locations), bool, count)
+            locations = [location for location, kept in zip(locations, keep) if kept]
+
+        locations.reverse()
+        return {
+            "results": TrackingLocationSerializer(locations, many=True).data,
+            "next_cursor": next_cursor,
+        }
+
 
 class UpdateOrderStatusView(APIView):
     """
@@ -231,37 +575,41 @@ class UpdateOrderStatusView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Update order status
-            old_status = order.status
+            # Tracking statuses map onto order statuses; a driver marking the
+            # order delivered still awaits the buyer's confirmation
             if status_update.lower() == 'on_route':
-                # Keep the order status as SHIPPED when tracking status is on_route
-                order.status = 'SHIPPED'
+                target = Order.SHIPPED
             elif status_update.lower() == 'delivered':
-                # Use a special status when driver marks as delivered but buyer hasn't confirmed
-                order.status = 'DRIVER_DELIVERED'
+                target = Order.DRIVER_DELIVERED
             else:
-                order.status = status_update.upper()
-            order.save()
+                target = normalize_status(status_update)
+            if target is None:
+                return Response(
+                    {"error": f"Invalid status: {status_update}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            # Create notifications if status has changed
-            if old_status != order.status:
-                try:
-                    # Use notification service to create appropriate notifications
-                    NotificationService.create_order_notification(order.id, order.status)
-                    logger.info(f"Created notification for order {order.id} status change to {order.status}")
-                except Exception as e:
-                    logger.error(f"Error creating notification: {str(e)}")
+            # Illegal or lost transitions (e.g. a late 'on_route' after the
+            # buyer confirmed delivery) leave the order as it is; accepted
+            # ones notify through the order event
+            transition(order, target)
             
             # Create a tracking location entry with the new status
-            # Get the driver's last known location
-            last_location = TrackingLocation.objects.filter(
-                order=order,
-                driver=request.user
-            ).order_by('-timestamp').first()
-            
-            # If we have a last location, use those coordinates, otherwise use defaults
-            latitude = last_location.latitude if last_location else 0.0
-            longitude = last_location.longitude if last_location else 0.0
+            # Get the driver's last known location, from the cache when the
+            # order's latest position was reported by this driver
+            last_location = get_last_location(order.id)
+            if last_location is not None and last_location.get('driver') == request.user.id:
+                latitude = last_location['latitude']
+                longitude = last_location['longitude']
+            else:
+                last_location = TrackingLocation.objects.filter(
+                    order=order,
+                    driver=request.user
+                ).order_by('-timestamp').first()
+                
+                # If we have a last location, use those coordinates, otherwise use defaults
+                latitude = last_location.latitude if last_location else 0.0
+                longitude = last_location.longitude if last_location else 0.0
             
             # Create a new tracking entry with the status update
             tracking_location = TrackingLocation(
@@ -272,6 +620,7 @@ class UpdateOrderStatusView(APIView):
                 status=status_update.lower()
             )
             tracking_location.save()
+            publish_on_commit(tracking_channel(order.id), remember_location(tracking_location))
             
             return Response({"message": f"Order status updated to {status_update}"})
         
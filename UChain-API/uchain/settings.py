@@ -154,6 +154,43 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Local memory by default (per process); use a shared backend such as Redis or
+# Memcached in production so every worker sees the same tracking positions.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.environ.get('CACHE_LOCATION', 'uchain'),
+    }
+}
+
+# Seconds a cached "last known position" of an order is kept
+TRACKING_CACHE_TIMEOUT = int(os.environ.get('TRACKING_CACHE_TIMEOUT', str(60 * 60 * 24)))
+
+# Status-less pings closer than this (in seconds or meters) to the order's
+# previous point are coalesced into it instead of being stored
+TRACKING_DEADBAND_METERS = float(os.environ.get('TRACKING_DEADBAND_METERS', '10'))
+
+# Live ETA: routes whose projected segments are kept per worker, and the speed
+# assumed for routes saved without an estimated time
+ROUTE_SEGMENT_CACHE_SIZE = int(os.environ.get('ROUTE_SEGMENT_CACHE_SIZE', '256'))
+ROUTE_DEFAULT_SPEED_KMH = float(os.environ.get('ROUTE_DEFAULT_SPEED_KMH', '40'))
+
+# A driver's ping within this distance of the route end point marks the order
+# as delivered by the driver
+GEOFENCE_RADIUS_METERS = float(os.environ.get('GEOFENCE_RADIUS_METERS', '100'))
+
+
+# Most line items accepted by one cart checkout
+CHECKOUT_MAX_ITEMS = int(os.environ.get('CHECKOUT_MAX_ITEMS', '100'))
+
+# Order event outbox (api/outbox.py): events claimed per batch, and seconds a
+# worker may hold claimed events before another worker can take them over
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', '60'))
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
@@ -186,4 +223,25 @@ REST_FRAMEWORK = {
 CHAPA_SECRET_KEY = os.environ.get('CHAPA_SECRET_KEY', 'CHASECK_TEST-eTExMhRkuBgrH6SMnNgZnQWvdeIif5lf')
 CHAPA_PUBLIC_KEY = os.environ.get('CHAPA_PUBLIC_KEY', 'CHAPUBK_TEST-aVejExSBQLcKVflvyjbZSlk0fRzcxELh')
 CHAPA_API_VERSION = os.environ.get('CHAPA_API_VERSION', 'v1')
-CHAPA_API_URL = os.environ.get('CHAPA_API_URL', 'https://api.chapa.co')
\ No newline at end of file
+CHAPA_API_URL = os.environ.get('CHAPA_API_URL', 'https://api.chapa.co')
+
+# Live update streams (Server-Sent Events, served through uchain.asgi)
+# The in-process broker only reaches clients of the same worker; point this at
+# a broker-backed class with the same interface when running several workers.
+PUBSUB_BROKER = os.environ.get('PUBSUB_BROKER', 'api.pubsub.InProcessBroker')
+STREAM_KEEPALIVE_SECONDS = int(os.environ.get('STREAM_KEEPALIVE_SECONDS', '15'))
+# Longest wait of a notification long-poll, by default and at most
+NOTIFICATION_POLL_TIMEOUT_SECONDS = int(os.environ.get('NOTIFICATION_POLL_TIMEOUT_SECONDS', '25'))
+NOTIFICATION_POLL_MAX_SECONDS = int(os.environ.get('NOTIFICATION_POLL_MAX_SECONDS', '60'))
+
+# Days notifications are kept before purge_notifications deletes them, by
+# notification type; 'default' covers the other types
+NOTIFICATION_RETENTION_DAYS = {
+    'order_placed': 90,
+    'order_accepted': 90,
+    'driver_assigned': 90,
+    'order_shipped': 30,
+    'order_delivered': 180,
+    'payment_received': 365,
+    'default': int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '180')),
+}